@@ -23,6 +23,7 @@ EXTRAS["test"] = [
     "isort==4.3.4",
     "pylint==1.9.2",
     "pytest==3.6.3",
+    "pytest-benchmark==3.1.1",
     "pytest-cov==2.5.1",
     "pytest-flake8==1.0.1",
     "pytest-pylint==0.11.0",
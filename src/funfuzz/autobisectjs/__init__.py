@@ -10,3 +10,5 @@ from __future__ import absolute_import
 
 from . import autobisectjs
 from . import known_broken_earliest_working
+from . import label_cache
+from . import revision_graph
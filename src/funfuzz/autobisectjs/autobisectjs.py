@@ -9,9 +9,9 @@
 
 from __future__ import absolute_import, unicode_literals  # isort:skip
 
+import math
 from optparse import OptionParser  # pylint: disable=deprecated-module
 import os
-import re
 import shutil
 import sys
 import tempfile
@@ -21,10 +21,13 @@ from backports.print_function import print_
 from lithium.interestingness.utils import rel_or_abs_import
 
 from . import known_broken_earliest_working as kbew
+from . import label_cache
+from . import revision_graph
 from ..js import build_options
 from ..js import compile_shell
 from ..js import inspect_shell
 from ..util import hg_helpers
+from ..util import result_cache
 from ..util import s3cache
 from ..util import sm_compile_helpers
 from ..util import subprocesses as sps
@@ -59,6 +62,10 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
         build_options="",
         useTreeherderBinaries=False,
         nameOfTreeherderBranch="mozilla-inbound",
+        speculativeBuilds=0,
+        maxInfoLoss=0.2,
+        ignoreCachedLabels=False,
+        ignoreLocalKnownBroken=False,
     )
 
     # Specify how the shell will be built.
@@ -104,7 +111,33 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
     # (You might want to add these to kbew.knownBrokenRanges in known_broken_earliest_working.)
     parser.add_option("-l", "--compilationFailedLabel", dest="compilationFailedLabel",
                       help="Specify how to treat revisions that fail to compile. "
-                           '(bad, good, or skip) Defaults to "%default"')
+                           "(bad, good, or skip) With skip, both ends of the compilation bustage are bisected to, "
+                           'recorded in ~/known-broken-ranges and skipped. Defaults to "%default"')
+
+    parser.add_option("-j", "--speculativeBuilds", dest="speculativeBuilds",
+                      type="int",
+                      help="Number of revisions likely to be tested next to compile in the background, each in its "
+                           "own share of the repository, while the current revision is compiled and tested. "
+                           "Each background compilation gets an equal share of the make jobs. "
+                           'Defaults to "%default"')
+
+    parser.add_option("-c", "--maxInfoLoss", dest="maxInfoLoss",
+                      type="float",
+                      help="Test a revision whose shell is already in the local or S3 shell cache instead of the "
+                           "one bisection suggests, if its result tells at most this many bits less about where "
+                           "the regression is (1 bit being what splitting the range in halves tells). "
+                           '0 always tests the suggested revision. Defaults to "%default"')
+
+    parser.add_option("--ignoreCachedLabels", dest="ignoreCachedLabels",
+                      action="store_true",
+                      help="Test every revision again instead of reusing the labels of earlier bisections of the "
+                           "same testcase with the same build options and tests. New labels are still remembered.")
+
+    parser.add_option("--ignoreLocalKnownBroken", dest="ignoreLocalKnownBroken",
+                      action="store_true",
+                      help="Do not skip the compilation bustage ranges recorded in ~/known-broken-ranges by earlier "
+                           "bisections, only the ones listed in known_broken_earliest_working. "
+                           "New ranges are still recorded.")
 
     parser.add_option("-T", "--useTreeherderBinaries",
                       dest="useTreeherderBinaries",
@@ -121,7 +154,9 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
         sys.exit(0)
 
     options.build_options = build_options.parse_shell_opts(options.build_options)
-    options.skipRevs = " + ".join(kbew.known_broken_ranges(options.build_options))
+    options.graph = revision_graph.load_graph(options.build_options.repo_dir)
+    options.skipRevs = options.graph.known_broken(
+        kbew.known_broken_pairs(options.build_options, ignore_local=options.ignoreLocalKnownBroken))
 
     options.runtime_params = [x for x in options.parameters.split(" ") if x]
 
@@ -148,15 +183,16 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
         parser.error("Too many arguments.")
     else:
         options.testAndLabel = internalTestAndLabel(options)
-
-    earliestKnownQuery = kbew.earliest_known_working_rev(  # pylint: disable=invalid-name
-        options.build_options, options.runtime_params + extraFlags, options.skipRevs)
+    options.labelCacheScope = labelCacheScope(options, args)
 
     earliestKnown = ""  # pylint: disable=invalid-name
 
     if not options.useTreeherderBinaries:
-        # pylint: disable=invalid-name
-        earliestKnown = hg_helpers.get_repo_hash_and_id(options.build_options.repo_dir, repo_rev=earliestKnownQuery)[0]
+        earliestKnownRev = options.graph.first_common_descendant(  # pylint: disable=invalid-name
+            kbew.required_revs(options.build_options, options.runtime_params + extraFlags), options.skipRevs)
+        if earliestKnownRev is None:
+            raise Exception("No revision in the repository is known to work with these build options and flags.")
+        earliestKnown = options.graph.node(earliestKnownRev)  # pylint: disable=invalid-name
 
     if options.startRepo is None:
         if options.useTreeherderBinaries:
@@ -181,8 +217,8 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
     return options
 
 
-def findBlamedCset(options, repo_dir, testRev):  # pylint: disable=invalid-name,missing-docstring,too-complex
-    # pylint: disable=too-many-locals,too-many-statements
+def findBlamedCset(options, repo_dir, testRev, prebuilder=None):  # pylint: disable=invalid-name,missing-docstring
+    # pylint: disable=too-complex,too-many-branches,too-many-locals,too-many-statements
     repo_dir = str(repo_dir)
     print_("%s | Bisecting on: %s" % (time.asctime(), repo_dir), flush=True)
 
@@ -201,55 +237,51 @@ def findBlamedCset(options, repo_dir, testRev):  # pylint: disable=invalid-name,
         # Throws exit code 255 if purge extension is not enabled in .hgrc:
         subprocess.run(hgPrefix + ["purge", "--all"], check=True)
 
-    # Reset bisect ranges and set skip ranges.
-    subprocess.run(hgPrefix + ["bisect", "-r"],
-                   check=True,
-                   cwd=os.getcwdu() if sys.version_info.major == 2 else os.getcwd(),  # pylint: disable=no-member
-                   timeout=99)
-    if options.skipRevs:
-        subprocess.run(hgPrefix + ["bisect", "--skip", options.skipRevs],
-                       check=True,
-                       cwd=os.getcwdu() if sys.version_info.major == 2 else os.getcwd(),  # pylint: disable=no-member
-                       timeout=300)
+    # Bisection happens on the revision graph, known broken ranges being skipped from the start.
+    bisection = revision_graph.Bisection(options.graph, options.skipRevs)
 
     labels = {}
-    # Specify `hg bisect` ranges.
+    # Specify bisection ranges.
     if options.testInitialRevs:
         currRev = eRepo  # If testInitialRevs mode is set, compile and test the latest rev first.
     else:
         labels[sRepo] = ("good", "assumed start rev is good")
         labels[eRepo] = ("bad", "assumed end rev is bad")
-        subprocess.run(hgPrefix + ["bisect", "-U", "-g", sRepo], check=True)
-        mid_bisect_output = subprocess.run(
-            hgPrefix + ["bisect", "-U", "-b", eRepo],
-            check=True,
-            cwd=os.getcwdu() if sys.version_info.major == 2 else os.getcwd(),  # pylint: disable=no-member
-            stdout=subprocess.PIPE,
-            timeout=300).stdout.decode("utf-8", errors="replace")
-        currRev = hg_helpers.get_cset_hash_from_bisect_msg(
-            mid_bisect_output.split("\n"))
+        bisection.label(sRepo, "good")
+        bisection.label(eRepo, "bad")
+        nodes, remaining, _ = bisection.next_revs()
+        currRev = nodes[0] if remaining else None
 
     iterNum = 1
     if options.testInitialRevs:
         iterNum -= 2
 
-    skipCount = 0
     blamedRev = None
+    s3CachedRevs = compile_shell.s3_cached_shell_revs(options.build_options) if options.maxInfoLoss else set()
 
     while currRev is not None:
         startTime = time.time()
+        if options.maxInfoLoss and iterNum > 0:
+            cachedRevs = s3CachedRevs | compile_shell.local_cached_shell_revs(options.build_options) | \
+                set(cachedLabels(options))
+            untested = untestedRevs(options, labels, currRev, sRepo, eRepo)
+            cachedRev = prefer_cached_rev(untested, currRev, cachedRevs, options.maxInfoLoss)
+            if cachedRev != currRev:
+                print_("Testing rev %s instead of %s, as its shell is already cached..." % (cachedRev, currRev),
+                       end=" ", flush=True)
+                currRev = cachedRev
+        if prebuilder:
+            knownRevs = cachedLabels(options)
+            prebuilder.prebuild([rev for rev in guessNextRevs(options, labels, currRev, sRepo, eRepo)
+                                 if rev not in knownRevs])
         label = testRev(currRev)
         labels[currRev] = label
-        if label[0] == "skip":
-            skipCount += 1
-            # If we use "skip", we tell hg bisect to do a linear search to get around the skipping.
-            # If the range is large, doing a bisect to find the start and endpoints of compilation
-            # bustage would be faster. 20 total skips being roughly the time that the pair of
-            # bisections would take.
-            if skipCount > 20:
-                print_("Skipped 20 times, stopping autobisectjs.", flush=True)
-                break
         print_("%s (%s) " % (label[0], label[1]), end=" ", flush=True)
+        if label[0] == "skip" and iterNum > 0:
+            # Skipping around compilation bustage one revision at a time degrades towards a linear search, so find
+            # both ends of the bustage instead, and skip all of it.
+            print_(flush=True)
+            findBustedRange(options, bisection, labels, testRev, currRev, sRepo, eRepo)
 
         if iterNum <= 0:
             print_("Finished testing the initial boundary revisions...", end=" ", flush=True)
@@ -257,7 +289,7 @@ def findBlamedCset(options, repo_dir, testRev):  # pylint: disable=invalid-name,
             print_("Bisecting for the n-th round where n is %s and 2^n is %s ..." % (iterNum, 2**iterNum),
                    end=" ", flush=True)
         (blamedGoodOrBad, blamedRev, currRev, sRepo, eRepo) = \
-            bisectLabel(hgPrefix, options, label[0], currRev, sRepo, eRepo)
+            bisectLabel(bisection, options, label[0], currRev, sRepo, eRepo)
 
         if options.testInitialRevs:
             options.testInitialRevs = False
@@ -270,12 +302,9 @@ def findBlamedCset(options, repo_dir, testRev):  # pylint: disable=invalid-name,
         print_("This iteration took %.3f seconds to run." % oneRunTime, flush=True)
 
     if blamedRev is not None:
-        checkBlameParents(repo_dir, blamedRev, blamedGoodOrBad, labels, testRev, realStartRepo,
+        checkBlameParents(options.graph, blamedRev, blamedGoodOrBad, labels, testRev, realStartRepo,
                           realEndRepo)
 
-    sps.vdump("Resetting bisect")
-    subprocess.run(hgPrefix + ["bisect", "-U", "-r"], check=True)
-
     sps.vdump("Resetting working directory")
     subprocess.run(hgPrefix + ["update", "-C", "-r", "default"],
                    check=True,
@@ -286,6 +315,207 @@ def findBlamedCset(options, repo_dir, testRev):  # pylint: disable=invalid-name,
     print_(time.asctime(), flush=True)
 
 
+def bisection_midpoints(untested, curr_rev, count):
+    """Return the revisions to test next if bisection goes on by halving the remaining range, whichever label the
+    revision being tested gets: the middle of the untested revisions on either side of it, then the middles of their
+    halves, and so on.
+
+    Args:
+        untested (list): Hashes of the revisions left to test, in revision number order
+        curr_rev (str): Hash of the revision being tested
+        count (int): Number of revisions to return at most
+
+    Returns:
+        list: Revision hashes, the ones needed soonest first
+    """
+    index = untested.index(curr_rev) if curr_rev in untested else len(untested)
+    ranges = [untested[:index], untested[index + 1:]]
+    revs = []
+    while ranges and len(revs) < count:
+        revs_range = ranges.pop(0)
+        if revs_range:
+            middle = len(revs_range) // 2
+            revs.append(revs_range[middle])
+            ranges.extend([revs_range[:middle], revs_range[middle + 1:]])
+    return revs
+
+
+def split_info(index, count):
+    """Return how much testing a revision tells about where the regression is, depending on where the revision is
+    among the untested ones.
+
+    Args:
+        index (int): Position of the revision among the untested revisions
+        count (int): Number of untested revisions
+
+    Returns:
+        float: Number of bits, 1 if the revision splits the untested revisions in halves
+    """
+    fraction = float(index + 1) / (count + 1)
+    return -(fraction * math.log(fraction, 2) + (1 - fraction) * math.log(1 - fraction, 2))
+
+
+def prefer_cached_rev(untested, curr_rev, cached_revs, max_info_loss):
+    """Return a revision whose shell is cached, to test instead of the one bisection suggests, if its result tells
+    almost as much about where the regression is.
+
+    Args:
+        untested (list): Hashes of the revisions left to test, in revision number order
+        curr_rev (str): Hash of the revision bisection suggests
+        cached_revs (set): Hashes of the revisions whose shell is cached
+        max_info_loss (float): Number of bits the result may tell less than the result of testing curr_rev
+
+    Returns:
+        str: Hash of the cached revision whose result tells the most, or curr_rev if none is close enough
+    """
+    if curr_rev in cached_revs or curr_rev not in untested:
+        return curr_rev
+    min_info = split_info(untested.index(curr_rev), len(untested)) - max_info_loss
+    candidates = [(split_info(i, len(untested)), rev) for i, rev in enumerate(untested)
+                  if rev in cached_revs and split_info(i, len(untested)) >= min_info]
+    return max(candidates, key=lambda x: x[0])[1] if candidates else curr_rev
+
+
+def untestedRevs(options, labels, currRev, startRepo, endRepo):  # pylint: disable=invalid-name
+    # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc,missing-type-doc
+    """Return the revisions between startRepo and endRepo which are neither tested yet nor known to be broken,
+    in revision number order."""
+    graph = options.graph
+    revs = graph.dag_range(graph.rev(startRepo), graph.rev(endRepo)) - options.skipRevs
+    nodes = [graph.node(rev) for rev in sorted(revs)]
+    return [rev for rev in nodes if rev == currRev or rev not in labels]
+
+
+def guessNextRevs(options, labels, currRev, startRepo, endRepo):  # pylint: disable=invalid-name
+    # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc,missing-type-doc
+    """Guess which revisions bisection is going to suggest after the current one, so they can be compiled early."""
+    untested = untestedRevs(options, labels, currRev, startRepo, endRepo)
+    if options.testInitialRevs and currRev == endRepo:
+        # The start revision gets tested right after the end revision
+        return [startRepo] + bisection_midpoints(untested, currRev, options.speculativeBuilds - 1)
+    return bisection_midpoints(untested, currRev, options.speculativeBuilds)
+
+
+def findBustedRange(options, bisection, labels, testRev, brokenRev, startRepo, endRepo):
+    # pylint: disable=invalid-name,missing-param-doc,missing-return-doc,missing-return-type-doc,missing-type-doc
+    # pylint: disable=too-complex,too-many-arguments,too-many-branches,too-many-locals
+    """Bisect to the first revision that fails to compile, before brokenRev, and to the first one that compiles again,
+    after it. The range is remembered and skipped from then on. Shells which compile along the way get tested as usual,
+    which tells the main bisection about them too.
+
+    Only failures with a .busted entry in the shell cache count as broken. Each search starts from the closest revision
+    known to compile, startRepo or endRepo being compiled first if they were only assumed good or bad."""
+    graph = options.graph
+    if not compile_shell.is_busted(options.build_options, brokenRev):
+        print_("Rev %s failed without a .busted shell cache entry, only skipping it." % brokenRev, flush=True)
+        return
+
+    def testAndRemember(rev):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
+        # pylint: disable=missing-return-type-doc
+        label = testRev(rev)
+        print_("%s (%s) " % (label[0], label[1]), flush=True)
+        if rev not in labels:
+            labels[rev] = label
+            bisection.label(rev, label[0])
+        return label
+
+    compiled = [graph.rev(rev) for rev, label in labels.items()
+                if label[1] != "compilation failed" and not label[1].startswith("assumed")]
+    broken_rev = graph.rev(brokenRev)
+    bounds = sorted([startRepo, endRepo], key=graph.rev)
+    ends = []
+    for end, bound, first_good in (("start", bounds[0], False), ("end", bounds[1], True)):
+        if first_good:
+            closest = [rev for rev in compiled if graph.is_ancestor(broken_rev, rev)]
+        else:
+            closest = [rev for rev in compiled if graph.is_ancestor(rev, broken_rev)]
+        if closest:
+            compiling_rev = graph.node(min(closest) if first_good else max(closest))
+        else:
+            compiling_rev = bound
+            if bound in labels and labels[bound][1] == "compilation failed":
+                ends.append(None)
+                continue
+            if bound not in labels or labels[bound][1].startswith("assumed"):
+                print_("Checking that the %s revision compiles..." % end, end=" ", flush=True)
+                if testAndRemember(bound)[1] == "compilation failed":
+                    ends.append(None)
+                    continue
+
+        hunt = revision_graph.Bisection(graph, options.skipRevs)
+        hunt.label(compiling_rev, "good")
+        hunt.label(brokenRev, "bad")
+        while True:
+            try:
+                result = hunt.next_revs()
+            except ValueError:  # The range between compiling_rev and brokenRev is empty
+                result = None
+            if result is None or result[2] != first_good:
+                ends.append(None)
+                break
+            nodes, remaining, _ = result
+            if not remaining:
+                # With skipped candidates, settle for the widest range
+                ends.append(nodes[-1] if first_good else nodes[0])
+                break
+            rev = nodes[0]
+            if rev not in labels:
+                print_("Looking for the %s of the compilation bustage..." % end, end=" ", flush=True)
+                testAndRemember(rev)
+            is_broken = labels[rev][1] == "compilation failed"
+            if is_broken and not compile_shell.is_busted(options.build_options, rev):
+                print_("Rev %s failed without a .busted shell cache entry." % rev, flush=True)
+                ends.append(None)
+                break
+            hunt.label(rev, "bad" if is_broken else "good")
+
+    if None in ends:
+        print_("Could not find both ends of the compilation bustage around %s, only skipping it." % brokenRev,
+               flush=True)
+        return
+    broken = graph.known_broken([ends])
+    print_("Compilation is broken from %s until %s, skipping %s revisions." % (ends[0], ends[1], len(broken)),
+           flush=True)
+    kbew.record_known_broken_pair(options.build_options, ends[0], ends[1])
+    options.skipRevs |= broken
+    bisection.skip |= broken
+
+
+def labelCacheScope(options, interestingness):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
+    # pylint: disable=missing-return-type-doc,missing-type-doc
+    """Return what the label of a revision depends on apart from the revision itself: the shell type, the tests and
+    the shell parameters, with the testcase given by the hash of its contents rather than by its path."""
+    params = list(options.runtime_params)
+    if "-e 42" not in options.parameters and Path(params[-1]).expanduser().is_file():
+        params[-1] = result_cache.content_hash(Path(params[-1]).expanduser())
+    return [build_options.computeShellType(options.build_options), options.output, options.watchExitCode,
+            interestingness if options.useInterestingnessTests else [], params]
+
+
+def cachedLabels(options):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
+    # pylint: disable=missing-return-type-doc,missing-type-doc
+    """Return the labels remembered from earlier bisections of the same testcase, keyed on the changeset hash."""
+    if options.ignoreCachedLabels:
+        return {}
+    return label_cache.load(options.labelCacheScope)
+
+
+def cachingTestRev(options, testRev):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
+    # pylint: disable=missing-return-type-doc,missing-type-doc
+    """Wrap testRev so it returns remembered labels without building or running anything, and remembers new ones.
+    Compilation failures are not remembered, the shell cache already knows about them."""
+    def inner(rev):  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
+        label = cachedLabels(options).get(rev)
+        if label is not None:
+            print_("Rev %s: Found a label from an earlier bisection..." % rev, end=" ", flush=True)
+            return label
+        label = testRev(rev)
+        if label[1] != "compilation failed":
+            label_cache.record(options.labelCacheScope, rev, label)
+        return label
+    return inner
+
+
 def internalTestAndLabel(options):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
     # pylint: disable=missing-return-type-doc,missing-type-doc,too-complex
     """Use autobisectjs without interestingness tests to examine the revision of the js shell."""
@@ -353,19 +583,12 @@ def externalTestAndLabel(options, interestingness):  # pylint: disable=invalid-n
 
 
 # pylint: disable=invalid-name,missing-param-doc,missing-type-doc,too-many-arguments
-def checkBlameParents(repo_dir, blamedRev, blamedGoodOrBad, labels, testRev, startRepo, endRepo):
+def checkBlameParents(graph, blamedRev, blamedGoodOrBad, labels, testRev, startRepo, endRepo):
     """If bisect blamed a merge, try to figure out why."""
-    repo_dir = str(repo_dir)
     bisectLied = False
     missedCommonAncestor = False
 
-    hg_parent_output = subprocess.run(
-        ["hg", "-R", str(repo_dir)] + ["parent", "--template={node|short},", "-r", blamedRev],
-        check=True,
-        cwd=os.getcwdu() if sys.version_info.major == 2 else os.getcwd(),  # pylint: disable=no-member
-        stdout=subprocess.PIPE,
-        timeout=99).stdout.decode("utf-8", errors="replace")
-    parents = hg_parent_output.split(",")[:-1]
+    parents = [graph.node(p) for p in graph.parents[graph.rev(blamedRev)]]
 
     if len(parents) == 1:
         return
@@ -375,8 +598,8 @@ def checkBlameParents(repo_dir, blamedRev, blamedGoodOrBad, labels, testRev, sta
         if labels.get(p) is None:
             print_(flush=True)
             print_("Oops! We didn't test rev %s, a parent of the blamed revision! Let's do that now." % p, flush=True)
-            if not hg_helpers.isAncestor(repo_dir, startRepo, p) and \
-                    not hg_helpers.isAncestor(repo_dir, endRepo, p):
+            if not graph.is_ancestor(graph.rev(startRepo), graph.rev(p)) and \
+                    not graph.is_ancestor(graph.rev(endRepo), graph.rev(p)):
                 print_("We did not test rev %s because it is not a descendant of either %s or %s." % (
                     p, startRepo, endRepo), flush=True)
                 # Note this in case we later decide the bisect result is wrong.
@@ -398,7 +621,7 @@ def checkBlameParents(repo_dir, blamedRev, blamedGoodOrBad, labels, testRev, sta
     # Explain why bisect blamed the merge.
     if bisectLied:
         if missedCommonAncestor:
-            ca = hg_helpers.findCommonAncestor(repo_dir, parents[0], parents[1])
+            ca = graph.node(graph.common_ancestor(graph.rev(parents[0]), graph.rev(parents[1])))
             print_(flush=True)
             print_("Bisect blamed the merge because our initial range did not include one", flush=True)
             print_("of the parents.", flush=True)
@@ -432,61 +655,66 @@ def sanitizeCsetMsg(msg, repo):  # pylint: disable=missing-param-doc,missing-ret
     return "\n".join(sanitizedMsgList)
 
 
-def bisectLabel(hgPrefix, options, hgLabel, currRev, startRepo, endRepo):  # pylint: disable=invalid-name
+def bisectLabel(bisection, options, hgLabel, currRev, startRepo, endRepo):  # pylint: disable=invalid-name
     # pylint: disable=missing-param-doc,missing-raises-doc,missing-return-doc,missing-return-type-doc,missing-type-doc
     # pylint: disable=too-many-arguments
-    """Tell hg what we learned about the revision."""
+    """Record what we learned about the revision, and find out which revision to test next."""
     assert hgLabel in ("good", "bad", "skip")
-    outputResult = subprocess.run(
-        hgPrefix + ["bisect", "-U", "--" + hgLabel, currRev],
-        check=True,
-        cwd=os.getcwdu() if sys.version_info.major == 2 else os.getcwd(),  # pylint: disable=no-member
-        stdout=subprocess.PIPE,
-        timeout=999).stdout.decode("utf-8", errors="replace")
-    outputLines = outputResult.split("\n")
+    bisection.label(currRev, hgLabel)
 
     if options.build_options:
         repo_dir = options.build_options.repo_dir
 
-    if re.compile("Due to skipped revisions, the first (good|bad) revision could be any of:").match(outputLines[0]):
-        print_(flush=True)
-        print_(sanitizeCsetMsg(outputResult, repo_dir), flush=True)
+    result = bisection.next_revs()
+    if result is not None and not result[1]:
+        nodes, _, first_good = result
+        hg_log_output = subprocess.run(
+            ["hg", "-R", str(repo_dir), "log", "-r", " + ".join(nodes)],
+            check=True,
+            cwd=os.getcwdu() if sys.version_info.major == 2 else os.getcwd(),  # pylint: disable=no-member
+            stdout=subprocess.PIPE,
+            timeout=999).stdout.decode("utf-8", errors="replace")
+        blamedGoodOrBad = "good" if first_good else "bad"
         print_(flush=True)
-        return None, None, None, startRepo, endRepo
+        if len(nodes) > 1:
+            print_("Due to skipped revisions, the first %s revision could be any of:" % blamedGoodOrBad, flush=True)
+            print_(sanitizeCsetMsg(hg_log_output, repo_dir), flush=True)
+            print_(flush=True)
+            return None, None, None, startRepo, endRepo
 
-    r = re.compile("The first (good|bad) revision is:")
-    m = r.match(outputLines[0])
-    if m:
-        print_(flush=True)
         print_(flush=True)
         print_("autobisectjs shows this is probably related to the following changeset:", flush=True)
         print_(flush=True)
-        print_(sanitizeCsetMsg(outputResult, repo_dir), flush=True)
+        print_("The first %s revision is:" % blamedGoodOrBad, flush=True)
+        print_(sanitizeCsetMsg(hg_log_output, repo_dir), flush=True)
         print_(flush=True)
-        blamedGoodOrBad = m.group(1)
-        blamedRev = hg_helpers.get_cset_hash_from_bisect_msg(outputLines[1])
-        return blamedGoodOrBad, blamedRev, None, startRepo, endRepo
+        return blamedGoodOrBad, nodes[0], None, startRepo, endRepo
 
     if options.testInitialRevs:
         return None, None, None, startRepo, endRepo
 
-    # e.g. "Testing changeset 52121:573c5fa45cc4 (440 changesets remaining, ~8 tests)"
-    sps.vdump(outputLines[0])
-
-    currRev = hg_helpers.get_cset_hash_from_bisect_msg(outputLines[0])
-    if currRev is None:
+    testedRev = currRev
+    if result is None:
         print_("Resetting to default revision...", flush=True)
-        subprocess.run(hgPrefix + ["update", "-C", "default"], check=True)
+        subprocess.run(["hg", "-R", str(repo_dir), "update", "-C", "default"], check=True)
         hg_helpers.destroyPyc(repo_dir)
-        raise Exception("hg did not suggest a changeset to test!")
+        raise Exception("Bisection did not suggest a changeset to test!")
+    currRev = result[0][0]
+
+    # Like hg bisect, e.g. "Testing changeset 52121:573c5fa45cc4 (440 changesets remaining, ~8 tests)"
+    tests = 0
+    while 2 ** (tests + 1) <= result[1]:
+        tests += 1
+    sps.vdump("Testing changeset %d:%s (%d changesets remaining, ~%d tests)" % (
+        bisection.graph.rev(currRev), currRev, result[1], tests))
 
     # Update the startRepo/endRepo values.
     start = startRepo
     end = endRepo
     if hgLabel == "bad":
-        end = currRev
+        end = testedRev
     elif hgLabel == "good":
-        start = currRev
+        start = testedRev
     elif hgLabel == "skip":
         pass
 
@@ -533,7 +761,15 @@ def main():
             print_("TBD: We need to switch to the autobisect repository.", flush=True)
             sys.exit(0)
         else:  # Bisect using local builds
-            findBlamedCset(options, repo_dir, compile_shell.makeTestRev(options))
+            prebuilder = None
+            if options.speculativeBuilds:
+                prebuilder = compile_shell.ShellPrebuilder(options.build_options, options.speculativeBuilds)
+            try:
+                test_rev = cachingTestRev(options, compile_shell.makeTestRev(options, prebuilder))
+                findBlamedCset(options, repo_dir, test_rev, prebuilder)
+            finally:
+                if prebuilder:
+                    prebuilder.close()
 
         # Last thing we do while we have a lock.
         # Note that this only clears old *local* cached directories, not remote ones.
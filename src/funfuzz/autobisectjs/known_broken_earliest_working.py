@@ -4,22 +4,35 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
-"""Known broken changeset ranges of SpiderMonkey are specified in this file.
+"""Known broken changeset ranges of SpiderMonkey are specified in this file. Ranges found by autobisectjs are added to
+them from ~/known-broken-ranges, in one JSON file per shell type, until they expire.
 """
 
 from __future__ import absolute_import, unicode_literals  # isort:skip
 
+import io
+import json
 import os
 import platform
 import sys
+import tempfile
+import time
 
 from pkg_resources import parse_version
 
-if sys.version_info.major == 2 and os.name == "posix":
-    import subprocess32 as subprocess  # pylint: disable=import-error
+from ..js import build_options
+
+if sys.version_info.major == 2:
+    from pathlib2 import Path
+    if os.name == "posix":
+        import subprocess32 as subprocess  # pylint: disable=import-error
 else:
+    from pathlib import Path  # pylint: disable=import-error
     import subprocess
 
+# Locally recorded ranges expire after as long as the local shell cache keeps the .busted files they came from
+LOCAL_KNOWN_BROKEN_MAX_AGE = 28 * 24 * 60 * 60
+
 
 def hgrange(first_bad, first_good):  # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc
     # pylint: disable=missing-type-doc
@@ -34,67 +47,149 @@ def hgrange(first_bad, first_good):  # pylint: disable=missing-param-doc,missing
 def known_broken_ranges(options):  # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc
     # pylint: disable=missing-type-doc
     """Return a list of revsets corresponding to known-busted revisions."""
+    return [hgrange(first_bad, first_good) for first_bad, first_good in known_broken_pairs(options)]
+
+
+def known_broken_pairs(options, ignore_local=False):  # pylint: disable=missing-param-doc,missing-return-doc
+    # pylint: disable=missing-return-type-doc,missing-type-doc
+    """Return a list of (first bad, first good) changeset pairs of known-busted ranges, see hgrange. This includes the
+    ranges recorded locally, unless ignore_local is set."""
     # Paste numbers into: https://hg.mozilla.org/mozilla-central/rev/<number> to get hgweb link.
     # To add to the list:
     # - (1) will tell you when the brokenness started
     # - (1) python -m funfuzz.autobisectjs --compilationFailedLabel=bad -e FAILINGREV
     # - (2) will tell you when the brokenness ended
     # - (2) python -m funfuzz.autobisectjs --compilationFailedLabel=bad -s FAILINGREV
+    # autobisectjs finds both ends by itself when a revision fails to compile, and records the range locally.
 
     # ANCIENT FIXME: It might make sense to avoid (or note) these in checkBlameParents.
 
     skips = [
-        hgrange("7c25be97325d", "d426154dd31d"),  # Fx38, broken spidermonkey
-        hgrange("da286f0f7a49", "62fecc6ab96e"),  # Fx39, broken spidermonkey
-        hgrange("8a416fedec44", "7f9252925e26"),  # Fx41, broken spidermonkey
-        hgrange("3bcc3881b95d", "c609df6d3895"),  # Fx44, broken spidermonkey
-        hgrange("d3a026933bce", "5fa834fe9b96"),  # Fx52, broken spidermonkey
-        hgrange("4c72627cfc6c", "926f80f2c5cc"),  # Fx60, broken spidermonkey
+        ("7c25be97325d", "d426154dd31d"),  # Fx38, broken spidermonkey
+        ("da286f0f7a49", "62fecc6ab96e"),  # Fx39, broken spidermonkey
+        ("8a416fedec44", "7f9252925e26"),  # Fx41, broken spidermonkey
+        ("3bcc3881b95d", "c609df6d3895"),  # Fx44, broken spidermonkey
+        ("d3a026933bce", "5fa834fe9b96"),  # Fx52, broken spidermonkey
+        ("4c72627cfc6c", "926f80f2c5cc"),  # Fx60, broken spidermonkey
     ]
 
     if platform.system() == "Linux":
         skips.extend([
             # Clang failure - probably recent versions of GCC as well.
-            hgrange("5232dd059c11", "ed98e1b9168d"),  # Fx41, see bug 1140482
+            ("5232dd059c11", "ed98e1b9168d"),  # Fx41, see bug 1140482
             # Failure specific to GCC 5 (and probably earlier) - supposedly works on GCC 6
-            hgrange("e94dceac8090", "516c01f62d84"),  # Fx56-57, see bug 1386011
+            ("e94dceac8090", "516c01f62d84"),  # Fx56-57, see bug 1386011
         ])
         if not options.disableProfiling:
             skips.extend([
                 # To bypass the following month-long breakage, use "--disable-profiling"
-                hgrange("aa1da5ed8a07", "5a03382283ae"),  # Fx54-55, see bug 1339190
+                ("aa1da5ed8a07", "5a03382283ae"),  # Fx54-55, see bug 1339190
             ])
 
     if platform.system() == "Windows":
         skips.extend([
-            hgrange("be8b0845f283", "db3ed1fdbbea"),  # Fx50, see bug 1289679
+            ("be8b0845f283", "db3ed1fdbbea"),  # Fx50, see bug 1289679
         ])
 
     if not options.enableDbg:
         skips.extend([
-            hgrange("a048c55e1906", "ddaa87cfd7fa"),  # Fx46, broken opt builds w/ --enable-gczeal
-            hgrange("c5561749c1c6", "f4c15a88c937"),  # Fx58-59, broken opt builds w/ --enable-gczeal
+            ("a048c55e1906", "ddaa87cfd7fa"),  # Fx46, broken opt builds w/ --enable-gczeal
+            ("c5561749c1c6", "f4c15a88c937"),  # Fx58-59, broken opt builds w/ --enable-gczeal
         ])
 
     if options.enableMoreDeterministic:
         skips.extend([
-            hgrange("1d672188b8aa", "ea7dabcd215e"),  # Fx40, see bug 1149739
+            ("1d672188b8aa", "ea7dabcd215e"),  # Fx40, see bug 1149739
         ])
 
     if options.enableSimulatorArm32:
         skips.extend([
-            hgrange("3a580b48d1ad", "20c9570b0734"),  # Fx43, broken 32-bit ARM-simulator builds
-            hgrange("f35d1107fe2e", "bdf975ad2fcd"),  # Fx45, broken 32-bit ARM-simulator builds
-            hgrange("6c37be9cee51", "4548ba932bde"),  # Fx50, broken 32-bit ARM-simulator builds
+            ("3a580b48d1ad", "20c9570b0734"),  # Fx43, broken 32-bit ARM-simulator builds
+            ("f35d1107fe2e", "bdf975ad2fcd"),  # Fx45, broken 32-bit ARM-simulator builds
+            ("6c37be9cee51", "4548ba932bde"),  # Fx50, broken 32-bit ARM-simulator builds
         ])
 
-    return skips
+    if ignore_local:
+        return skips
+    return skips + local_known_broken_pairs(options)
+
+
+def get_known_broken_dir(base_dir=None):
+    """Retrieve the directory holding the locally recorded known broken ranges, and create one if needed.
+
+    Args:
+        base_dir (Path): Base directory to create the known broken directory in, defaults to the home directory
+
+    Returns:
+        Path: Full path to the known broken directory
+    """
+    known_broken_dir = (base_dir or Path.home()) / "known-broken-ranges"
+    known_broken_dir.mkdir(exist_ok=True)
+    return known_broken_dir
+
+
+def _read_local_known_broken(db_file):
+    """Return the unexpired [first bad, first good, time recorded] entries of a known broken file."""
+    try:
+        with io.open(str(db_file), "r", encoding="utf-8", errors="replace") as f:
+            entries = json.load(f)
+    except (IOError, OSError, ValueError):  # Nothing recorded yet, or the file is damaged
+        return []
+    # Entries without the time they were recorded count as expired
+    return [entry for entry in entries
+            if len(entry) == 3 and time.time() - entry[2] <= LOCAL_KNOWN_BROKEN_MAX_AGE]
+
+
+def local_known_broken_pairs(options, base_dir=None):
+    """Return the known broken ranges recorded locally for the shell type of some build options, leaving out the ones
+    older than LOCAL_KNOWN_BROKEN_MAX_AGE.
+
+    Args:
+        options (object): Object containing the build options defined in build_options.py
+        base_dir (Path): Base directory of the known broken directory, defaults to the home directory
+
+    Returns:
+        list: (first bad, first good) changeset pairs
+    """
+    db_file = get_known_broken_dir(base_dir) / (build_options.computeShellType(options) + ".json")
+    return [(entry[0], entry[1]) for entry in _read_local_known_broken(db_file)]
+
+
+def record_known_broken_pair(options, first_bad, first_good, base_dir=None):
+    """Remember a range of changesets which fail to compile with some build options, dropping expired ranges. Only
+    ranges whose first bad changeset has a .busted entry in the shell cache should be recorded.
+
+    Args:
+        options (object): Object containing the build options defined in build_options.py
+        first_bad (str): Hash of the first changeset which fails to compile
+        first_good (str): Hash of the first changeset which compiles again
+        base_dir (Path): Base directory of the known broken directory, defaults to the home directory
+    """
+    db_dir = get_known_broken_dir(base_dir)
+    db_file = db_dir / (build_options.computeShellType(options) + ".json")
+    entries = [entry for entry in _read_local_known_broken(db_file) if entry[:2] != [first_bad, first_good]]
+    entries.append([first_bad, first_good, int(time.time())])
+
+    tmp_fd, tmp_name = tempfile.mkstemp(suffix=".tmp", dir=str(db_dir))
+    with io.open(tmp_fd, "w", encoding="utf-8", errors="replace") as f:
+        f.write(json.dumps(entries))
+    if sys.version_info.major == 2:
+        os.rename(tmp_name, str(db_file))
+    else:
+        os.replace(tmp_name, str(db_file))  # pylint: disable=no-member
 
 
 def earliest_known_working_rev(options, flags, skip_revs):  # pylint: disable=missing-param-doc,missing-return-doc
-    # pylint: disable=missing-return-type-doc,missing-type-doc,too-many-branches,too-complex,too-many-statements
+    # pylint: disable=missing-return-type-doc,missing-type-doc
     """Return a revset which evaluates to the first revision of the shell that compiles with |options|
     and runs jsfunfuzz successfully with |flags|."""
+    return "first((" + common_descendants(required_revs(options, flags)) + ") - (" + skip_revs + "))"
+
+
+def required_revs(options, flags):  # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc
+    # pylint: disable=missing-type-doc,too-many-branches,too-complex,too-many-statements
+    """Return the changesets which the first revision of the shell that compiles with |options| and runs jsfunfuzz
+    successfully with |flags| has to descend from."""
     # Only support at least Mac OS X 10.11
     assert (not platform.system() == "Darwin") or (parse_version(platform.mac_ver()[0]) >= parse_version("10.11"))
 
@@ -165,7 +260,7 @@ def earliest_known_working_rev(options, flags, skip_revs):  # pylint: disable=mi
         required.append("5e6e959f0043")  # m-c 223959 Fx38, 1st w/--enable-avx, see bug 1118235
     required.append("bcacb5692ad9")  # m-c 222786 Fx37, 1st w/ successful GCC 5.2.x builds on Ubuntu 15.10 onwards
 
-    return "first((" + common_descendants(required) + ") - (" + skip_revs + "))"
+    return required
 
 
 def common_descendants(revs):  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
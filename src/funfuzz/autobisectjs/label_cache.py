@@ -0,0 +1,87 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Remember the labels of bisected revisions across runs, so bisecting the same testcase again with the same build
+options and tests does not build or run anything. Labels are kept in ~/bisection-labels, in one JSON file per scope.
+"""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+if sys.version_info.major == 2:
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+
+
+def get_cache_dir(base_dir=None):
+    """Retrieve the directory holding the label files, and create one if needed.
+
+    Args:
+        base_dir (Path): Base directory to create the label directory in, defaults to the home directory
+
+    Returns:
+        Path: Full path to the label directory
+    """
+    cache_dir = (base_dir or Path.home()) / "bisection-labels"
+    cache_dir.mkdir(exist_ok=True)
+    return cache_dir
+
+
+def _cache_file(scope, base_dir=None):
+    """Return the label file of a scope."""
+    scope_hash = hashlib.sha1(json.dumps(scope, sort_keys=True).encode("utf-8")).hexdigest()
+    return get_cache_dir(base_dir) / (scope_hash + ".json")
+
+
+def load(scope, base_dir=None):
+    """Return the labels recorded so far within a scope.
+
+    Args:
+        scope (list): Everything the labels depend on apart from the revision, e.g. the hash of the testcase contents,
+                      the tests and the shell type
+        base_dir (Path): Base directory of the label directory, defaults to the home directory
+
+    Returns:
+        dict: (label, reason) tuples, keyed on the changeset hash
+    """
+    try:
+        with io.open(str(_cache_file(scope, base_dir)), "r", encoding="utf-8", errors="replace") as f:
+            return {rev: tuple(label) for rev, label in json.load(f)["labels"].items()}
+    except (IOError, OSError, KeyError, ValueError):  # Nothing recorded yet, or the file is damaged
+        return {}
+
+
+def record(scope, rev, label, base_dir=None):
+    """Remember the label of a revision within a scope.
+
+    The file is replaced atomically. When two processes race, a label may get lost, in which case the revision is
+    simply tested again later.
+
+    Args:
+        scope (list): Everything the label depends on apart from the revision
+        rev (str): Changeset hash
+        label (tuple): Label, i.e. "good" or "bad", and the reason for it
+        base_dir (Path): Base directory of the label directory, defaults to the home directory
+    """
+    cache_dir = get_cache_dir(base_dir)
+    labels = load(scope, base_dir)
+    labels[rev] = tuple(label)
+
+    tmp_fd, tmp_name = tempfile.mkstemp(suffix=".tmp", dir=str(cache_dir))
+    with io.open(tmp_fd, "w", encoding="utf-8", errors="replace") as f:
+        f.write(json.dumps({"scope": scope, "labels": labels}, sort_keys=True))
+    cache_file = str(_cache_file(scope, base_dir))
+    if sys.version_info.major == 2:
+        os.rename(tmp_name, cache_file)
+    else:
+        os.replace(tmp_name, cache_file)  # pylint: disable=no-member
@@ -0,0 +1,369 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Bisect in-process on the revision graph of a Mercurial repository, so that neither hg bisect nor any of its state
+in the repository is needed. The graph is dumped once with hg log, and kept in ~/hg-revision-graphs.
+"""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+from builtins import object
+import collections
+import hashlib
+import io
+import os
+import sys
+import tempfile
+
+if sys.version_info.major == 2:
+    from pathlib2 import Path
+    if os.name == "posix":
+        import subprocess32 as subprocess  # pylint: disable=import-error
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import subprocess
+
+# One line per revision: revision number, short hash, then the revision numbers of both parents, -1 if none
+LOG_TEMPLATE = "{rev} {node|short} {p1rev} {p2rev}\n"
+
+
+def get_graph_dir(base_dir=None):
+    """Retrieve the directory holding the revision graph files, and create one if needed.
+
+    Args:
+        base_dir (Path): Base directory to create the graph directory in, defaults to the home directory
+
+    Returns:
+        Path: Full path to the graph directory
+    """
+    graph_dir = (base_dir or Path.home()) / "hg-revision-graphs"
+    graph_dir.mkdir(exist_ok=True)
+    return graph_dir
+
+
+def _hg_log(repo_dir, revset):
+    """Return the graph lines of the revisions in a revset, or None if hg cannot list them."""
+    result = subprocess.run(
+        ["hg", "-R", str(repo_dir), "log", "-r", revset, "--template=" + LOG_TEMPLATE],
+        cwd=os.getcwdu() if sys.version_info.major == 2 else os.getcwd(),  # pylint: disable=no-member
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=999)
+    if result.returncode:
+        return None
+    return result.stdout.decode("utf-8", errors="replace").splitlines()
+
+
+def load_graph(repo_dir, base_dir=None):
+    """Load the revision graph of a repository, only asking hg about the revisions added since it was last loaded.
+
+    Revision numbers are local to a clone, so the graph is kept per repository path. If the last revision kept does
+    not match the repository any more, e.g. after hg strip, the whole graph is dumped again.
+
+    Args:
+        repo_dir (Path): Full path to the repository
+        base_dir (Path): Base directory of the graph directory, defaults to the home directory
+
+    Returns:
+        RevisionGraph: Graph of all revisions in the repository
+    """
+    repo_dir = Path(repo_dir).expanduser().resolve()
+    graph_dir = get_graph_dir(base_dir)
+    graph_file = graph_dir / ("%s-%s.txt" % (repo_dir.name,
+                                             hashlib.sha1(str(repo_dir).encode("utf-8")).hexdigest()[:12]))
+
+    lines = []
+    if graph_file.is_file():
+        lines = graph_file.read_text().splitlines()
+    if lines:
+        new_lines = _hg_log(repo_dir, lines[-1].split()[0] + ":tip")
+        if new_lines and new_lines[0] == lines[-1]:
+            if len(new_lines) == 1:
+                return RevisionGraph(lines)
+            lines.extend(new_lines[1:])
+        else:
+            lines = []
+    if not lines:
+        lines = _hg_log(repo_dir, "0:tip")
+        if lines is None:
+            raise OSError("hg could not list the revisions of %s" % repo_dir)
+
+    tmp_fd, tmp_name = tempfile.mkstemp(suffix=".tmp", dir=str(graph_dir))
+    with io.open(tmp_fd, "w", encoding="utf-8", errors="replace") as f:
+        f.write("".join(line + "\n" for line in lines))
+    if sys.version_info.major == 2:
+        os.rename(tmp_name, str(graph_file))
+    else:
+        os.replace(tmp_name, str(graph_file))  # pylint: disable=no-member
+    return RevisionGraph(lines)
+
+
+class RevisionGraph(object):
+    """Parents of each revision of a repository, which is all bisection needs.
+
+    Revisions are revision numbers everywhere, except for rev() and node(), which convert from and to short hashes,
+    and the methods taking hashes written down in known_broken_earliest_working.
+
+    Args:
+        lines (list): Lines of LOG_TEMPLATE output, from revision 0 to tip
+    """
+    def __init__(self, lines):
+        self.nodes = []
+        self.parents = []
+        self.revs = {}
+        for line in lines:
+            rev, node, p1rev, p2rev = line.split()
+            assert int(rev) == len(self.nodes), "Revision %s is not numbered in order" % rev
+            self.revs[node] = len(self.nodes)
+            self.nodes.append(node)
+            self.parents.append(tuple(int(x) for x in (p1rev, p2rev) if x != "-1"))
+
+    def rev(self, node):
+        """Return the revision number of a hash.
+
+        Args:
+            node (str): Short or full hash of the revision
+
+        Returns:
+            int: Revision number, None if the revision is not in the repository
+        """
+        return self.revs.get(node[:12])
+
+    def node(self, rev):
+        """Return the short hash of a revision number.
+
+        Args:
+            rev (int): Revision number
+
+        Returns:
+            str: Short hash of the revision
+        """
+        return self.nodes[rev]
+
+    def ancestors(self, revs, floor=0):
+        """Return the revisions and their ancestors, like the "::revs" revset.
+
+        Args:
+            revs (iterable): Revision numbers
+            floor (int): Revisions numbered lower than this are left out, which saves walking the whole history
+
+        Returns:
+            set: Revision numbers
+        """
+        result = set()
+        stack = [rev for rev in revs if rev >= floor]
+        while stack:
+            rev = stack.pop()
+            if rev not in result:
+                result.add(rev)
+                stack.extend(parent for parent in self.parents[rev] if parent >= floor)
+        return result
+
+    def descendants(self, revs):
+        """Return the revisions and their descendants, like the "revs::" revset.
+
+        Args:
+            revs (iterable): Revision numbers
+
+        Returns:
+            set: Revision numbers
+        """
+        result = set(revs)
+        if result:
+            for rev in range(min(result) + 1, len(self.parents)):
+                if rev not in result and any(parent in result for parent in self.parents[rev]):
+                    result.add(rev)
+        return result
+
+    def is_ancestor(self, ancestor, rev):
+        """Return whether a revision is an ancestor of another one, or the same one.
+
+        Args:
+            ancestor (int): Revision number of the possible ancestor
+            rev (int): Revision number of the possible descendant
+
+        Returns:
+            bool: True if ancestor is in "::rev"
+        """
+        return ancestor in self.ancestors([rev], floor=ancestor)
+
+    def common_ancestor(self, rev_a, rev_b):
+        """Return the greatest common ancestor of two revisions, like the "ancestor(a, b)" revset.
+
+        Args:
+            rev_a (int): Revision number
+            rev_b (int): Revision number
+
+        Returns:
+            int: Revision number of the common ancestor, None if there is none
+        """
+        common = self.ancestors([rev_a]) & self.ancestors([rev_b])
+        return max(common) if common else None
+
+    def dag_range(self, start, end):
+        """Return the revisions which are descendants of start and ancestors of end, like the "start::end" revset.
+
+        Args:
+            start (int): Revision number
+            end (int): Revision number
+
+        Returns:
+            set: Revision numbers
+        """
+        return self.descendants([start]) & self.ancestors([end], floor=start)
+
+    def known_broken(self, pairs):
+        """Return the revisions in known broken ranges. Like known_broken_earliest_working.hgrange, a range holds the
+        descendants of its first bad revision which are not descendants of its first good one, so branches which
+        never got the fix stay broken.
+
+        Args:
+            pairs (list): (first bad, first good) hash pairs. Hashes which are not in the repository count as empty.
+
+        Returns:
+            set: Revision numbers
+        """
+        broken = set()
+        for first_bad, first_good in pairs:
+            bad_rev = self.rev(first_bad)
+            if bad_rev is not None:
+                good_rev = self.rev(first_good)
+                broken |= self.descendants([bad_rev]) - self.descendants([] if good_rev is None else [good_rev])
+        return broken
+
+    def first_common_descendant(self, nodes, excluded):
+        """Return the lowest numbered revision which descends from all given revisions, leaving some out.
+
+        Args:
+            nodes (list): Hashes of the revisions
+            excluded (set): Revision numbers to leave out
+
+        Returns:
+            int: Revision number, None if there is no such revision
+        """
+        revs = [self.rev(node) for node in nodes]
+        if not revs or None in revs:
+            return None
+        common = self.descendants([max(revs)])
+        for rev in revs:
+            common &= self.descendants([rev])
+        common -= excluded
+        return min(common) if common else None
+
+
+class Bisection(object):
+    """State of a bisection, and which revision to test next, chosen in the same way as hg bisect does.
+
+    Args:
+        graph (RevisionGraph): Graph of the repository
+        skip (set): Revision numbers which cannot be tested, e.g. the known broken ones
+    """
+    def __init__(self, graph, skip=None):
+        self.graph = graph
+        self.good = set()
+        self.bad = set()
+        self.skip = set(skip or ())
+
+    def label(self, node, label):
+        """Record what testing a revision told.
+
+        Args:
+            node (str): Hash of the revision
+            label (str): "good", "bad" or "skip"
+        """
+        {"good": self.good, "bad": self.bad, "skip": self.skip}[label].add(self.graph.rev(node))
+
+    def _candidate_space(self, bad, good):
+        """Return the lowest bad revision, and the revisions that may be the first bad one, or None if it is not one of
+        them. Bad and good are swapped to look for the first good revision instead."""
+        bad_rev = min(bad)
+        space = self.graph.descendants(good) - self.graph.ancestors(good, floor=min(good))
+        return bad_rev, space if bad_rev in space else None
+
+    def next_revs(self):
+        """Return the revision to test next, or the result once there is nothing left to test.
+
+        Returns:
+            tuple: Hashes of the result if the remaining number is 0, else a list holding the hash to test next, then
+                   the remaining number of candidate revisions, and whether the first good revision is being looked
+                   for instead of the first bad one. None until there are both good and bad revisions.
+
+        Raises:
+            ValueError: If the good and bad revisions contradict each other
+        """
+        # pylint: disable=too-complex,too-many-branches,too-many-locals
+        if not (self.good and self.bad):
+            return None
+        first_good = False
+        bad_rev, space = self._candidate_space(self.bad, self.good)
+        if space is None:
+            first_good = True
+            bad_rev, space = self._candidate_space(self.good, self.bad)
+        if space is None:
+            raise ValueError("Inconsistent bisection state, %d:%s is good and bad" % (
+                bad_rev, self.graph.node(bad_rev)))
+
+        # Candidates are the ancestors of the bad revision that may have brought in the bug
+        children = collections.defaultdict(list)
+        candidates = [bad_rev]
+        visit = collections.deque([bad_rev])
+        while visit:
+            rev = visit.popleft()
+            for parent in self.graph.parents[rev]:
+                if parent in space:
+                    if parent not in children:
+                        candidates.append(parent)
+                        visit.append(parent)
+                    children[parent].append(rev)
+        candidates.sort()
+
+        tot = len(candidates)
+        if tot == 1 or all(rev in self.skip or rev == bad_rev for rev in candidates):
+            return [self.graph.node(rev) for rev in candidates], 0, first_good
+        perfect = tot // 2
+
+        # Testing a revision splits the candidates into its ancestors and the rest, the best revision splits them
+        # evenly. Ancestors are counted with a bit per candidate, only while some child still needs them.
+        bits = {rev: 1 << i for i, rev in enumerate(candidates)}
+        pending = {rev: len(children[rev]) for rev in candidates}
+        masks = {}
+        counts = {}
+        cut = set()
+        best_rev = None
+        best_len = -1
+        for rev in candidates:
+            parents = [parent for parent in self.graph.parents[rev] if parent in bits]
+            poisoned = any(parent in cut for parent in parents)
+            if not poisoned:
+                mask = bits[rev]
+                for parent in parents:
+                    mask |= masks[parent]
+                count = counts[parents[0]] + 1 if len(parents) == 1 else bin(mask).count("1")
+            for parent in parents:
+                pending[parent] -= 1
+                if not pending[parent]:
+                    masks.pop(parent, None)
+                    counts.pop(parent, None)
+            if poisoned:
+                cut.add(rev)
+                continue
+
+            value = min(count, tot - count)
+            if value > best_len and rev not in self.skip:
+                best_len = value
+                best_rev = rev
+                if value == perfect:
+                    break
+            if tot - count < perfect and rev not in self.skip:
+                # Descendants only have more ancestors, so they cannot do better
+                cut.add(rev)
+                continue
+            if pending[rev]:
+                masks[rev] = mask
+                counts[rev] = count
+
+        assert best_rev is not None
+        return [self.graph.node(best_rev)], tot, first_good
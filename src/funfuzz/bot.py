@@ -25,11 +25,15 @@ from whichcraft import which
 
 from .js import build_options
 from .js import compile_shell
+from .js import js_interesting
 from .js import loop
 from .util import create_collector
 from .util import fork_join
 from .util import hg_helpers
+from .util import reduction_queue
+from .util import run_metrics
 from .util import sm_compile_helpers
+from .util import worker_pool
 from .util.lock_dir import LockDir
 
 if sys.version_info.major == 2:
@@ -42,6 +46,8 @@ else:
     from pathlib import Path  # pylint: disable=import-error
 
 JS_SHELL_DEFAULT_TIMEOUT = 24  # see comments in loop for tradeoffs
+# Memory assumed to be needed by each fuzzing worker until measured, ASan builds need about twice as much
+WORKER_MEMORY_ESTIMATE = 2**30
 
 
 class BuildInfo(object):  # pylint: disable=missing-param-doc,missing-type-doc,too-few-public-methods
@@ -64,6 +70,8 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
         timeout=0,
         build_options=None,
         useTreeherderBuilds=False,
+        reducers=1,
+        metrics_file=None,
     )
 
     parser.add_option("--build", dest="existingBuildDir",
@@ -88,6 +96,15 @@ def parseOpts():  # pylint: disable=invalid-name,missing-docstring,missing-retur
                       help="Sets the timeout for loop. "
                            "Defaults to taking into account the speed of the computer and debugger (if any).")
 
+    parser.add_option("--reducers", type="int", dest="reducers",
+                      help="Number of processes reducing the testcases queued by the fuzzing processes, which then "
+                           "keep on fuzzing. 0 makes each fuzzing process reduce its own testcases. "
+                           "Defaults to %default, Python 2 always uses 0.")
+
+    parser.add_option("--metrics-file", dest="metrics_file",
+                      help="Append the throughput metrics of all fuzzing and reducing processes to this file, "
+                           "one JSON line per shell run, queued testcase and reduction.")
+
     options, args = parser.parse_args()
     if args:
         print("Warning: bot does not use positional arguments")
@@ -129,16 +146,29 @@ def main():  # pylint: disable=missing-docstring
     assert build_info.buildDir.is_dir()
 
     number_of_processes = multiprocessing.cpu_count()
-    if "-asan" in str(build_info.buildDir):
-        # This should really be based on the amount of RAM available, but I don't know how to compute that in Python.
-        # I could guess 1 GB RAM per core, but that wanders into sketchyville.
-        number_of_processes = max(number_of_processes // 2, 1)
+    options.deadline = time.time() + options.targetTime
 
     if sys.version_info.major == 2:
+        options.reducers = 0
+        if "-asan" in str(build_info.buildDir):
+            number_of_processes = max(number_of_processes // 2, 1)
         fork_join.forkJoin(options.tempDir, number_of_processes, loopFuzzingAndReduction, options, build_info,
                            collector)
     else:
-        loopFuzzingAndReduction(options, build_info, collector, 0)
+        if options.reducers:
+            # Queued testcases point at the shell of this run, so the queue goes away along with the run
+            options.reduction_queue = reduction_queue.get_queue_dir(Path(options.tempDir))
+            build_info.mtrArgs.insert(0, "--reduction-queue=%s" % options.reduction_queue)
+        memory_per_worker = WORKER_MEMORY_ESTIMATE * (2 if "-asan" in str(build_info.buildDir) else 1)
+        # Reducers take the first worker slots, which are the last ones to be given up when memory runs low
+        pool = worker_pool.WorkerPool(options.tempDir, loopFuzzingAndReduction, (options, build_info, collector),
+                                      options.reducers + number_of_processes, memory_per_worker,
+                                      child_memory_limit=js_interesting.SHELL_ADDRESS_SPACE_LIMIT)
+        pool.run(options.deadline)
+        print(pool.summary())
+        if options.reducers:
+            # Whatever the reducers did not get to before the deadline would be lost along with tempDir
+            loop.submit_unreduced(options.reduction_queue, collector)
 
     shutil.rmtree(options.tempDir)
 
@@ -228,8 +258,14 @@ def ensureBuild(options):  # pylint: disable=invalid-name,missing-docstring,miss
 
 
 def loopFuzzingAndReduction(options, buildInfo, collector, i):  # pylint: disable=invalid-name,missing-docstring
+    if i < options.reducers:
+        metrics = run_metrics.RunMetrics(options.metrics_file)
+        loop.reduce_queued(options.reduction_queue, collector, options.deadline, metrics)
+        return
     tempDir = Path(tempfile.mkdtemp("loop" + str(i)))  # pylint: disable=invalid-name
-    loop.many_timed_runs(options.targetTime, tempDir, buildInfo.mtrArgs, collector, False)
+    # Workers restarted by the worker pool only get the time that is left
+    target_time = max(options.deadline - time.time(), 1)  # 0 would mean running forever
+    loop.many_timed_runs(target_time, tempDir, buildInfo.mtrArgs, collector, False)
 
 
 def mtrArgsCreation(options, cshell):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
@@ -245,6 +281,10 @@ def mtrArgsCreation(options, cshell):  # pylint: disable=invalid-name,missing-pa
         #   They are not built with --enable-more-deterministic - bug 751700
         manyTimedRunArgs.append("--compare-jit")
     manyTimedRunArgs.append("--random-flags")
+    # Shared by all fuzzing processes of this bot, so each of them skips reducing what a sibling found before
+    manyTimedRunArgs.append("--signature-index=%s" % (Path(options.tempDir) / "signature-index"))
+    if options.metrics_file:
+        manyTimedRunArgs.append("--metrics-file=%s" % options.metrics_file)
 
     # Ordering of elements in manyTimedRunArgs is important.
     manyTimedRunArgs.append(str(options.timeout))
@@ -18,7 +18,7 @@ import zipfile
 
 import requests
 
-from ..js.inspect_shell import queryBuildConfiguration
+from ..js.inspect_shell import get_build_configuration
 
 if sys.version_info.major == 2:
     from pathlib2 import Path
@@ -57,8 +57,9 @@ def get_coverage_build(dirpath, args):
     assert js_cov_bin.is_file()
 
     # Check that the binary is non-debug.
-    assert not queryBuildConfiguration(js_cov_bin, "debug")
-    assert queryBuildConfiguration(js_cov_bin, "coverage")
+    build_config = get_build_configuration(js_cov_bin)
+    assert not build_config.debug
+    assert build_config.coverage
 
     js_cov_fmconf = extract_folder / "dist" / "bin" / (js_cov_bin_name + ".fuzzmanagerconf")
     assert js_cov_fmconf.is_file()
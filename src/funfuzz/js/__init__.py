@@ -15,4 +15,5 @@ from . import inspect_shell
 from . import js_interesting
 from . import link_fuzzer
 from . import loop
+from . import persistent_shell
 from . import shell_flags
@@ -9,28 +9,35 @@
 
 from __future__ import absolute_import, print_function, unicode_literals  # isort:skip
 
+from builtins import object
+import difflib
+import functools
+import hashlib
 import io
+from multiprocessing.pool import ThreadPool
 from optparse import OptionParser  # pylint: disable=deprecated-module
-import os
 import sys
+import threading
+import time
 
-from FTB.ProgramConfiguration import ProgramConfiguration
 import FTB.Signatures.CrashInfo as CrashInfo
 from shellescape import quote
 
 from . import js_interesting
 from . import shell_flags
+from ..util import capability_db
 from ..util import create_collector
 from ..util import lithium_helpers
+from ..util import result_cache
+from ..util import spooled_run
 
 if sys.version_info.major == 2:
     import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from functools32 import lru_cache  # pylint: disable=import-error
     from pathlib2 import Path
-    if os.name == "posix":
-        import subprocess32 as subprocess  # pylint: disable=import-error
 else:
+    from functools import lru_cache  # pylint: disable=no-name-in-module
     from pathlib import Path  # pylint: disable=import-error
-    import subprocess
     import tempfile
 
 gOptions = ""  # pylint: disable=invalid-name
@@ -46,23 +53,76 @@ def ignore_some_stderr(err_inp):
     Returns:
         list: Stderr with potentially some lines removed
     """
-    lines = []
-    for line in err_inp:
-        if line.endswith("malloc: enabling scribbling to detect mods to free blocks"):
-            # MallocScribble prints a line that includes the process's pid.
-            # We don't want to include that pid in the comparison!
-            pass
-        elif "Bailed out of parallel operation" in line:
-            # This error message will only appear when threads and JITs are enabled.
-            pass
-        else:
-            lines.append(line)
-    return lines
+    return [line for line in err_inp if not is_ignored_stderr(line)]
+
+
+def is_ignored_stderr(line):
+    """Return whether a line of stderr should be left out of comparisons.
+
+    Args:
+        line (str): Line of stderr
+
+    Returns:
+        bool: True if the line is not needed
+    """
+    # MallocScribble prints a line that includes the process's pid.
+    # We don't want to include that pid in the comparison!
+    # "Bailed out of parallel operation" will only appear when threads and JITs are enabled.
+    return (line.rstrip("\n").endswith("malloc: enabling scribbling to detect mods to free blocks") or
+            "Bailed out of parallel operation" in line)
+
+
+class StreamDigest(object):
+    """Rolling hash and line count of a stream, so that outputs can be compared without keeping them around."""
+    def __init__(self):
+        self.hash = hashlib.sha1()
+        self.line_count = 0
+
+    def update(self, line):
+        """Add the next line of the stream.
+
+        Args:
+            line (str): Line to be added
+        """
+        self.hash.update(line.encode("utf-8", errors="replace"))
+        self.line_count += 1
+
+    def __eq__(self, other):
+        return self.line_count == other.line_count and self.hash.digest() == other.hash.digest()
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class CompareJitScan(js_interesting.LogScan):
+    """LogScan that also digests both streams and looks for the few lines compareLevel cares about."""
+    def __init__(self):
+        super(CompareJitScan, self).__init__()
+        self.out_digest = StreamDigest()
+        self.err_digest = StreamDigest()  # Leaves out the lines matched by is_ignored_stderr
+        self.usage_error = False
+        self.asm_disabled = False
+
+    def scan_out_line(self, line):  # pylint: disable=missing-docstring
+        super(CompareJitScan, self).scan_out_line(line)
+        self.out_digest.update(line)
+        if "[[script] scriptArgs*]" in line:
+            self.usage_error = True
+
+    def scan_err_line(self, line):  # pylint: disable=missing-docstring
+        super(CompareJitScan, self).scan_err_line(line)
+        if not is_ignored_stderr(line):
+            self.err_digest.update(line)
+        if "[scriptfile] [scriptarg...]" in line:
+            self.usage_error = True
+        if "asm.js type error: Disabled by javascript.options.asmjs" in line:
+            self.asm_disabled = True
 
 
 def compare_jit(jsEngine,  # pylint: disable=invalid-name,missing-param-doc,missing-type-doc,too-many-arguments
-                flags, infilename, logPrefix, repo, build_options_str, targetTime, options):
-    """For use in loop.py
+                flags, infilename, logPrefix, repo, build_options_str, targetTime, options, jobs=1, lithium_jobs=1):
+    """For use in loop.py, jobs is the number of flag combinations that may run at the same time, lithium_jobs the
+    number of chunk removals Lithium may test at the same time.
 
     Returns:
         bool: True if any kind of bug is found, otherwise False
@@ -72,18 +132,19 @@ def compare_jit(jsEngine,  # pylint: disable=invalid-name,missing-param-doc,miss
     logPrefix = Path(logPrefix)
     initialdir_name = (logPrefix.parent / (logPrefix.stem + "-initial"))
     # pylint: disable=invalid-name
-    cl = compareLevel(jsEngine, flags, infilename, initialdir_name, options, False, True)
+    cl = compareLevel(jsEngine, flags, infilename, initialdir_name, options, False, True, jobs)
     lev = cl[0]
 
     if lev != js_interesting.JS_FINE:
-        itest = [__name__, "--flags=" + " ".join(flags),
-                 "--minlevel=" + str(lev), "--timeout=" + str(options.timeout), options.knownPath]
-        (lithResult, _lithDetails, autoBisectLog) = lithium_helpers.pinpoint(  # pylint: disable=invalid-name
-            itest, logPrefix, jsEngine, [], infilename, repo, build_options_str, targetTime, lev)
+        itest = [__name__, "--flags=" + " ".join(flags), "--minlevel=" + str(lev),
+                 "--timeout=" + str(options.timeout), "--jobs=" + str(jobs), options.knownPath]
+        # pylint: disable=invalid-name
+        (lithResult, _lithDetails, autoBisectLog, stage_stats) = lithium_helpers.pinpoint(
+            itest, logPrefix, jsEngine, [], infilename, repo, build_options_str, targetTime, lev, lithium_jobs)
         if lithResult == lithium_helpers.LITH_FINISHED:
             print("Retesting %s after running Lithium:" % infilename)
             finaldir_name = (logPrefix.parent / (logPrefix.stem + "-final"))
-            retest_cl = compareLevel(jsEngine, flags, infilename, finaldir_name, options, True, False)
+            retest_cl = compareLevel(jsEngine, flags, infilename, finaldir_name, options, True, False, jobs)
             if retest_cl[0] != js_interesting.JS_FINE:
                 cl = retest_cl
                 quality = 0
@@ -93,21 +154,22 @@ def compare_jit(jsEngine,  # pylint: disable=invalid-name,missing-param-doc,miss
             quality = 10
         print("compare_jit: Uploading %s with quality %s" % (infilename, quality))
 
-        metadata = {}
+        metadata = lithium_helpers.stage_metadata(stage_stats)
         if autoBisectLog:
-            metadata = {"autoBisectLog": "".join(autoBisectLog)}
+            metadata["autoBisectLog"] = "".join(autoBisectLog)
         options.collector.submit(cl[1], str(infilename), quality, metaData=metadata)
         return True
 
     return False
 
 
-def compareLevel(jsEngine, flags, infilename, logPrefix, options, showDetailedDiffs, quickMode):
+def compareLevel(jsEngine, flags, infilename, logPrefix, options, showDetailedDiffs, quickMode, jobs=1):
     # pylint: disable=invalid-name,missing-docstring,missing-return-doc,missing-return-type-doc,too-complex
-    # pylint: disable=too-many-branches,too-many-arguments,too-many-locals
+    # pylint: disable=too-many-branches,too-many-arguments,too-many-locals,too-many-statements
 
     # options dict must be one we can pass to js_interesting.ShellResult
     # we also use it directly for knownPath, timeout, and collector
+    # jobs is the number of flag combinations that may run at the same time
     # Return: (lev, crashInfo) or (js_interesting.JS_FINE, None)
 
     assert isinstance(infilename, Path)
@@ -123,98 +185,119 @@ def compareLevel(jsEngine, flags, infilename, logPrefix, options, showDetailedDi
 
     commands = [[jsEngine] + combo + [str(infilename)] for combo in combos]
 
-    for i, command in enumerate(commands):
-        prefix = (logPrefix.parent / ("%s-r%s" % (logPrefix.stem, str(i))))
-        command = commands[i]
-        r = js_interesting.ShellResult(options, command, prefix, True)  # pylint: disable=invalid-name
-
-        oom = js_interesting.oomed(r.err)
-        r.err = ignore_some_stderr(r.err)
-
-        if (r.return_code == 1 or r.return_code == 2) and (anyLineContains(r.out, "[[script] scriptArgs*]") or (
-                anyLineContains(r.err, "[scriptfile] [scriptarg...]"))):
-            print("Got usage error from:")
-            print("  %s" % " ".join(quote(str(x)) for x in command))
-            assert i
-            js_interesting.deleteLogs(prefix)
-        elif r.lev > js_interesting.JS_OVERALL_MISMATCH:
-            # would be more efficient to run lithium on one or the other, but meh
-            print("%s | %s" % (str(infilename),
-                               js_interesting.summaryString(r.issues + ["compare_jit found a more serious bug"],
-                                                            r.lev,
-                                                            r.runinfo.elapsedtime)))
-            summary_log = (logPrefix.parent / (logPrefix.stem + "-summary")).with_suffix(".txt")
-            with io.open(str(summary_log), "w", encoding="utf-8", errors="replace") as f:
-                f.write("\n".join(r.issues + [" ".join(quote(str(x)) for x in command),
-                                              "compare_jit found a more serious bug"]) + "\n")
-            print("  %s" % " ".join(quote(str(x)) for x in command))
-            return (r.lev, r.crashInfo)
-        elif r.lev != js_interesting.JS_FINE or r.return_code != 0:
-            print("%s | %s" % (str(infilename), js_interesting.summaryString(
-                r.issues + ["compare_jit is not comparing output, because the shell exited strangely"],
-                r.lev, r.runinfo.elapsedtime)))
-            print("  %s" % " ".join(quote(str(x)) for x in command))
-            js_interesting.deleteLogs(prefix)
-            if not i:
-                return (js_interesting.JS_FINE, None)
-        elif oom:
-            # If the shell or python hit a memory limit, we consider the rest of the computation
-            # "tainted" for the purpose of correctness comparison.
-            message = "compare_jit is not comparing output: OOM"
-            print("%s | %s" % (str(infilename), js_interesting.summaryString(
-                r.issues + [message], r.lev, r.runinfo.elapsedtime)))
-            js_interesting.deleteLogs(prefix)
-            if not i:
-                return (js_interesting.JS_FINE, None)
-        elif not i:
-            # Stash output from this run (the first one), so for subsequent runs, we can compare against it.
-            (r0, prefix0) = (r, prefix)  # pylint: disable=invalid-name
-        else:
-            # Compare the output of this run (r.out) to the output of the first run (r0.out), etc.
-
-            def optionDisabledAsmOnOneSide():  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
-                # pylint: disable=missing-return-type-doc
-                asmMsg = "asm.js type error: Disabled by javascript.options.asmjs"  # pylint: disable=invalid-name
-                # pylint: disable=invalid-name
-                # pylint: disable=cell-var-from-loop
-                optionDisabledAsm = anyLineContains(r0.err, asmMsg) or anyLineContains(r.err, asmMsg)
-                # pylint: disable=invalid-name
-                optionDiffers = (("--no-asmjs" in commands[0]) != ("--no-asmjs" in command))
-                return optionDisabledAsm and optionDiffers
-
-            mismatchErr = (r.err != r0.err and not optionDisabledAsmOnOneSide())  # pylint: disable=invalid-name
-            mismatchOut = (r.out != r0.out)  # pylint: disable=invalid-name
-
-            if mismatchErr or mismatchOut:
-                # Generate a short summary for stdout and a long summary for a "*-summary.txt" file.
-                # pylint: disable=invalid-name
-                rerunCommand = " ".join(quote(str(x)) for x in ["python -m funfuzz.js.compare_jit",
-                                                                "--flags=" + " ".join(flags),
-                                                                "--timeout=" + str(options.timeout),
-                                                                str(options.knownPath),
-                                                                str(jsEngine),
-                                                                str(infilename.name)])
-                (summary, issues) = summarizeMismatch(mismatchErr, mismatchOut, prefix0, prefix)
-                summary = ("  " + " ".join(quote(str(x)) for x in commands[0]) + "\n  " +
-                           " ".join(quote(str(x)) for x in command) + "\n\n" + summary)
+    prefixes = [(logPrefix.parent / ("%s-r%s" % (logPrefix.stem, str(i)))) for i in range(len(commands))]
+    # Set as soon as the outcome is known, to kill runs of the remaining combos
+    cancel = threading.Event()
+
+    def run_combo(i):  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
+        if cancel.is_set():
+            return None
+        return js_interesting.ShellResult(options, commands[i], prefixes[i], True,
+                                          runner=functools.partial(spooled_run.timed_run, cancel=cancel),
+                                          scan=CompareJitScan())
+
+    # Results are compared in order, while later combos may already be running
+    pool = ThreadPool(jobs) if jobs > 1 else None
+    results = pool.imap(run_combo, range(len(commands))) if pool else (run_combo(i) for i in range(len(commands)))
+    compared = 0
+    try:
+        for i, r in enumerate(results):  # pylint: disable=invalid-name
+            (command, prefix, compared) = (commands[i], prefixes[i], i + 1)
+
+            oom = r.oom
+
+            if (r.return_code == 1 or r.return_code == 2) and r.scan.usage_error:
+                print("Got usage error from:")
+                print("  %s" % " ".join(quote(str(x)) for x in command))
+                assert i
+                js_interesting.deleteLogs(prefix)
+            elif r.lev > js_interesting.JS_OVERALL_MISMATCH:
+                # would be more efficient to run lithium on one or the other, but meh
+                print("%s | %s" % (str(infilename),
+                                   js_interesting.summaryString(r.issues + ["compare_jit found a more serious bug"],
+                                                                r.lev,
+                                                                r.runinfo.elapsedtime)))
                 summary_log = (logPrefix.parent / (logPrefix.stem + "-summary")).with_suffix(".txt")
                 with io.open(str(summary_log), "w", encoding="utf-8", errors="replace") as f:
-                    f.write(rerunCommand + "\n\n" + summary)
+                    f.write("\n".join(r.issues + [" ".join(quote(str(x)) for x in command),
+                                                  "compare_jit found a more serious bug"]) + "\n")
+                print("  %s" % " ".join(quote(str(x)) for x in command))
+                return (r.lev, r.crashInfo)
+            elif r.lev != js_interesting.JS_FINE or r.return_code != 0:
                 print("%s | %s" % (str(infilename), js_interesting.summaryString(
-                    issues, js_interesting.JS_OVERALL_MISMATCH, r.runinfo.elapsedtime)))
-                if quickMode:
-                    print(rerunCommand)
-                if showDetailedDiffs:
-                    print(summary)
-                    print()
-                # Create a crashInfo object with empty stdout, and stderr showing diffs
-                pc = ProgramConfiguration.fromBinary(str(jsEngine))  # pylint: disable=invalid-name
-                pc.addProgramArguments(flags)
-                crashInfo = CrashInfo.CrashInfo.fromRawCrashData([], summary, pc)  # pylint: disable=invalid-name
-                return (js_interesting.JS_OVERALL_MISMATCH, crashInfo)
-            else:
-                # print "compare_jit: match"
+                    r.issues + ["compare_jit is not comparing output, because the shell exited strangely"],
+                    r.lev, r.runinfo.elapsedtime)))
+                print("  %s" % " ".join(quote(str(x)) for x in command))
                 js_interesting.deleteLogs(prefix)
+                if not i:
+                    return (js_interesting.JS_FINE, None)
+            elif oom:
+                # If the shell or python hit a memory limit, we consider the rest of the computation
+                # "tainted" for the purpose of correctness comparison.
+                message = "compare_jit is not comparing output: OOM"
+                print("%s | %s" % (str(infilename), js_interesting.summaryString(
+                    r.issues + [message], r.lev, r.runinfo.elapsedtime)))
+                js_interesting.deleteLogs(prefix)
+                if not i:
+                    return (js_interesting.JS_FINE, None)
+            elif not i:
+                # Stash output from this run (the first one), so for subsequent runs, we can compare against it.
+                (r0, prefix0) = (r, prefix)  # pylint: disable=invalid-name
+            else:
+                # Compare the output of this run to the output of the first run, using the digests of both.
+                # The full outputs are only looked at (from the spools) for the summary of a mismatch.
+
+                def optionDisabledAsmOnOneSide():  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
+                    # pylint: disable=missing-return-type-doc
+                    # pylint: disable=cell-var-from-loop
+                    optionDisabledAsm = r0.scan.asm_disabled or r.scan.asm_disabled  # pylint: disable=invalid-name
+                    # pylint: disable=invalid-name
+                    optionDiffers = (("--no-asmjs" in commands[0]) != ("--no-asmjs" in command))
+                    return optionDisabledAsm and optionDiffers
+
+                # pylint: disable=invalid-name
+                mismatchErr = (r.scan.err_digest != r0.scan.err_digest and not optionDisabledAsmOnOneSide())
+                mismatchOut = (r.scan.out_digest != r0.scan.out_digest)  # pylint: disable=invalid-name
+
+                if mismatchErr or mismatchOut:
+                    # Generate a short summary for stdout and a long summary for a "*-summary.txt" file.
+                    # pylint: disable=invalid-name
+                    rerunCommand = " ".join(quote(str(x)) for x in ["python -m funfuzz.js.compare_jit",
+                                                                    "--flags=" + " ".join(flags),
+                                                                    "--timeout=" + str(options.timeout),
+                                                                    str(options.knownPath),
+                                                                    str(jsEngine),
+                                                                    str(infilename.name)])
+                    r0.save_logs()
+                    r.save_logs()
+                    (summary, issues) = summarizeMismatch(mismatchErr, mismatchOut, prefix0, prefix)
+                    summary = ("  " + " ".join(quote(str(x)) for x in commands[0]) + "\n  " +
+                               " ".join(quote(str(x)) for x in command) + "\n\n" + summary)
+                    summary_log = (logPrefix.parent / (logPrefix.stem + "-summary")).with_suffix(".txt")
+                    with io.open(str(summary_log), "w", encoding="utf-8", errors="replace") as f:
+                        f.write(rerunCommand + "\n\n" + summary)
+                    print("%s | %s" % (str(infilename), js_interesting.summaryString(
+                        issues, js_interesting.JS_OVERALL_MISMATCH, r.runinfo.elapsedtime)))
+                    if quickMode:
+                        print(rerunCommand)
+                    if showDetailedDiffs:
+                        print(summary)
+                        print()
+                    # Create a crashInfo object with empty stdout, and stderr showing diffs
+                    pc = js_interesting.program_configuration(jsEngine)  # pylint: disable=invalid-name
+                    pc.addProgramArguments(flags)
+                    crashInfo = CrashInfo.CrashInfo.fromRawCrashData([], summary, pc)  # pylint: disable=invalid-name
+                    return (js_interesting.JS_OVERALL_MISMATCH, crashInfo)
+                else:
+                    # print "compare_jit: match"
+                    js_interesting.deleteLogs(prefix)
+    finally:
+        cancel.set()
+        if pool:
+            pool.close()
+            pool.join()
+        for leftover_prefix in prefixes[compared:]:
+            js_interesting.deleteLogs(leftover_prefix)
 
     # All matched :)
     js_interesting.deleteLogs(prefix0)
@@ -244,10 +327,11 @@ def diffFiles(f1, f2):  # pylint: disable=invalid-name,missing-param-doc,missing
     """Return a command to diff two files, along with the diff output (if it's short)."""
     diffcmd = ["diff", "-u", str(f1), str(f2)]
     s = " ".join(diffcmd) + "\n\n"  # pylint: disable=invalid-name
-    diff = subprocess.run(diffcmd,
-                          cwd=os.getcwdu() if sys.version_info.major == 2 else os.getcwd(),  # pylint: disable=no-member
-                          stdout=subprocess.PIPE,
-                          timeout=99).stdout.decode("utf-8", errors="replace")
+    with io.open(str(f1), "r", encoding="utf-8", errors="replace") as f:
+        lines1 = f.readlines()
+    with io.open(str(f2), "r", encoding="utf-8", errors="replace") as f:
+        lines2 = f.readlines()
+    diff = "".join(difflib.unified_diff(lines1, lines2, str(f1), str(f2)))
     if len(diff) < 10000:
         s += diff + "\n\n"  # pylint: disable=invalid-name
     else:
@@ -279,6 +363,10 @@ def parseOptions(args):  # pylint: disable=invalid-name
                       dest="flagsSpaceSep",
                       default="",
                       help="space-separated list of one set of flags")
+    parser.add_option("--jobs",
+                      type="int", dest="jobs",
+                      default=1,
+                      help="number of flag combinations to run at the same time")
     options, args = parser.parse_args(args)
     if len(args) != 3:
         raise Exception("Wrong number of positional arguments. Need 3 (knownPath, jsengine, infilename).")
@@ -297,25 +385,39 @@ def parseOptions(args):  # pylint: disable=invalid-name
     return options
 
 
+# Same as js_interesting.parsed_options
+@lru_cache(maxsize=64)
+def parsed_options(args):  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
+    return parseOptions(list(args))
+
+
 # For use by Lithium and autobisectjs. (autobisectjs calls init multiple times because it changes the js engine name)
 def init(args):
     global gOptions  # pylint: disable=invalid-name,global-statement
-    gOptions = parseOptions(args)
+    gOptions = parsed_options(tuple(args))
 
 
-# FIXME: _args is unused here, we should check if it can be removed?  # pylint: disable=fixme
-def interesting(_args, cwd_prefix):
+def interesting(args, cwd_prefix):
     cwd_prefix = Path(cwd_prefix)  # Lithium uses this function and cwd_prefix from Lithium is not a Path
-    actualLevel = compareLevel(  # pylint: disable=invalid-name
-        gOptions.jsengine, gOptions.flags, gOptions.infilename, cwd_prefix, gOptions, False, False)[0]
-    return actualLevel >= gOptions.minimumInterestingLevel
+    options = parsed_options(tuple(args))
+
+    def test():  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
+        start_time = time.time()
+        actualLevel = compareLevel(  # pylint: disable=invalid-name
+            options.jsengine, options.flags, options.infilename, cwd_prefix, options, False, False, options.jobs)[0]
+        # A combination may have hit the timeout, which compareLevel does not report, so do not remember slow results
+        return actualLevel >= options.minimumInterestingLevel, time.time() - start_time < options.timeout
+
+    scope = ("compare_jit", capability_db.binary_hash(options.jsengine), tuple(options.flags),
+             options.minimumInterestingLevel, options.timeout, str(options.knownPath))
+    return result_cache.cached_result(scope, options.infilename, test)
 
 
 def main():
     options = parseOptions(sys.argv[1:])
     print(compareLevel(
         options.jsengine, options.flags, options.infilename,  # pylint: disable=no-member
-        Path(tempfile.mkdtemp("compare_jitmain")), options, True, False)[0])
+        Path(tempfile.mkdtemp("compare_jitmain")), options, True, False, options.jobs)[0])  # pylint: disable=no-member
 
 
 if __name__ == "__main__":
@@ -13,12 +13,16 @@ from builtins import object
 import copy
 import io
 import multiprocessing
+from multiprocessing.pool import ThreadPool
 from optparse import OptionParser  # pylint: disable=deprecated-module
 import os
 import platform
+import re
 import shutil
 import sys
 import tarfile
+import tempfile
+import threading
 
 from pkg_resources import parse_version
 from shellescape import quote
@@ -33,14 +37,18 @@ from ..util import subprocesses as sps
 from ..util.lock_dir import LockDir
 
 if sys.version_info.major == 2:
+    from Queue import Queue  # pylint: disable=import-error
     if os.name == "posix":
         import subprocess32 as subprocess  # pylint: disable=import-error
     from pathlib2 import Path
 else:
     from pathlib import Path  # pylint: disable=import-error
+    from queue import Queue  # pylint: disable=import-error
     import subprocess
 
 S3_SHELL_CACHE_DIRNAME = "shell-cache"  # Used by autobisectjs
+# Shell cache entries are named after the shell type and the short changeset hash
+HG_HASH_RE = re.compile(r"^[0-9a-f]{12}$")
 
 if platform.system() == "Windows":
     MAKE_BINARY = "mozmake"
@@ -75,11 +83,16 @@ class CompiledShell(object):  # pylint: disable=too-many-instance-attributes,too
     Args:
         build_opts (object): Object containing the build options defined in build_options.py
         hg_hash (str): Changeset hash
+        repo_dir (Path): Source tree to compile from, e.g. a share of the repository, defaults to the repository in
+                         build_opts
+        compilation_jobs (int): Number of jobs make runs at once, defaults to COMPILATION_JOBS
     """
-    def __init__(self, build_opts, hg_hash):
+    def __init__(self, build_opts, hg_hash, repo_dir=None, compilation_jobs=None):
         self.shell_name_without_ext = build_options.computeShellName(build_opts, hg_hash)
         self.hg_hash = hg_hash
         self.build_opts = build_opts
+        self.repo_dir = repo_dir
+        self.compilation_jobs = compilation_jobs or COMPILATION_JOBS
 
         self.js_objdir = ""
 
@@ -200,6 +213,14 @@ class CompiledShell(object):  # pylint: disable=too-many-instance-attributes,too
         """
         return self.full_env
 
+    def get_compilation_jobs(self):
+        """Retrieve the number of jobs make runs at once.
+
+        Returns:
+            int: Number of make jobs
+        """
+        return self.compilation_jobs
+
     def get_hg_hash(self):
         """Retrieve the hash of the current changeset of the repository.
 
@@ -234,12 +255,12 @@ class CompiledShell(object):  # pylint: disable=too-many-instance-attributes,too
         self.js_objdir = objdir
 
     def get_repo_dir(self):
-        """Retrieve the directory of a Mercurial repository.
+        """Retrieve the directory of the Mercurial repository the shell is compiled from.
 
         Returns:
             Path: Full path to the repository
         """
-        return self.build_opts.repo_dir
+        return self.repo_dir or self.build_opts.repo_dir
 
     def get_repo_name(self):
         """Retrieve the name of a Mercurial repository.
@@ -572,7 +593,7 @@ def sm_compile(shell):
     Returns:
         Path: Path to the compiled shell
     """
-    cmd_list = [MAKE_BINARY, "-C", str(shell.get_js_objdir()), "-j" + str(COMPILATION_JOBS), "-s"]
+    cmd_list = [MAKE_BINARY, "-C", str(shell.get_js_objdir()), "-j" + str(shell.get_compilation_jobs()), "-s"]
     # Note that having a non-zero exit code does not mean that the operation did not succeed,
     # for example when compiling a shell. A non-zero exit code can appear even though a shell compiled successfully.
     # Thus, we should *not* use check=True here.
@@ -619,11 +640,14 @@ def sm_compile(shell):
     return shell.get_shell_compiled_path()
 
 
-def makeTestRev(options):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc,missing-return-type-doc
+def makeTestRev(options, prebuilder=None):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
+    # pylint: disable=missing-return-type-doc
     def testRev(rev):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc,missing-return-type-doc
         shell = CompiledShell(options.build_options, rev)
         print("Rev %s:" % rev, end=" ")
 
+        if prebuilder and not prebuilder.wait(rev):
+            return (options.compilationFailedLabel, "compilation failed")
         try:
             obtainShell(shell, updateToRev=rev)
         except (subprocess.CalledProcessError, OSError):
@@ -634,6 +658,150 @@ def makeTestRev(options):  # pylint: disable=invalid-name,missing-docstring,miss
     return testRev
 
 
+def local_cached_shell_revs(build_opts):
+    """Return the revisions whose shell, compiled with the given build options, is in the local shell cache.
+
+    Args:
+        build_opts (object): Object containing the build options defined in build_options.py
+
+    Returns:
+        set: Changeset hashes
+    """
+    prefix = build_options.computeShellType(build_opts) + "-"
+    revs = set()
+    for cache_entry in sm_compile_helpers.ensure_cache_dir(Path.home()).glob(prefix + "*"):
+        rev = cache_entry.name[len(prefix):]
+        if HG_HASH_RE.match(rev) and CompiledShell(build_opts, rev).get_shell_cache_js_bin_path().is_file():
+            revs.add(rev)
+    return revs
+
+
+def is_busted(build_opts, rev):
+    """Return whether the shell of a revision, compiled with the given build options, is known to fail compilation,
+    i.e. whether the local shell cache has a .busted file for it.
+
+    Args:
+        build_opts (object): Object containing the build options defined in build_options.py
+        rev (str): Changeset hash
+
+    Returns:
+        bool: True if the local shell cache has a .busted file for the revision
+    """
+    return CompiledShell(build_opts, rev).get_shell_cache_js_bin_path().with_suffix(".busted").is_file()
+
+
+def s3_cached_shell_revs(build_opts):
+    """Return the revisions whose shell, compiled with the given build options, can be downloaded from S3.
+
+    Args:
+        build_opts (object): Object containing the build options defined in build_options.py
+
+    Returns:
+        set: Changeset hashes, none if S3 cannot be reached
+    """
+    s3cache_obj = s3cache.S3Cache(S3_SHELL_CACHE_DIRNAME)
+    if not s3cache_obj.connect():
+        return set()
+    prefix = build_options.computeShellType(build_opts) + "-"
+    suffix = ".tar.bz2"
+    return set(name[len(prefix):-len(suffix)] for name in s3cache_obj.list_names(prefix)
+               if name.endswith(suffix) and HG_HASH_RE.match(name[len(prefix):-len(suffix)]))
+
+
+class ShellPrebuilder(object):
+    """Compile shells for revisions which are likely to be tested soon, in the background. Each compilation happens in
+    its own share of the repository, so several shells compile at the same time without touching the working directory
+    of the repository itself. Shells end up in the shell cache, where obtainShell finds them. Make jobs are shared out
+    between the background compilations and the one in the foreground, so they do not overload the machine together.
+
+    Args:
+        build_opts (object): Object containing the build options defined in build_options.py
+        jobs (int): Number of shells compiled at the same time
+    """
+    def __init__(self, build_opts, jobs):
+        self.build_opts = build_opts
+        self.work_dir = Path(tempfile.mkdtemp(prefix="prebuild-"))
+        self.free_src_dirs = Queue()
+        for slot in range(jobs):
+            self.free_src_dirs.put(self.work_dir / ("src-%d" % slot))
+        self.pool = ThreadPool(jobs)
+        self.compilation_jobs = max(COMPILATION_JOBS // (jobs + 1), 1)
+        self.builds = {}
+        self.wanted = set()
+        self.started = set()
+        self.lock = threading.Lock()
+
+    def prebuild(self, revs):
+        """Start compiling shells for revisions, unless they are compiled or being compiled already. Revisions asked
+        for earlier but not given again are not compiled anymore, if their compilation has not started yet.
+
+        Args:
+            revs (list): Changeset hashes, the ones most likely to be tested soon first
+        """
+        with self.lock:
+            self.wanted = set(revs)
+        for rev in revs:
+            shell = CompiledShell(self.build_opts, rev)
+            if (rev in self.builds and not self.builds[rev].ready()) or \
+                    shell.get_shell_cache_js_bin_path().is_file() or \
+                    shell.get_shell_cache_js_bin_path().with_suffix(".busted").is_file():
+                continue
+            self.builds[rev] = self.pool.apply_async(self._build, (rev,))
+
+    def _build(self, rev):
+        with self.lock:
+            if rev not in self.wanted:
+                return
+            self.started.add(rev)
+        src_dir = self.free_src_dirs.get()
+        try:
+            if not src_dir.is_dir():
+                subprocess.run(["hg", "--config", "extensions.share=", "share", "-U",
+                                str(self.build_opts.repo_dir), str(src_dir)],
+                               check=True,
+                               # pylint: disable=no-member
+                               cwd=os.getcwdu() if sys.version_info.major == 2 else os.getcwd(),
+                               stdout=subprocess.DEVNULL,
+                               timeout=999)
+            print("Compiling rev %s ahead of time in %s" % (rev, src_dir))
+            obtainShell(CompiledShell(self.build_opts, rev, repo_dir=src_dir, compilation_jobs=self.compilation_jobs),
+                        updateToRev=rev)
+        finally:
+            self.free_src_dirs.put(src_dir)
+
+    def wait(self, rev):
+        """Wait for the shell of a revision to be compiled, if its compilation ahead of time has started. Otherwise it
+        is not compiled in the background anymore, as the caller is about to compile it.
+
+        Args:
+            rev (str): Changeset hash
+
+        Returns:
+            bool: False if the shell failed to compile, True if it compiled or was not being compiled
+        """
+        with self.lock:
+            if rev not in self.started:
+                self.wanted.discard(rev)
+                self.builds.pop(rev, None)
+                return True
+        build = self.builds.pop(rev, None)
+        if build is None:
+            return True
+        try:
+            build.get()
+        except (subprocess.CalledProcessError, OSError):
+            return False
+        return True
+
+    def close(self):
+        """Wait for the compilations which have started, skip the others and remove the shares of the repository."""
+        with self.lock:
+            self.wanted = set()
+        self.pool.close()
+        self.pool.join()
+        sps.rm_tree_incl_readonly(self.work_dir)
+
+
 def obtainShell(shell, updateToRev=None, updateLatestTxt=False):  # pylint: disable=invalid-name,missing-param-doc
     # pylint: disable=missing-raises-doc,missing-type-doc,too-many-branches,too-complex,too-many-statements
     """Obtain a js shell. Keep the objdir for now, especially .a files, for symbols."""
@@ -655,7 +823,7 @@ def obtainShell(shell, updateToRev=None, updateLatestTxt=False):  # pylint: disa
         sps.rm_tree_incl_readonly(shell.get_shell_cache_dir())
 
     shell.get_shell_cache_dir().mkdir()
-    hg_helpers.destroyPyc(shell.build_opts.repo_dir)
+    hg_helpers.destroyPyc(shell.get_repo_dir())
 
     s3cache_obj = s3cache.S3Cache(S3_SHELL_CACHE_DIRNAME)
     use_s3cache = s3cache_obj.connect()
@@ -681,8 +849,8 @@ def obtainShell(shell, updateToRev=None, updateLatestTxt=False):  # pylint: disa
             # Print *with* a trailing newline to avoid breaking other stuff
             print("Updating to rev %s in the %s repository..." % (
                 updateToRev,
-                str(shell.build_opts.repo_dir)))
-            subprocess.run(["hg", "-R", str(shell.build_opts.repo_dir),
+                str(shell.get_repo_dir())))
+            subprocess.run(["hg", "-R", str(shell.get_repo_dir()),
                             "update", "-C", "-r", updateToRev],
                            check=True,
                            # pylint: disable=no-member
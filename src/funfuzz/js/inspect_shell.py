@@ -9,6 +9,7 @@
 
 from __future__ import absolute_import, unicode_literals  # isort:skip
 
+from builtins import object
 import json
 import os
 import platform
@@ -17,12 +18,17 @@ import sys
 from lithium.interestingness.utils import env_with_path
 from shellescape import quote
 
+from ..util import capability_db
 from ..util import subprocesses as sps
 
 if sys.version_info.major == 2:
+    from functools32 import lru_cache  # pylint: disable=import-error
     if os.name == "posix":
         import subprocess32 as subprocess  # pylint: disable=import-error
+    from pathlib2 import Path
 else:
+    from functools import lru_cache  # pylint: disable=no-name-in-module
+    from pathlib import Path  # pylint: disable=import-error
     import subprocess
 
 RUN_NSPR_LIB = ""
@@ -165,12 +171,54 @@ def testJsShellOrXpcshell(s):  # pylint: disable=invalid-name,missing-param-doc,
     return "xpcshell" if shellSupports(s, ["-e", "Components"]) else "jsShell"
 
 
+class BuildConfiguration(object):
+    """getBuildConfiguration() of a binary, with the parameters funfuzz checks available as attributes.
+
+    Args:
+        config (dict): Build configuration, as dumped by the shell
+    """
+    def __init__(self, config):
+        self.config = config
+        self.arm_simulator = bool(config.get("arm-simulator"))
+        self.asan = bool(config.get("asan"))
+        self.coverage = bool(config.get("coverage"))
+        self.debug = bool(config.get("debug"))
+        self.more_deterministic = bool(config.get("more-deterministic"))
+
+    def __getitem__(self, parameter):
+        return self.config[parameter]
+
+
+@lru_cache(maxsize=None)
+def _build_configuration(shell_path, _mtime):
+    """Retrieve getBuildConfiguration() of a binary, only running it if the capability database does not have it yet.
+    The modification time is part of the lru_cache key so that rebuilt binaries get queried again."""
+    shell_path = Path(shell_path)
+    config = capability_db.load(shell_path).get("build_configuration")
+    if not config:
+        config = json.loads(testBinary(shell_path,
+                                       ["-e", "print(JSON.stringify(getBuildConfiguration()))"],
+                                       False, stderr=subprocess.DEVNULL)[0].rstrip())
+        capability_db.record(shell_path, "build_configuration", config)
+    return BuildConfiguration(config)
+
+
+def get_build_configuration(shell_path):
+    """Retrieve the whole of getBuildConfiguration() of a binary, dumped by a single run of the shell.
+
+    Args:
+        shell_path (Path): Full path to the shell
+
+    Returns:
+        BuildConfiguration: Build configuration of the binary, shared by all callers in this process
+    """
+    return _build_configuration(str(shell_path), Path(shell_path).stat().st_mtime)
+
+
 def queryBuildConfiguration(s, parameter):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
     # pylint: disable=missing-return-type-doc,missing-type-doc
     """Test if a binary is compiled with specified parameters, in getBuildConfiguration()."""
-    return json.loads(testBinary(s,
-                                 ["-e", 'print(getBuildConfiguration()["' + parameter + '"])'],
-                                 False, stderr=subprocess.DEVNULL)[0].rstrip().lower())
+    return get_build_configuration(s)[parameter]
 
 
 def verifyBinary(sh):  # pylint: disable=invalid-name,missing-param-doc,missing-type-doc
@@ -179,14 +227,15 @@ def verifyBinary(sh):  # pylint: disable=invalid-name,missing-param-doc,missing-
 
     assert archOfBinary(binary) == ("32" if sh.build_opts.enable32 else "64")
 
+    build_config = get_build_configuration(binary)
     # Testing for debug or opt builds are different because there can be hybrid debug-opt builds.
-    assert queryBuildConfiguration(binary, "debug") == sh.build_opts.enableDbg
+    assert build_config.debug == sh.build_opts.enableDbg
 
-    assert queryBuildConfiguration(binary, "more-deterministic") == sh.build_opts.enableMoreDeterministic
-    assert queryBuildConfiguration(binary, "asan") == sh.build_opts.buildWithAsan
-    assert (queryBuildConfiguration(binary, "arm-simulator") and
+    assert build_config.more_deterministic == sh.build_opts.enableMoreDeterministic
+    assert build_config.asan == sh.build_opts.buildWithAsan
+    assert (build_config.arm_simulator and
             sh.build_opts.enable32) == sh.build_opts.enableSimulatorArm32
-    assert (queryBuildConfiguration(binary, "arm-simulator") and not
+    assert (build_config.arm_simulator and not
             sh.build_opts.enable32) == sh.build_opts.enableSimulatorArm64
     # Note that we should test whether a shell has profiling turned on or not.
     # m-c rev 324836:800a887c705e turned profiling on by default, so once this is beyond the
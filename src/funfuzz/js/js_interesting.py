@@ -10,7 +10,10 @@
 from __future__ import absolute_import, print_function, unicode_literals  # isort:skip
 
 from builtins import object
+import collections
+import copy
 import io
+import math
 from optparse import OptionParser  # pylint: disable=deprecated-module
 import os
 import platform
@@ -24,15 +27,20 @@ from shellescape import quote
 from whichcraft import which  # Once we are fully on Python 3.5+, whichcraft can be removed in favour of shutil.which
 
 from . import inspect_shell
+from ..util import capability_db
 from ..util import create_collector
 from ..util import file_manipulation
 from ..util import os_ops
+from ..util import result_cache
+from ..util import spooled_run
 
 if sys.version_info.major == 2:
+    from functools32 import lru_cache  # pylint: disable=import-error
     if os.name == "posix":
         import subprocess32 as subprocess  # pylint: disable=import-error
     from pathlib2 import Path
 else:
+    from functools import lru_cache  # pylint: disable=no-name-in-module
     from pathlib import Path  # pylint: disable=import-error
     import subprocess
 
@@ -62,22 +70,59 @@ assert len(JS_LEVEL_NAMES) == JS_LEVELS
 
 gOptions = ""  # pylint: disable=invalid-name
 VALGRIND_ERROR_EXIT_CODE = 77
-
-
-class ShellResult(object):  # pylint: disable=missing-docstring,too-many-instance-attributes,too-few-public-methods
+# Address space available to the js shell, see set_ulimit
+SHELL_ADDRESS_SPACE_LIMIT = 2 * 2**30
+# Size of core files of the js shell, see set_ulimit
+SHELL_CORE_FILE_LIMIT = 2**30 // 2
+# Lines of each log passed on to FuzzManager, the ones in between are dropped
+LOG_HEAD_LINES = 1000
+LOG_TAIL_LINES = 5000
+# Lowest timeout used when adapting timeouts to the runtime of interesting runs, see interesting
+MIN_ADAPTIVE_TIMEOUT = 5
+# Runtimes of the last interesting run, keyed on the interestingness scope and the testcase being reduced
+INTERESTING_RUNTIMES = {}
+# Parsed .fuzzmanagerconf files, see program_configuration
+PROGRAM_CONFIGURATIONS = {}
+
+
+def program_configuration(shell_path):
+    """Return the ProgramConfiguration of a compiled shell, only parsing its .fuzzmanagerconf once per process.
+
+    Cache entries are keyed on the path, mtime, inode and size of the .fuzzmanagerconf file, so a shell which gets
+    replaced (e.g. by autobisectjs) is picked up again.
+
+    Args:
+        shell_path (Path): Full path to the shell, a trailing ".exe" on Windows is ignored
+
+    Returns:
+        ProgramConfiguration: A copy of the cached configuration, which callers can add program arguments to
+    """
+    conf_path = shell_path.with_suffix(".fuzzmanagerconf")
+    assert conf_path.is_file()
+    conf_stat = conf_path.stat()
+    key = (str(conf_path), conf_stat.st_mtime, conf_stat.st_ino, conf_stat.st_size)
+    if key not in PROGRAM_CONFIGURATIONS:
+        PROGRAM_CONFIGURATIONS[key] = ProgramConfiguration.fromBinary(str(shell_path.parent / shell_path.stem))
+    pc = PROGRAM_CONFIGURATIONS[key]  # pylint: disable=invalid-name
+    return ProgramConfiguration(pc.product, pc.platform, pc.os, version=pc.version, env=dict(pc.env),
+                                args=list(pc.args), metadata=dict(pc.metadata))
+
+
+class ShellResult(object):  # pylint: disable=missing-docstring,too-many-instance-attributes
 
     # options dict should include: timeout, knownPath, collector, valgrind, shellIsDeterministic
-    def __init__(self, options, runthis, logPrefix, in_compare_jit, env=None):  # pylint: disable=too-complex
-        # pylint: disable=too-many-arguments,too-many-branches,too-many-locals,too-many-statements
+    # runner defaults to Lithium's timed_run, and can be swapped for anything with the same signature and return value,
+    # e.g. spooled_run.timed_run or persistent_shell.PersistentShell.timed_run. Runners that capture output in spools
+    # rather than log files only get their logs written out if the result is not fine, or when save_logs is called.
+    # scan can be a LogScan subclass instance, which then remains available as the scan attribute.
+    def __init__(self, options, runthis, logPrefix, in_compare_jit, env=None, runner=None, scan=None):
+        # pylint: disable=too-complex,too-many-arguments,too-many-branches,too-many-locals,too-many-statements
 
         # If Lithium uses this as an interestingness test, logPrefix is likely not a Path object, so make it one.
         logPrefix = Path(logPrefix)
         pathToBinary = runthis[0].expanduser().resolve()  # pylint: disable=invalid-name
         # This relies on the shell being a local one from compile_shell:
-        # Ignore trailing ".exe" in Win, also abspath makes it work w/relative paths like "./js"
-        # pylint: disable=invalid-name
-        assert pathToBinary.with_suffix(".fuzzmanagerconf").is_file()
-        pc = ProgramConfiguration.fromBinary(str(pathToBinary.parent / pathToBinary.stem))
+        pc = program_configuration(pathToBinary)  # pylint: disable=invalid-name
         pc.addProgramArguments(runthis[1:-1])
 
         if options.valgrind:
@@ -86,9 +131,14 @@ class ShellResult(object):  # pylint: disable=missing-docstring,too-many-instanc
                 valgrindSuppressions() +
                 runthis)
 
+        command = [str(x) for x in runthis]  # Convert all Paths/bytes to strings for Lithium
         timed_run_kw = {}
         timed_run_kw["env"] = (env or os.environ)
-        if not platform.system() == "Windows":
+        if platform.system() == "Linux":
+            # A preexec_fn may deadlock while other threads are running, e.g. in compare_jit or ParallelMinimize. The
+            # command is the same for every run, so persistent_shell keeps reusing its process.
+            command = ulimit_command(command)
+        elif not platform.system() == "Windows":
             timed_run_kw["preexec_fn"] = set_ulimit
 
         lithium_logPrefix = str(logPrefix).encode("utf-8")
@@ -98,8 +148,8 @@ class ShellResult(object):  # pylint: disable=missing-docstring,too-many-instanc
             lithium_logPrefix = lithium_logPrefix.decode("utf-8", errors="replace")
 
         # logPrefix should be a string for timed_run in Lithium version 0.2.1 to work properly, apparently
-        runinfo = timed_run.timed_run(
-            [str(x) for x in runthis],  # Convert all Paths/bytes to strings for Lithium
+        runinfo = (runner or timed_run.timed_run)(
+            command,
             options.timeout,
             lithium_logPrefix,
             **timed_run_kw)
@@ -108,37 +158,47 @@ class ShellResult(object):  # pylint: disable=missing-docstring,too-many-instanc
         issues = []
         auxCrashData = []  # pylint: disable=invalid-name
 
-        # FuzzManager expects a list of strings rather than an iterable, so bite the
-        # bullet and "readlines" everything into memory.
+        # Walk each log once, keeping only what the checks below and FuzzManager need
+        scan = scan or LogScan()
+        if options.valgrind:
+            scan.valgrind_prefix = "==" + str(runinfo.pid) + "=="
         out_log = (logPrefix.parent / (logPrefix.stem + "-out")).with_suffix(".txt")
-        with io.open(str(out_log), "r", encoding="utf-8", errors="replace") as f:
-            out = f.readlines()
         err_log = (logPrefix.parent / (logPrefix.stem + "-err")).with_suffix(".txt")
-        with io.open(str(err_log), "r", encoding="utf-8", errors="replace") as f:
-            err = f.readlines()
+        self._spools = []
+        if hasattr(runinfo.out, "read"):
+            self._spools = [(runinfo.out, out_log), (runinfo.err, err_log)]
+            scan.scan_out(spooled_run.spool_lines(runinfo.out))
+            scan.scan_err(spooled_run.spool_lines(runinfo.err))
+        else:
+            with io.open(str(out_log), "r", encoding="utf-8", errors="replace") as f:
+                scan.scan_out(f)
+            with io.open(str(err_log), "r", encoding="utf-8", errors="replace") as f:
+                scan.scan_err(f)
+        # FuzzManager expects lists of strings rather than iterables
+        out = scan.out.lines()
+        err = scan.err.lines()
 
         if options.valgrind and runinfo.return_code == VALGRIND_ERROR_EXIT_CODE:
             issues.append("valgrind reported an error")
             lev = max(lev, JS_VG_AMISS)
-            valgrindErrorPrefix = "==" + str(runinfo.pid) + "=="
-            for line in err:
-                if valgrindErrorPrefix and line.startswith(valgrindErrorPrefix):
-                    issues.append(line.rstrip())
+            issues.extend(scan.valgrind_errors)
         elif runinfo.sta == timed_run.CRASHED:
             if os_ops.grab_crash_log(runthis[0], runinfo.pid, logPrefix, True):
                 crash_log = (logPrefix.parent / (logPrefix.stem + "-crash")).with_suffix(".txt")
                 with io.open(str(crash_log), "r", encoding="utf-8", errors="replace") as f:
                     auxCrashData = [line.strip() for line in f.readlines()]
-        elif file_manipulation.amiss(logPrefix):
+        elif scan.malloc_error is not None:
+            print()
+            print(scan.malloc_error)
             issues.append("malloc error")
             lev = max(lev, JS_NEW_ASSERT_OR_CRASH)
         elif runinfo.return_code == 0 and not in_compare_jit:
             # We might have(??) run jsfunfuzz directly, so check for special kinds of bugs
-            for line in out:
-                if line.startswith("Found a bug: ") and not ("NestTest" in line and oomed(err)):
+            for line in scan.found_bugs:
+                if not ("NestTest" in line and scan.oomed):
                     lev = JS_DECIDED_TO_EXIT
                     issues.append(line.rstrip())
-            if options.shellIsDeterministic and not understoodJsfunfuzzExit(out, err) and not oomed(err):
+            if options.shellIsDeterministic and not scan.understood_exit and not scan.oomed:
                 issues.append("jsfunfuzz didn't finish")
                 lev = JS_DID_NOT_FINISH
 
@@ -193,6 +253,7 @@ class ShellResult(object):  # pylint: disable=missing-docstring,too-many-instanc
         print("%s | %s" % (logPrefix, summaryString(issues, lev, runinfo.elapsedtime)))
 
         if lev != JS_FINE:
+            self.save_logs()
             summary_log = (logPrefix.parent / (logPrefix.stem + "-summary")).with_suffix(".txt")
             with io.open(str(summary_log), "w", encoding="utf-8", errors="replace") as f:
                 f.writelines(["Number: " + str(logPrefix) + "\n",
@@ -202,12 +263,125 @@ class ShellResult(object):  # pylint: disable=missing-docstring,too-many-instanc
         self.lev = lev
         self.out = out
         self.err = err
+        self.oom = scan.oomed
+        self.scan = scan
         self.issues = issues
         self.crashInfo = crashInfo  # pylint: disable=invalid-name
         self.match = match
         self.runinfo = runinfo
         self.return_code = runinfo.return_code
 
+    def save_logs(self):
+        """Write output captured in spools to the usual -out.txt and -err.txt log files."""
+        for spool, log in self._spools:
+            spooled_run.save_spool(spool, log)
+        self._spools = []
+
+
+class LogLines(object):  # pylint: disable=too-few-public-methods
+    """Lines of a log, of which only the first and last few thousand are kept unless max_head is None.
+
+    Args:
+        max_head (int): Number of lines kept from the start of the log, or None to keep every line
+        max_tail (int): Number of lines kept from the end of the log
+    """
+    def __init__(self, max_head=LOG_HEAD_LINES, max_tail=LOG_TAIL_LINES):
+        self.max_head = max_head
+        self.head = []
+        self.tail = collections.deque(maxlen=max_tail)
+        self.count = 0
+
+    def append(self, line):
+        """Add the next line of the log.
+
+        Args:
+            line (str): Line to be added
+        """
+        self.count += 1
+        if self.max_head is None or len(self.head) < self.max_head:
+            self.head.append(line)
+        else:
+            self.tail.append(line)
+
+    def lines(self):
+        """Return the kept lines, with a note in place of the dropped ones.
+
+        Returns:
+            list: Lines of the log
+        """
+        dropped = self.count - len(self.head) - len(self.tail)
+        if not dropped:
+            return self.head + list(self.tail)
+        return self.head + ["[%d lines dropped by funfuzz]\n" % dropped] + list(self.tail)
+
+
+class LogScan(object):  # pylint: disable=too-many-instance-attributes
+    """Collect everything ShellResult needs to know about the stdout and stderr of a shell in a single pass.
+
+    Subclasses can look for more by extending scan_out_line and scan_err_line, see compare_jit.CompareJitScan.
+
+    Args:
+        valgrind_prefix (str): Prefix of valgrind's error lines on stderr, if valgrind was used
+    """
+    def __init__(self, valgrind_prefix=None):
+        self.valgrind_prefix = valgrind_prefix
+        self.out = LogLines()
+        self.err = LogLines()
+        self.found_bugs = []
+        self.valgrind_errors = []
+        self.malloc_error = None
+        self.oomed = False
+        self.understood_exit = False
+
+    def scan_out(self, lines):
+        """Go through the lines of stdout, see understoodJsfunfuzzExit.
+
+        Args:
+            lines (iterable): Lines of stdout
+        """
+        for line in lines:
+            self.scan_out_line(line)
+
+    def scan_out_line(self, line):
+        """Look at the next line of stdout.
+
+        Args:
+            line (str): Line of stdout
+        """
+        self.out.append(line)
+        if line.startswith("Found a bug: "):
+            self.found_bugs.append(line)
+            self.understood_exit = True
+        elif line.startswith(("It's looking good!", "jsfunfuzz broke its own scripting environment: ")):
+            self.understood_exit = True
+
+    def scan_err(self, lines):
+        """Go through the lines of stderr, see understoodJsfunfuzzExit, oomed and file_manipulation.amiss.
+
+        Args:
+            lines (iterable): Lines of stderr
+        """
+        for line in lines:
+            self.scan_err_line(line)
+
+    def scan_err_line(self, line):
+        """Look at the next line of stderr.
+
+        Args:
+            line (str): Line of stderr
+        """
+        self.err.append(line)
+        if "terminate called" in line or "quit called" in line or "can't allocate region" in line:
+            self.understood_exit = True
+        if not self.oomed and hitMemoryLimit(line):
+            self.oomed = True
+        if self.malloc_error is None:
+            stripped = line.strip("\x07").rstrip("\n")
+            if file_manipulation.is_malloc_error(stripped):
+                self.malloc_error = stripped
+        if self.valgrind_prefix and line.startswith(self.valgrind_prefix):
+            self.valgrind_errors.append(line.rstrip())
+
 
 def understoodJsfunfuzzExit(out, err):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
     # pylint: disable=missing-return-type-doc
@@ -274,8 +448,11 @@ def deleteLogs(logPrefix):  # pylint: disable=invalid-name,missing-param-doc,mis
     """Whoever might call baseLevel should eventually call this function (unless a bug was found)."""
     # If this turns up a WindowsError on Windows, remember to have excluded fuzzing locations in
     # the search indexer, anti-virus realtime protection and backup applications.
-    (logPrefix.parent / (logPrefix.stem + "-out")).with_suffix(".txt").unlink()
-    (logPrefix.parent / (logPrefix.stem + "-err")).with_suffix(".txt").unlink()
+    # Logs of fine results are only written out if ShellResult.save_logs was called
+    for log_type in ("out", "err"):
+        log = (logPrefix.parent / (logPrefix.stem + "-" + log_type)).with_suffix(".txt")
+        if log.is_file():
+            log.unlink()
     crash_log = (logPrefix.parent / (logPrefix.stem + "-crash")).with_suffix(".txt")
     if crash_log.is_file():
         crash_log.unlink()
@@ -295,17 +472,33 @@ def set_ulimit():
         import resource  # pylint: disable=import-error
 
         # log.debug("Limit address space to 2GB (or 1GB on ARM boards such as ODROID)")
-        giga_byte = 2**30
-        resource.setrlimit(resource.RLIMIT_AS, (2 * giga_byte, 2 * giga_byte))  # pylint: disable=no-member
+        resource.setrlimit(resource.RLIMIT_AS,  # pylint: disable=no-member
+                           (SHELL_ADDRESS_SPACE_LIMIT, SHELL_ADDRESS_SPACE_LIMIT))
 
         # log.debug("Limit corefiles to 0.5 GB")
-        half_giga_byte = int(giga_byte // 2)
-        resource.setrlimit(resource.RLIMIT_CORE, (half_giga_byte, half_giga_byte))  # pylint: disable=no-member
+        resource.setrlimit(resource.RLIMIT_CORE,  # pylint: disable=no-member
+                           (SHELL_CORE_FILE_LIMIT, SHELL_CORE_FILE_LIMIT))
     except ImportError:
         # log.debug("Skipping resource import as a non-POSIX platform was detected: %s", platform.system())
         return
 
 
+def ulimit_command(command):
+    """Return a command which sets the same resource limits as set_ulimit, then replaces itself with the given command,
+    which thus keeps the process ID. Unlike set_ulimit as a preexec_fn, this is safe while other threads are running.
+
+    Args:
+        command (list): Command with arguments
+
+    Returns:
+        list: Command with arguments, run by /bin/sh
+    """
+    # Some shells, e.g. dash, only take one limit per ulimit command
+    limits = 'ulimit -v %d && ulimit -c %d && exec "$@"' % (
+        SHELL_ADDRESS_SPACE_LIMIT // 1024, SHELL_CORE_FILE_LIMIT // 1024)
+    return ["/bin/sh", "-c", limits, "sh"] + command
+
+
 def parseOptions(args):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc,missing-return-type-doc
     parser = OptionParser()
     parser.disable_interspersed_args()
@@ -325,6 +518,12 @@ def parseOptions(args):  # pylint: disable=invalid-name,missing-docstring,missin
                       type="int", dest="timeout",
                       default=120,
                       help="timeout in seconds")
+    parser.add_option("--timeout-multiplier",
+                      type="float", dest="timeout_multiplier",
+                      default=0,
+                      help="when used by Lithium, kill the shell after this many times the runtime of the last "
+                           "interesting run of the testcase being reduced, within %d seconds and --timeout. "
+                           "Defaults to 0 (always use --timeout)" % MIN_ADAPTIVE_TIMEOUT)
     options, args = parser.parse_args(args)
     if len(args) < 2:
         raise Exception("Not enough positional arguments")
@@ -333,8 +532,8 @@ def parseOptions(args):  # pylint: disable=invalid-name,missing-docstring,missin
     assert options.jsengineWithArgs[0].is_file()  # js shell
     assert options.jsengineWithArgs[-1].is_file()  # testcase
     options.collector = create_collector.make_collector()
-    options.shellIsDeterministic = inspect_shell.queryBuildConfiguration(
-        options.jsengineWithArgs[0], "more-deterministic")
+    options.shellIsDeterministic = inspect_shell.get_build_configuration(
+        options.jsengineWithArgs[0]).more_deterministic
 
     return options
 
@@ -342,24 +541,53 @@ def parseOptions(args):  # pylint: disable=invalid-name,missing-docstring,missin
 # loop uses parseOptions and ShellResult [with in_compare_jit = False]
 # compare_jit uses ShellResult [with in_compare_jit = True]
 
+# Lithium, run in-process, calls init once per reduction step with the same args (see run_lithium), and a parallel
+# Lithium calls interesting with one set of args per job (see ParallelMinimize): only parse each of them once.
+@lru_cache(maxsize=64)
+def parsed_options(args):  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
+    return parseOptions(list(args))
+
+
 # For use by Lithium and autobisectjs. (autobisectjs calls init multiple times because it changes the js engine name)
 def init(args):  # pylint: disable=missing-docstring
     global gOptions  # pylint: disable=global-statement,invalid-name
-    gOptions = parseOptions(args)
+    gOptions = parsed_options(tuple(args))
 
 
-# FIXME: _args is unused here, we should check if it can be removed?  # pylint: disable=fixme
-def interesting(_args, cwd_prefix):  # pylint: disable=missing-docstring,missing-return-doc
+def interesting(args, cwd_prefix):  # pylint: disable=missing-docstring,missing-return-doc
     # pylint: disable=missing-return-type-doc
     cwd_prefix = Path(cwd_prefix)  # Lithium uses this function and cwd_prefix from Lithium is not a Path
-    options = gOptions
-    # options, runthis, logPrefix, in_compare_jit
-    res = ShellResult(options, options.jsengineWithArgs, cwd_prefix, False)
-    out_log = (cwd_prefix.parent / (cwd_prefix.stem + "-out")).with_suffix(".txt")
-    err_log = (cwd_prefix.parent / (cwd_prefix.stem + "-err")).with_suffix(".txt")
-    truncateFile(out_log, 1000000)
-    truncateFile(err_log, 1000000)
-    return res.lev >= gOptions.minimumInterestingLevel
+    options = parsed_options(tuple(args))
+    shell = options.jsengineWithArgs[0]
+    scope = ("js_interesting", capability_db.binary_hash(shell), tuple(str(x) for x in options.jsengineWithArgs[1:-1]),
+             options.minimumInterestingLevel, options.timeout, options.valgrind, str(options.knownPath))
+
+    # Candidates of a parallel Lithium run are copies of the testcase given to init, they share its runtime
+    runtime_key = (scope, str((gOptions or options).jsengineWithArgs[-1]))
+    run_options = options
+    if options.timeout_multiplier and runtime_key in INTERESTING_RUNTIMES:
+        run_options = copy.copy(options)
+        run_options.timeout = min(options.timeout, max(MIN_ADAPTIVE_TIMEOUT, int(math.ceil(
+            INTERESTING_RUNTIMES[runtime_key] * options.timeout_multiplier))))
+
+    def test():  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
+        # options, runthis, logPrefix, in_compare_jit
+        res = ShellResult(run_options, options.jsengineWithArgs, cwd_prefix, False)
+        out_log = (cwd_prefix.parent / (cwd_prefix.stem + "-out")).with_suffix(".txt")
+        err_log = (cwd_prefix.parent / (cwd_prefix.stem + "-err")).with_suffix(".txt")
+        truncateFile(out_log, 1000000)
+        truncateFile(err_log, 1000000)
+        is_interesting = res.lev >= options.minimumInterestingLevel
+        timed_out = res.runinfo.sta == timed_run.TIMED_OUT
+        if timed_out:
+            # Not the same as not interesting: the result is not remembered, and the testcase may be tried again
+            print("Timed out after %d seconds%s" % (
+                run_options.timeout, " (adapted to earlier runs)" if run_options is not options else ""))
+        elif is_interesting:
+            INTERESTING_RUNTIMES[runtime_key] = res.runinfo.elapsedtime
+        return is_interesting, not timed_out
+
+    return result_cache.cached_result(scope, options.jsengineWithArgs[-1], test)
 
 
 # For direct, manual use
@@ -13,16 +13,26 @@ import io
 import json
 from optparse import OptionParser  # pylint: disable=deprecated-module
 import os
+import shutil
 import sys
 import time
+import traceback
+
+import FTB.Signatures.CrashInfo as CrashInfo
+import lithium.interestingness.timed_run as timed_run
 
 from . import compare_jit
 from . import js_interesting
 from . import link_fuzzer
+from . import persistent_shell
 from . import shell_flags
 from ..util import create_collector
 from ..util import file_manipulation
 from ..util import lithium_helpers
+from ..util import reduction_queue
+from ..util import run_metrics
+from ..util import signature_index
+from ..util import spooled_run
 from ..util import subprocesses as sps
 
 if sys.version_info.major == 2:
@@ -42,6 +52,32 @@ def parseOpts(args):  # pylint: disable=invalid-name,missing-docstring,missing-r
                       default=False,
                       help="After running the fuzzer, run the FCM lines against the engine "
                            "in two configurations and compare the output.")
+    parser.add_option("--compare-jit-jobs",
+                      type="int", dest="compare_jit_jobs",
+                      default=1,
+                      help="Number of compare_jit flag combinations to run at the same time, "
+                           "also while reducing mismatches. Defaults to 1.")
+    parser.add_option("--lithium-jobs",
+                      type="int", dest="lithium_jobs",
+                      default=1,
+                      help="Number of chunk removals Lithium tests at the same time while reducing, "
+                           "each on its own copy of the testcase. Defaults to 1.")
+    parser.add_option("--reduction-timeout-multiplier",
+                      type="float", dest="reduction_timeout_multiplier",
+                      default=4,
+                      help="While reducing, kill the js shell after this many times the runtime of the last "
+                           "interesting run instead of after the full timeout. Defaults to 4, 0 disables this.")
+    parser.add_option("--metrics-file",
+                      action="store", dest="metrics_file",
+                      default=None,
+                      help="Append one JSON line per shell run, queued testcase and reduction to this file, along "
+                           "with a summary of the throughput every minute. The file may be shared with other loop "
+                           "processes.")
+    parser.add_option("--metrics-port",
+                      type="int", dest="metrics_port",
+                      default=0,
+                      help="Serve the throughput metrics as JSON over HTTP on this port of the local host. "
+                           "Defaults to 0 (disabled).")
     parser.add_option("--random-flags",
                       action="store_true", dest="randomFlags",
                       default=False,
@@ -58,6 +94,22 @@ def parseOpts(args):  # pylint: disable=invalid-name,missing-docstring,missing-r
                       action="store_true", dest="valgrind",
                       default=False,
                       help="use valgrind with a reasonable set of options")
+    parser.add_option("--persistent-seeds",
+                      type="int", dest="persistent_seeds",
+                      default=0,
+                      help="Keep one js shell process alive for up to this many fuzz seeds, "
+                           "instead of starting a fresh one each iteration. Defaults to 0 (disabled).")
+    parser.add_option("--reduction-queue",
+                      action="store", dest="reduction_queue",
+                      default=None,
+                      help="Queue interesting testcases in this directory for reducer processes to reduce, "
+                           "instead of reducing them in this process. See reduce_queued.")
+    parser.add_option("--signature-index",
+                      action="store", dest="signature_index",
+                      default=None,
+                      help="Record crash signatures in this directory, which may be shared with other loop "
+                           "processes, so only the first testcase with each signature gets reduced. "
+                           "Defaults to a directory private to this process, removed when it runs out of time.")
     options, args = parser.parse_args(args)
 
     # optparse does not recognize pathlib - we will need to move to argparse
@@ -68,6 +120,9 @@ def parseOpts(args):  # pylint: disable=invalid-name,missing-docstring,missing-r
 
     if options.valgrind and options.use_compare_jit:
         print("Note: When running compare_jit, the --valgrind option will be ignored")
+    if options.valgrind and options.persistent_seeds:
+        print("Note: When running valgrind, the --persistent-seeds option will be ignored")
+        options.persistent_seeds = 0
 
     # kill js shell if it runs this long.
     # jsfunfuzz will quit after half this time if it's not ilooping.
@@ -140,11 +195,35 @@ def many_timed_runs(targetTime, wtmpDir, args, collector, ccoverage):  # pylint:
     link_fuzzer.link_fuzzer(fuzzjs, regressionTestPrologue)
     assert fuzzjs.is_file()
 
+    shell = None
+    if options.persistent_seeds:
+        # fuzzjs itself is left alone, it is still what testcases get spliced into
+        persistent_fuzzjs = wtmpDir / "jsfunfuzz-persistent.js"
+        persistent_shell.make_persistent_fuzzer(fuzzjs, persistent_fuzzjs)
+        shell = persistent_shell.PersistentShell(wtmpDir / "persistent-out.txt", options.persistent_seeds)
+
+    # Without a shared index, only this process reads it, so it is removed along with wtmpDir when out of time
+    signature_index_dir = options.signature_index or wtmpDir / "signature-index"
+
+    metrics = run_metrics.RunMetrics(options.metrics_file)
+    metrics_server = metrics.serve(options.metrics_port) if options.metrics_port else None
+
     iteration = 0
     while True:
+        metrics.maybe_write_summary()
         if targetTime and time.time() > startTime + targetTime:
             print("Out of time!")
+            metrics.maybe_write_summary(force=True)
+            if metrics_server:
+                metrics_server.shutdown()
+                metrics_server.server_close()
             fuzzjs.unlink()
+            if shell:
+                shell.close()
+                persistent_fuzzjs.unlink()
+                shell.session_log.unlink()
+            if not options.signature_index and signature_index_dir.is_dir():
+                shutil.rmtree(str(signature_index_dir))
             if not os.listdir(str(wtmpDir)):
                 wtmpDir.rmdir()
             break
@@ -157,10 +236,12 @@ def many_timed_runs(targetTime, wtmpDir, args, collector, ccoverage):  # pylint:
         js_interesting_args.append(str(options.knownPath))
         js_interesting_args.append(str(options.jsEngine))
         if options.randomFlags:
-            engineFlags = shell_flags.random_flag_set(options.jsEngine)  # pylint: disable=invalid-name
+            # A persistent shell keeps its flags until it has to be restarted anyway
+            if not (shell and shell.is_alive()):
+                engineFlags = shell_flags.random_flag_set(options.jsEngine)  # pylint: disable=invalid-name
             js_interesting_args.extend(engineFlags)
         js_interesting_args.extend(["-e", "maxRunTime=" + str(options.timeout * (1000 // 2))])
-        js_interesting_args.extend(["-f", fuzzjs])
+        js_interesting_args.extend(["-f", persistent_fuzzjs if shell else fuzzjs])
         js_interesting_options = js_interesting.parseOptions(js_interesting_args)
 
         iteration += 1
@@ -175,7 +256,15 @@ def many_timed_runs(targetTime, wtmpDir, args, collector, ccoverage):  # pylint:
 
         res = js_interesting.ShellResult(js_interesting_options,
                                          # pylint: disable=no-member
-                                         js_interesting_options.jsengineWithArgs, logPrefix, False, env=env)
+                                         js_interesting_options.jsengineWithArgs, logPrefix, False, env=env,
+                                         runner=(shell.timed_run if shell else spooled_run.timed_run))
+        metrics.record_run(res.runinfo.elapsedtime, res.lev, res.runinfo.sta == timed_run.TIMED_OUT, res.oom,
+                           res.runinfo.sta == timed_run.CRASHED, engineFlags)
+        frc_log = (logPrefix.parent / (logPrefix.stem + "-out")).with_suffix(".txt")
+        if shell and (res.lev != js_interesting.JS_FINE or res.oom):
+            # The bug may depend on what earlier seeds left behind, so reproduce it using all of them
+            frc_log = shell.session_log
+            shell.close()
 
         if res.lev != js_interesting.JS_FINE:
             out_log = (logPrefix.parent / (logPrefix.stem + "-out")).with_suffix(".txt")
@@ -187,7 +276,7 @@ def many_timed_runs(targetTime, wtmpDir, args, collector, ccoverage):  # pylint:
             reduced_log = (logPrefix.parent / (logPrefix.stem + "-reduced")).with_suffix(".js")
             [before, after] = file_manipulation.fuzzSplice(fuzzjs)
 
-            with io.open(str(out_log), "r", encoding="utf-8", errors="replace") as f:
+            with io.open(str(frc_log), "r", encoding="utf-8", errors="replace") as f:
                 newfileLines = before + [  # pylint: disable=invalid-name
                     l.replace("/*FRC-", "/*") for l in file_manipulation.linesStartingWith(f, "/*FRC-")] + after
             orig_log = (logPrefix.parent / (logPrefix.stem + "-orig")).with_suffix(".js")
@@ -204,41 +293,36 @@ def many_timed_runs(targetTime, wtmpDir, args, collector, ccoverage):  # pylint:
                     itest.append("--valgrind")
                 itest.append("--minlevel=" + str(res.lev))
                 itest.append("--timeout=" + str(options.timeout))
+                if options.reduction_timeout_multiplier:
+                    itest.append("--timeout-multiplier=" + str(options.reduction_timeout_multiplier))
                 itest.append(options.knownPath)
-                (lithResult, _lithDetails, autoBisectLog) = lithium_helpers.pinpoint(  # pylint: disable=invalid-name
-                    itest, logPrefix, options.jsEngine, engineFlags, reduced_log, options.repo,
-                    options.build_options_str, targetTime, res.lev)
-
-                # Upload with final output
-                if lithResult == lithium_helpers.LITH_FINISHED:
-                    # pylint: disable=no-member
-                    fargs = js_interesting_options.jsengineWithArgs[:-1] + [reduced_log]
-                    # pylint: disable=invalid-name
-                    retestResult = js_interesting.ShellResult(js_interesting_options,
-                                                              fargs,
-                                                              logPrefix.parent / (logPrefix.stem + "-final"),
-                                                              False)
-                    if retestResult.lev > js_interesting.JS_FINE:
-                        res = retestResult
-                        quality = 0
-                    else:
-                        quality = 6
-                else:
-                    quality = 10
-
-                print("Submitting %s (quality=%s) at %s" % (reduced_log, quality, time.asctime()))
 
-                metadata = {}
-                if autoBisectLog:
-                    metadata = {"autoBisectLog": "".join(autoBisectLog)}
-                collector.submit(res.crashInfo, str(reduced_log), quality, metaData=metadata)
-                print("Submitted %s" % reduced_log)
+                key = signature_index.signature_key(res.crashInfo, res.issues)
+                seen = signature_index.SignatureIndex(signature_index_dir).record(key, reduced_log)
+                if seen.count > 1:
+                    print("Signature %s was seen %d times since %s, first in %s" % (
+                        key, seen.count, time.ctime(seen.first_seen), seen.first_testcase))
+
+                if options.reduction_queue:
+                    queue = reduction_queue.ReductionQueue(options.reduction_queue)
+                    if enqueue_reduction(queue, key, seen, res, logPrefix, reduced_log, itest, js_interesting_args,
+                                         engineFlags, options, targetTime):
+                        metrics.record_queued(queue.counts()["pending"])
+                elif seen.first_testcase == str(reduced_log):
+                    reduction_start = time.time()
+                    reduce_and_submit(collector, res.crashInfo, res.lev, js_interesting_options, itest, logPrefix,
+                                      engineFlags, reduced_log, options.repo, options.build_options_str, targetTime,
+                                      options.lithium_jobs)
+                    metrics.record_reduction(time.time() - reduction_start)
+                else:
+                    print("Not reducing %s, the first testcase with this signature is reduced instead" % reduced_log)
 
         else:
             are_flags_deterministic = "--dump-bytecode" not in engineFlags and "-D" not in engineFlags
             # pylint: disable=no-member
             if options.use_compare_jit and res.lev == js_interesting.JS_FINE and \
                     js_interesting_options.shellIsDeterministic and are_flags_deterministic:
+                res.save_logs()
                 out_log = (logPrefix.parent / (logPrefix.stem + "-out")).with_suffix(".txt")
                 linesToCompare = jitCompareLines(out_log, "/*FCM*/")  # pylint: disable=invalid-name
                 jitcomparefilename = (logPrefix.parent / (logPrefix.stem + "-cj-in")).with_suffix(".js")
@@ -247,13 +331,221 @@ def many_timed_runs(targetTime, wtmpDir, args, collector, ccoverage):  # pylint:
                 if not ccoverage:
                     compare_jit.compare_jit(options.jsEngine, engineFlags, jitcomparefilename,
                                             logPrefix.parent / (logPrefix.stem + "-cj"), options.repo,
-                                            options.build_options_str, targetTime, js_interesting_options)
+                                            options.build_options_str, targetTime, js_interesting_options,
+                                            options.compare_jit_jobs, options.lithium_jobs)
                 if jitcomparefilename.is_file():
                     jitcomparefilename.unlink()
 
             js_interesting.deleteLogs(logPrefix)
 
 
+def reduce_and_submit(collector, crash_info, lev, js_interesting_options, itest, log_prefix, engine_flags,
+                      reduced_log, repo, build_options_str, target_time, lithium_jobs=1):
+    # pylint: disable=too-many-arguments,too-many-locals
+    """Run Lithium and autobisectjs on an interesting testcase, then submit it to FuzzManager.
+
+    Args:
+        collector (Collector): FuzzManager collector
+        crash_info (CrashInfo): What was found when running the original testcase, submitted if the reduced testcase
+                                no longer reproduces
+        lev (int): js_interesting level of the original testcase
+        js_interesting_options (object): js_interesting options the original testcase was run with
+        itest (list): Lithium interestingness test with its arguments
+        log_prefix (Path): Prefix of the log files
+        engine_flags (list): Flags the js shell was run with
+        reduced_log (Path): Testcase, which gets reduced in place
+        repo (Path): Repository for autobisectjs
+        build_options_str (str): Build options for autobisectjs
+        target_time (int): Nominal amount of time to run, in seconds
+        lithium_jobs (int): Number of chunk removals Lithium tests at the same time
+
+    Returns:
+        int: Quality of the submitted testcase
+    """
+    (lith_result, _lith_details, autobisect_log, stage_stats) = lithium_helpers.pinpoint(
+        itest, log_prefix, js_interesting_options.jsengineWithArgs[0], engine_flags, reduced_log, repo,
+        build_options_str, target_time, lev, lithium_jobs)
+
+    # Upload with final output
+    if lith_result == lithium_helpers.LITH_FINISHED:
+        fargs = js_interesting_options.jsengineWithArgs[:-1] + [reduced_log]
+        retest_result = js_interesting.ShellResult(js_interesting_options,
+                                                   fargs,
+                                                   log_prefix.parent / (log_prefix.stem + "-final"),
+                                                   False)
+        if retest_result.lev > js_interesting.JS_FINE:
+            crash_info = retest_result.crashInfo
+            quality = 0
+        else:
+            quality = 6
+    else:
+        quality = 10
+
+    print("Submitting %s (quality=%s) at %s" % (reduced_log, quality, time.asctime()))
+
+    metadata = lithium_helpers.stage_metadata(stage_stats)
+    if autobisect_log:
+        metadata["autoBisectLog"] = "".join(autobisect_log)
+    collector.submit(crash_info, str(reduced_log), quality, metaData=metadata)
+    print("Submitted %s" % reduced_log)
+    return quality
+
+
+def enqueue_reduction(queue, key, seen, res, log_prefix, reduced_log, itest, js_interesting_args, engine_flags,
+                      options, target_time):
+    # pylint: disable=too-many-arguments,too-many-locals
+    """Queue an interesting testcase for reduce_queued. If a testcase with the same signature was queued before and is
+    still waiting, it is replaced if this one is the shortest seen so far.
+
+    Args:
+        queue (ReductionQueue): Reduction queue
+        key (str): Signature key of the testcase
+        seen (SignatureEntry): Occurrences of the signature so far, including this one
+        res (ShellResult): Result of running the original testcase
+        log_prefix (Path): Prefix of the log files
+        reduced_log (Path): Testcase to be reduced
+        itest (list): Lithium interestingness test with its arguments
+        js_interesting_args (list): js_interesting arguments the original testcase was run with
+        engine_flags (list): Flags the js shell was run with
+        options (object): loop options
+        target_time (int): Nominal amount of time to run, in seconds
+
+    Returns:
+        bool: True if the testcase was queued, or replaced a queued one
+    """
+    crash_log = (log_prefix.parent / (log_prefix.stem + "-crash")).with_suffix(".txt")
+    aux_crash_data = []
+    if crash_log.is_file():
+        with io.open(str(crash_log), "r", encoding="utf-8", errors="replace") as f:
+            aux_crash_data = [line.strip() for line in f]
+    job = {
+        "itest": itest,
+        # The testcase itself is appended by the reducer, as it is going to live elsewhere
+        "js_interesting_args": [str(x) for x in js_interesting_args[:-1]],
+        "engine_flags": engine_flags,
+        "lev": res.lev,
+        "out": res.out,
+        "err": res.err,
+        "aux_crash_data": aux_crash_data,
+        "repo": str(options.repo),
+        "build_options_str": options.build_options_str,
+        "target_time": target_time,
+        "lithium_jobs": options.lithium_jobs,
+    }
+    if queue.enqueue(key, job, {"w-reduced.js": reduced_log}):
+        print("Queued %s for reduction as %s" % (reduced_log, key))
+        return True
+    if seen.shortest_testcase == str(reduced_log) and queue.update_pending(key, {"w-reduced.js": reduced_log}):
+        print("Queued %s for reduction as %s, instead of a longer testcase" % (reduced_log, key))
+        return True
+    print("Not queueing %s for reduction, its signature %s was queued before" % (reduced_log, key))
+    return False
+
+
+def reduce_queued(queue_dir, collector, deadline, metrics=None, poll_interval=10):
+    """Reduce and submit testcases queued by enqueue_reduction until the deadline, one at a time.
+
+    Args:
+        queue_dir (Path): Reduction queue directory
+        collector (Collector): FuzzManager collector
+        deadline (float): Time after which no more jobs are started
+        metrics (RunMetrics): Metrics to record the reductions in, if any
+        poll_interval (float): Number of seconds to wait for a job when the queue is empty
+    """
+    metrics = metrics or run_metrics.RunMetrics()
+    queue = reduction_queue.ReductionQueue(queue_dir)
+    for key in queue.requeue_stale():
+        print("Requeued %s, as its reducer is gone" % key)
+    while time.time() < deadline:
+        metrics.maybe_write_summary()
+        queue.prune_done()
+        claimed = queue.claim()
+        if claimed is None:
+            time.sleep(poll_interval)
+            continue
+        key, job_dir, job = claimed
+        print("Reducing %s at %s" % (key, time.asctime()))
+        reduction_start = time.time()
+        try:
+            quality = reduce_job(collector, job_dir, job)
+        except Exception:  # pylint: disable=broad-except
+            # Finish the job anyway, or the restarted reducer would claim it again and fail the same way
+            print("Reducing %s failed:\n%s" % (key, traceback.format_exc()))
+            queue.finish(key, {"error": traceback.format_exc()})
+            continue
+        queue.finish(key, {"quality": quality})
+        metrics.record_reduction(time.time() - reduction_start, queue.counts()["pending"])
+    metrics.maybe_write_summary(force=True)
+
+
+def reduce_job(collector, job_dir, job):
+    """Reduce and submit a testcase claimed from the reduction queue.
+
+    Args:
+        collector (Collector): FuzzManager collector
+        job_dir (Path): Job directory, holding the testcase
+        job (dict): Job contents, see enqueue_reduction
+
+    Returns:
+        int: Quality of the submitted testcase
+    """
+    js_interesting_options, crash_info = job_crash_info(job_dir, job)
+    return reduce_and_submit(collector, crash_info, job["lev"], js_interesting_options, job["itest"],
+                             job_dir / "w", job["engine_flags"], job_dir / "w-reduced.js", Path(job["repo"]),
+                             job["build_options_str"], job["target_time"], job.get("lithium_jobs", 1))
+
+
+def job_crash_info(job_dir, job):
+    """Recreate what was found when running the original testcase of a job from the reduction queue.
+
+    Args:
+        job_dir (Path): Job directory, holding the testcase
+        job (dict): Job contents, see enqueue_reduction
+
+    Returns:
+        tuple: js_interesting options the testcase was run with, and its CrashInfo
+    """
+    js_interesting_options = js_interesting.parseOptions(job["js_interesting_args"] + [str(job_dir / "w-reduced.js")])
+    # pylint: disable=no-member
+    program_conf = js_interesting.program_configuration(js_interesting_options.jsengineWithArgs[0])
+    program_conf.addProgramArguments(js_interesting_options.jsengineWithArgs[1:-1])
+    crash_info = CrashInfo.CrashInfo.fromRawCrashData(job["out"], job["err"], program_conf,
+                                                      auxCrashData=job["aux_crash_data"])
+    return js_interesting_options, crash_info
+
+
+def submit_unreduced(queue_dir, collector):
+    """Submit the testcases left in the reduction queue once the reducers are done, without reducing them, as the
+    queue goes away along with the run. They get the quality of testcases Lithium could not reduce.
+
+    Args:
+        queue_dir (Path): Reduction queue directory
+        collector (Collector): FuzzManager collector
+
+    Returns:
+        list: Signature keys of the submitted testcases
+    """
+    queue = reduction_queue.ReductionQueue(queue_dir)
+    queue.requeue_stale()  # Claimed by reducers which got stopped halfway through
+    submitted = []
+    while True:
+        claimed = queue.claim()
+        if claimed is None:
+            return submitted
+        key, job_dir, job = claimed
+        reduced_log = job_dir / "w-reduced.js"
+        try:
+            crash_info = job_crash_info(job_dir, job)[1]
+            print("Submitting %s unreduced (quality=10), the reducers ran out of time" % key)
+            collector.submit(crash_info, str(reduced_log), 10)
+        except Exception:  # pylint: disable=broad-except
+            print("Submitting %s failed:\n%s" % (key, traceback.format_exc()))
+            queue.finish(key, {"error": traceback.format_exc()})
+            continue
+        queue.finish(key, {"quality": 10, "unreduced": True})
+        submitted.append(key)
+
+
 def jitCompareLines(jsfunfuzzOutputFilename, marker):  # pylint: disable=invalid-name,missing-param-doc
     # pylint: disable=missing-return-doc,missing-return-type-doc,missing-type-doc
     """Create a compare_jit file, using the lines marked by jsfunfuzz as valid for comparison."""
@@ -0,0 +1,211 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Keep one js shell alive and drive many jsfunfuzz seeds through it over a pipe.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals  # isort:skip
+
+from builtins import object
+import io
+import os
+import sys
+import threading
+import time
+
+import lithium.interestingness.timed_run as timed_run
+
+from ..util import spooled_run
+
+if sys.version_info.major == 2:
+    from Queue import Empty, Queue  # pylint: disable=import-error
+    if os.name == "posix":
+        import subprocess32 as subprocess  # pylint: disable=import-error
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    from queue import Empty, Queue  # pylint: disable=import-error
+    import subprocess
+
+PERSISTENT_MARKER = "PERSISTENT-SHELL-SEED-DONE"
+PERSISTENT_MARKER_BYTES = PERSISTENT_MARKER.encode("utf-8")
+
+# Takes over the "start(this);" line between the SPLICE markers of tail.js. Each line read from stdin runs one more
+# fuzz seed, after which the marker is printed on both stdout and stderr so the harness knows the seed is done.
+PERSISTENT_LOOP = """
+
+// Added by persistent_shell.py
+function persistentLoop(glob)
+{
+  // Keep our own references, fuzzed code is free to clobber the globals between seeds.
+  var nextSeed = readline;
+  var say = print;
+  var sayErr = printErr;
+  while (nextSeed() !== null) {
+    start(glob);
+    say("It's looking good!");
+    say("%s");
+    sayErr("%s");
+  }
+}
+""" % (PERSISTENT_MARKER, PERSISTENT_MARKER)
+
+
+def make_persistent_fuzzer(fuzzjs, target_path):
+    """Create a copy of a linked jsfunfuzz file which keeps running seeds for as long as stdin stays open.
+
+    Args:
+        fuzzjs (Path): Linked jsfunfuzz file, as created by link_fuzzer
+        target_path (Path): File to be created
+    """
+    with io.open(str(fuzzjs), "r", encoding="utf-8", errors="replace") as f:
+        contents = f.read()
+    splice_start = contents.index("// SPLICE DDBEGIN\n")
+    splice_end = contents.index("// SPLICE DDEND\n", splice_start)
+    spliced = contents[splice_start:splice_end].replace("\nstart(this);\n", "\npersistentLoop(this);\n")
+    assert "persistentLoop(this);" in spliced
+    with io.open(str(target_path), "w", encoding="utf-8", errors="replace") as f:
+        f.write(contents[:splice_start] + spliced + contents[splice_end:] + PERSISTENT_LOOP)
+
+
+def _pump(stream, name, lines):
+    """Forward every line of a pipe to a queue, followed by None once the pipe is closed."""
+    try:
+        for line in iter(stream.readline, b""):
+            lines.put((name, line))
+    except (IOError, OSError, ValueError):  # The pipe got closed from our side after the process was killed
+        pass
+    lines.put((name, None))
+
+
+class PersistentShell(object):
+    """A js shell process which is reused for many fuzz seeds.
+
+    timed_run has the same signature and return value as spooled_run.timed_run, so it can be used as the runner of
+    js_interesting.ShellResult. A fresh process is only started for the first seed, when the command changes, after
+    the previous process crashed, timed out or exited, or once max_seeds seeds have been run by one process.
+
+    Args:
+        session_log (Path): File collecting the stdout of every seed run by the current process, which is needed to
+                            reproduce a bug that depends on state left behind by earlier seeds
+        max_seeds (int): Number of seeds after which the process gets replaced anyway
+    """
+    def __init__(self, session_log, max_seeds=100):
+        self.session_log = Path(session_log)
+        self.max_seeds = max_seeds
+        self.seeds = 0
+        self._child = None
+        self._command = None
+        self._lines = None
+
+    def is_alive(self):
+        """Return whether the next timed_run call will reuse the current process.
+
+        Returns:
+            bool: True if the process is running and still has seeds left
+        """
+        return self._child is not None and self._child.poll() is None and self.seeds < self.max_seeds
+
+    def close(self):
+        """Kill the current process, if any. The next timed_run call starts a fresh one."""
+        if self._child is None:
+            return
+        if self._child.poll() is None:
+            self._child.kill()
+        self._child.wait()
+        for stream in (self._child.stdin, self._child.stdout, self._child.stderr):
+            try:
+                stream.close()
+            except (IOError, OSError):  # stdin may be a broken pipe by now
+                pass
+        self._child = None
+        self._command = None
+
+    def _start(self, command, env, preexec_fn):
+        self.close()
+        self._child = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            close_fds=(os.name == "posix"),
+            env=env,
+            preexec_fn=preexec_fn
+        )
+        self._command = list(command)
+        self._lines = Queue()
+        self.seeds = 0
+        for stream, name in ((self._child.stdout, "out"), (self._child.stderr, "err")):
+            pump = threading.Thread(target=_pump, args=(stream, name, self._lines))
+            pump.daemon = True
+            pump.start()
+        io.open(str(self.session_log), "wb").close()
+
+    def timed_run(self, command, timeout, _log_prefix, env=None, preexec_fn=None):
+        # pylint: disable=too-many-arguments,too-many-locals
+        """Run one more fuzz seed, starting a new process if needed.
+
+        Args:
+            command (list): Command with arguments, which should end with the file from make_persistent_fuzzer
+            timeout (int): Number of seconds after which the seed is considered to have hung
+            _log_prefix (str): Unused, for compatibility with Lithium's timed_run
+            env (dict): Environment of a newly started process
+            preexec_fn (function): Function run in a newly started process before the shell itself
+
+        Returns:
+            rundata: Lithium run information, with the pid of the process that ran the seed, and the output of the
+                     seed captured in spools
+        """
+        if not self.is_alive() or command != self._command:
+            self._start(command, env, preexec_fn)
+        self.seeds += 1
+        child = self._child
+        start_time = time.time()
+
+        logs = {"out": spooled_run.new_spool(), "err": spooled_run.new_spool()}
+        killed = False
+        with io.open(str(self.session_log), "ab") as session_file:
+            try:
+                child.stdin.write(b"\n")
+                child.stdin.flush()
+            except (IOError, OSError):  # The process has died, its exit status is collected below
+                pass
+
+            # Streams which have neither printed the marker nor been closed yet
+            pending = set(logs)
+            closed = set()
+            while pending:
+                remaining = timeout - (time.time() - start_time)
+                if remaining <= 0 and not killed:
+                    child.kill()
+                    killed = True
+                try:
+                    # Once killed, the pipes close as soon as the process is gone
+                    name, line = self._lines.get(timeout=(5 if killed else remaining))
+                except Empty:
+                    if killed:
+                        break
+                    continue
+                if line is None:
+                    closed.add(name)
+                    pending.discard(name)
+                elif line.rstrip() == PERSISTENT_MARKER_BYTES and not killed:
+                    pending.discard(name)
+                else:
+                    logs[name].write(line)
+                    if name == "out":
+                        session_file.write(line)
+
+        elapsed_time = time.time() - start_time
+        if killed or closed:
+            return_code = child.wait()
+            sta, msg = spooled_run.run_status(return_code, killed)
+            self.close()
+        else:
+            return_code = 0
+            sta, msg = timed_run.NORMAL, "NORMAL"
+
+        return timed_run.rundata(sta, return_code, msg, elapsed_time, killed, child.pid, logs["out"], logs["err"])
@@ -15,16 +15,113 @@ import re
 import sys
 
 from . import inspect_shell
+from ..util import capability_db
 
 if sys.version_info.major == 2:
     from functools32 import lru_cache  # pylint: disable=import-error
+    from pathlib2 import Path
 else:
     from functools import lru_cache  # pylint: disable=no-name-in-module
+    from pathlib import Path  # pylint: disable=import-error
+
+
+# Every flag that random_flag_set and basic_flag_sets may ask about, probed together by supported_flags
+CANDIDATE_FLAGS = (
+    "--baseline-eager",
+    "--cache-ir-stubs=on",
+    "--cpu-count=1",
+    "--dump-bytecode",
+    "--enable-avx",
+    "--fuzzing-safe",
+    "--gc-zeal=1,1",
+    "--ion",
+    "--ion-extra-checks",
+    "--ion-instruction-reordering=on",
+    "--ion-offthread-compile=on",
+    "--ion-pgo=on",
+    "--ion-regalloc=testbed",
+    "--ion-shared-stubs=on",
+    "--ion-sincos=on",
+    "--no-avx",
+    "--no-cgc",
+    "--no-ggc",
+    "--no-incremental-gc",
+    "--no-ion",
+    "--no-native-regexp",
+    "--no-sse3",
+    "--no-threads",
+    "--no-unboxed-objects",
+    "--no-wasm",
+    "--no-wasm-baseline",
+    "--no-wasm-ion",
+    "--nursery-strings=on",
+    "--spectre-mitigations=on",
+    "--test-wasm-await-tier2",
+    "--wasm-gc",
+)
+
+# Option names at the start of a line of --help output, e.g. "  -f --file=PATH" or "  --ion-eager"
+HELP_OPTION_RE = re.compile(r"^\s*(?:-\w\s+)?(--[\w-]+)", re.MULTILINE)
+
+
+def _probe_flag_group(shell_path, flags):
+    """Find out which flags are supported by running the shell with all of them, splitting the group up only when
+    that fails.
+
+    Args:
+        shell_path (Path): Path to the required shell.
+        flags (list): Flags to be tested.
+
+    Returns:
+        set: The supported flags.
+    """
+    if inspect_shell.shellSupports(shell_path, flags + ["-e", "42"]):
+        return set(flags)
+    if len(flags) == 1:
+        return set()
+    middle = len(flags) // 2
+    return _probe_flag_group(shell_path, flags[:middle]) | _probe_flag_group(shell_path, flags[middle:])
+
+
+@lru_cache(maxsize=None)
+def supported_flags(shell_path):
+    """Returns which of CANDIDATE_FLAGS are supported by a shell, using as few shell runs as possible.
+
+    The --help output is read once: flags it does not list are unsupported, and flags it lists without a value are
+    supported. Only flags with a value, which the shell may still reject, get run, together in as few groups as
+    possible. Answers are shared with other processes through the capability database.
+
+    Args:
+        shell_path (str): Path to the required shell.
+
+    Returns:
+        frozenset: The supported flags.
+    """
+    known_flags = capability_db.load(shell_path).get("flags", {})
+    unknown_flags = [flag for flag in CANDIDATE_FLAGS if flag not in known_flags]
+    if unknown_flags:
+        help_options = set(HELP_OPTION_RE.findall(inspect_shell.testBinary(Path(shell_path), ["--help"], False)[0]))
+        probed_flags = {}
+        ambiguous_flags = []
+        for flag in unknown_flags:
+            if help_options and flag.split("=")[0] not in help_options:
+                probed_flags[flag] = False
+            elif help_options and "=" not in flag:
+                probed_flags[flag] = True
+            else:  # The value may be rejected, or there is no usable --help output at all
+                ambiguous_flags.append(flag)
+        if ambiguous_flags:
+            supported = _probe_flag_group(Path(shell_path), ambiguous_flags)
+            probed_flags.update((flag, flag in supported) for flag in ambiguous_flags)
+        capability_db.record(shell_path, "flags", probed_flags)
+        known_flags.update(probed_flags)
+    return frozenset(flag for flag in CANDIDATE_FLAGS if known_flags[flag])
 
 
 @lru_cache(maxsize=None)
 def shell_supports_flag(shell_path, flag):
-    """Returns whether a particular flag is supported by a shell.
+    """Returns whether a particular flag is supported by a shell. Answers are shared with other processes through
+    the capability database, so each flag is only probed once per binary.
 
     Args:
         shell_path (str): Path to the required shell.
@@ -33,7 +130,13 @@ def shell_supports_flag(shell_path, flag):
     Returns:
         bool: True if the flag is supported, i.e. does not cause the shell to throw an error, False otherwise.
     """
+    if flag in CANDIDATE_FLAGS:
+        return flag in supported_flags(shell_path)
+    known_flags = capability_db.load(shell_path).get("flags", {})
+    if flag in known_flags:
+        return known_flags[flag]
     out = inspect_shell.shellSupports(shell_path, [flag, "-e", "42"])
+    capability_db.record(shell_path, "flags", {flag: out})
     return out
 
 
@@ -59,14 +162,15 @@ def add_random_arch_flags(shell_path, input_list=False):
     Returns:
         list: List of flags to be tested, with probable architecture-related flags added.
     """
-    if inspect_shell.queryBuildConfiguration(shell_path, "arm-simulator") and chance(.7):
+    arm_simulator = inspect_shell.get_build_configuration(shell_path).arm_simulator
+    if arm_simulator and chance(.7):
         # m-c rev 165993:c450eb3abde4, see bug 965247
         input_list.append("--arm-sim-icache-checks")
-    if inspect_shell.queryBuildConfiguration(shell_path, "arm-simulator") and chance(.7):
+    if arm_simulator and chance(.7):
         # Added due to fuzz-flags.txt addition: m-c rev 418682:5bba65880a66, see bug 1461689
         # m-c rev 192164:f1bacafe789c, see bug 1020834
         input_list.append("--arm-asm-nop-fill=1")
-    if inspect_shell.queryBuildConfiguration(shell_path, "arm-simulator") and chance(.7):
+    if arm_simulator and chance(.7):
         # Added due to fuzz-flags.txt addition: m-c rev 418682:5bba65880a66, see bug 1461689
         # m-c rev 190582:5399dc155c3b, see bug 1028008
         input_list.append("--arm-hwcap=vfp")
@@ -8,6 +8,7 @@
 
 from __future__ import absolute_import
 
+from . import capability_db
 from . import crashesat
 from . import create_collector
 from . import file_manipulation
@@ -16,7 +17,13 @@ from . import hg_helpers
 from . import lithium_helpers
 from . import lock_dir
 from . import os_ops
+from . import reduction_queue
 from . import repos_update
+from . import result_cache
+from . import run_metrics
 from . import s3cache
+from . import signature_index
 from . import sm_compile_helpers
+from . import spooled_run
 from . import subprocesses
+from . import worker_pool
@@ -0,0 +1,103 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Remember what a compiled shell supports across processes, in one JSON file per shell binary in ~/shell-capabilities.
+"""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+if sys.version_info.major == 2:
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+
+# Binary hashes, keyed on the path, mtime, size and inode of the binary
+BINARY_HASHES = {}
+
+
+def get_db_dir(base_dir=None):
+    """Retrieve the directory holding the capability files, and create one if needed.
+
+    Args:
+        base_dir (Path): Base directory to create the capability directory in, defaults to the home directory
+
+    Returns:
+        Path: Full path to the capability directory
+    """
+    db_dir = (base_dir or Path.home()) / "shell-capabilities"
+    db_dir.mkdir(exist_ok=True)
+    return db_dir
+
+
+def binary_hash(shell_path):
+    """Return the SHA-1 hash of a shell binary, only reading the binary once per process unless it changes.
+
+    Args:
+        shell_path (Path): Full path to the shell
+
+    Returns:
+        str: Hexadecimal hash of the binary
+    """
+    shell_stat = Path(shell_path).stat()
+    key = (str(shell_path), shell_stat.st_mtime, shell_stat.st_size, shell_stat.st_ino)
+    if key not in BINARY_HASHES:
+        sha1 = hashlib.sha1()
+        with io.open(str(shell_path), "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                sha1.update(chunk)
+        BINARY_HASHES[key] = sha1.hexdigest()
+    return BINARY_HASHES[key]
+
+
+def load(shell_path, base_dir=None):
+    """Return everything recorded so far about a shell.
+
+    Args:
+        shell_path (Path): Full path to the shell
+        base_dir (Path): Base directory of the capability directory, defaults to the home directory
+
+    Returns:
+        dict: Recorded capabilities, by section
+    """
+    db_file = get_db_dir(base_dir) / (binary_hash(shell_path) + ".json")
+    try:
+        with io.open(str(db_file), "r", encoding="utf-8", errors="replace") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):  # Nothing recorded yet, or the file is damaged
+        return {}
+
+
+def record(shell_path, section, values, base_dir=None):
+    """Remember capabilities of a shell.
+
+    Several processes may be recording at the same time, so the file is replaced atomically. When two of them race,
+    an entry may get lost, in which case it is simply probed and recorded again later.
+
+    Args:
+        shell_path (Path): Full path to the shell
+        section (str): Kind of capability, e.g. "flags"
+        values (dict): Capabilities to be merged into the section, with anything JSON can store as values
+        base_dir (Path): Base directory of the capability directory, defaults to the home directory
+    """
+    db_dir = get_db_dir(base_dir)
+    capabilities = load(shell_path, base_dir)
+    capabilities.setdefault(section, {}).update(values)
+
+    tmp_fd, tmp_name = tempfile.mkstemp(suffix=".tmp", dir=str(db_dir))
+    with io.open(tmp_fd, "w", encoding="utf-8", errors="replace") as f:
+        f.write(json.dumps(capabilities, sort_keys=True))
+    db_file = str(db_dir / (binary_hash(shell_path) + ".json"))
+    if sys.version_info.major == 2:
+        os.rename(tmp_name, db_file)
+    else:
+        os.replace(tmp_name, db_file)  # pylint: disable=no-member
@@ -21,9 +21,7 @@ def amiss(log_prefix):  # pylint: disable=missing-param-doc,missing-return-doc,m
     with io.open(str(err_log), "r", encoding="utf-8", errors="replace") as f:
         for line in f:
             line = line.strip("\x07").rstrip("\n")
-            if (line.find("szone_error") != -1 or
-                    line.find("malloc_error_break") != -1 or
-                    line.find("MallocHelp") != -1):
+            if is_malloc_error(line):
                 print()
                 print(line)
                 found_something = True
@@ -32,6 +30,18 @@ def amiss(log_prefix):  # pylint: disable=missing-param-doc,missing-return-doc,m
     return found_something
 
 
+def is_malloc_error(line):
+    """Return whether a line of stderr is one of the malloc complaints that amiss looks for.
+
+    Args:
+        line (str): Line of stderr, stripped of bell characters and the trailing newline
+
+    Returns:
+        bool: True if malloc is unhappy
+    """
+    return "szone_error" in line or "malloc_error_break" in line or "MallocHelp" in line
+
+
 def fuzzSplice(filename):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc,missing-return-type-doc
     # pylint: disable=missing-type-doc
     """Return the lines of a file, minus the ones between the two lines containing SPLICE."""
@@ -10,17 +10,24 @@
 from __future__ import absolute_import, print_function, unicode_literals  # isort:skip
 
 import io
+import json
+import logging
+from multiprocessing.pool import ThreadPool
 import os
 import re
 import shutil
 import sys
 import tempfile
+import time
+import traceback
 
+from lithium import reducer
 from lithium.interestingness.utils import file_contains_str
 from past.builtins import range
 from shellescape import quote
 
 from . import file_manipulation
+from . import result_cache
 from ..js.inspect_shell import testJsShellOrXpcshell
 from ..js.js_interesting import JS_OVERALL_MISMATCH
 from ..js.js_interesting import JS_VG_AMISS
@@ -37,21 +44,32 @@ runlithiumpy = [sys.executable, "-u", "-m", "lithium"]  # pylint: disable=invali
 
 # Status returns for runLithium and many_timed_runs
 (HAPPY, LITH_NO_REPRO, LITH_FINISHED, LITH_RETESTED_STILL_INTERESTING, LITH_BUSTED) = range(5)
+LITH_RESULT_NAMES = {
+    HAPPY: "happy",
+    LITH_NO_REPRO: "no repro",
+    LITH_FINISHED: "finished",
+    LITH_RETESTED_STILL_INTERESTING: "retested still interesting",
+    LITH_BUSTED: "busted",
+}
+
+LITH_LOG = logging.getLogger("lithium")
 
 
 def pinpoint(itest, logPrefix, jsEngine, engineFlags, infilename,  # pylint: disable=invalid-name,missing-param-doc
-             bisectRepo, build_options_str, targetTime, suspiciousLevel):
+             bisectRepo, build_options_str, targetTime, suspiciousLevel, lithium_jobs=1):
     # pylint: disable=missing-return-doc,missing-return-type-doc,missing-type-doc,too-many-arguments,too-many-locals
     """Run Lithium and autobisectjs.
 
     itest must be an array of the form [module, ...] where module is an interestingness module.
     The module's "interesting" function must accept [...] + [jsEngine] + engineFlags + infilename
     (If it's not prepared to accept engineFlags, engineFlags must be empty.)
+    lithium_jobs is the number of chunk removals Lithium may test at the same time, see ParallelMinimize.
+    Returns the Lithium result and details, the truncated autobisectjs log and the StageStats of the reduction.
     """
     lithArgs = itest + [str(jsEngine)] + engineFlags + [str(infilename)]  # pylint: disable=invalid-name
 
-    (lithResult, lithDetails) = reduction_strat(  # pylint: disable=invalid-name
-        logPrefix, infilename, lithArgs, targetTime, suspiciousLevel)
+    (lithResult, lithDetails, stage_stats) = reduction_strat(  # pylint: disable=invalid-name
+        logPrefix, infilename, lithArgs, targetTime, suspiciousLevel, lithium_jobs)
 
     print()
     print("Done running Lithium on the part in between DDBEGIN and DDEND. To reproduce, run:")
@@ -79,12 +97,16 @@ def pinpoint(itest, logPrefix, jsEngine, engineFlags, infilename,  # pylint: dis
     else:
         autobisect_log_trunc = []
 
-    return (lithResult, lithDetails, autobisect_log_trunc)
+    return (lithResult, lithDetails, autobisect_log_trunc, stage_stats)
+
 
+def run_lithium(lithArgs, logPrefix, targetTime, jobs=1):  # pylint: disable=invalid-name,missing-param-doc
+    # pylint: disable=missing-return-doc,missing-return-type-doc,missing-type-doc
+    """Run Lithium in this process: reduce to the smallest file that has at least the same unhappiness level.
 
-def run_lithium(lithArgs, logPrefix, targetTime):  # pylint: disable=invalid-name,missing-param-doc,missing-return-doc
-    # pylint: disable=missing-return-type-doc,missing-type-doc
-    """Run Lithium as a subprocess: reduce to the smallest file that has at least the same unhappiness level.
+    The interestingness module is imported once, so its options, FuzzManager collector and ProgramConfiguration are
+    reused across all the Lithium runs of a reduction (see js_interesting.init). With more than one job, chunk
+    removals are tested in parallel, see ParallelMinimize.
 
     Returns a tuple of (lithlogfn, LITH_*, details).
     """
@@ -100,10 +122,11 @@ def run_lithium(lithArgs, logPrefix, targetTime):  # pylint: disable=invalid-nam
         Path.mkdir(lithtmp)
         lithArgs = ["--tempdir=" + str(lithtmp)] + lithArgs
     lithlogfn = (logPrefix.parent / (logPrefix.stem + "-lith-out")).with_suffix(".txt")
-    print("Preparing to run Lithium, log file %s" % lithlogfn)
+    print("Preparing to run Lithium in this process, log file %s" % lithlogfn)
+    print("Equivalent command to reproduce this run by hand:")
     print(" ".join(quote(str(x)) for x in runlithiumpy + lithArgs))
     with io.open(str(lithlogfn), "w", encoding="utf-8", errors="replace") as f:
-        subprocess.run(runlithiumpy + lithArgs, stderr=subprocess.STDOUT, stdout=f)
+        run_lithium_in_process([str(x) for x in lithArgs], f, jobs)
     print("Done running Lithium")
     if deletableLithTemp:
         shutil.rmtree(deletableLithTemp)
@@ -112,6 +135,159 @@ def run_lithium(lithArgs, logPrefix, targetTime):  # pylint: disable=invalid-nam
     return r
 
 
+def run_lithium_in_process(lith_args, log_file, jobs=1):
+    """Run Lithium with the given command line arguments, writing what it and the interestingness module print to a
+    log file, like `python -m lithium` would. If Lithium or the interestingness module raises, the traceback goes to the
+    log file too, so readLithiumResult gives LITH_BUSTED, as it did when Lithium ran in a subprocess.
+
+    Args:
+        lith_args (list): Lithium arguments, including the interestingness module and its arguments
+        log_file (file): Open text file for the log
+        jobs (int): Number of chunk removals to test at the same time, when using the minimize strategy
+    """
+    handler = logging.StreamHandler(log_file)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    old_level = LITH_LOG.level
+    LITH_LOG.addHandler(handler)
+    LITH_LOG.setLevel(logging.INFO)
+    old_stdout = sys.stdout
+    old_stderr = sys.stderr
+    sys.stdout = log_file
+    sys.stderr = log_file
+    try:
+        lith = reducer.Lithium()
+        lith.processArgs(lith_args)
+        # Parallel testing needs the testcase to be passed to the interestingness module, so each job can get a copy
+        if jobs > 1 and type(lith.strategy) is reducer.Minimize and lith.testcase.filename in lith.conditionArgs:
+            lith.strategy = ParallelMinimize(lith, jobs)
+        lith.run()
+    except reducer.LithiumError as ex:
+        LITH_LOG.error(ex)
+    except Exception:  # pylint: disable=broad-except
+        log_file.write(traceback.format_exc())
+    finally:
+        sys.stdout = old_stdout
+        sys.stderr = old_stderr
+        LITH_LOG.removeHandler(handler)
+        LITH_LOG.setLevel(old_level)
+
+
+class ParallelMinimize(reducer.Minimize):
+    """Lithium's minimize strategy, testing the removal of several chunks at the same time.
+
+    The next chunk removals of a round are each tested on a copy of the testcase in its own slot directory, and the
+    first interesting one in file order is kept, which is what the sequential strategy would have kept. Results of the
+    removals after it are thrown away, as they were tested on a testcase which still had that chunk. With a
+    deterministic interestingness test, the reduced testcase is the same as with the sequential strategy.
+
+    The interestingness module must accept being called from several threads at once, with the testcase path in its
+    arguments replaced by the path of the copy, as js_interesting and compare_jit do.
+
+    Args:
+        lith (Lithium): Lithium instance whose minimize settings and interestingness test are used
+        jobs (int): Number of chunk removals to test at the same time
+    """
+    name = "minimize-parallel"
+
+    def __init__(self, lith, jobs):
+        super(ParallelMinimize, self).__init__()
+        self.__dict__.update(lith.strategy.__dict__)
+        self.lith = lith
+        self.jobs = jobs
+        self.slot_files = []
+
+    def _test_in_slot(self, slot, testcase, temp_prefix):
+        """Run the interestingness test on a testcase, written to the copy of a slot."""
+        slot_file = self.slot_files[slot]
+        testcase.writeTestcase(slot_file)
+        args = [slot_file if x == self.lith.testcase.filename else x for x in self.lith.conditionArgs]
+        return self.lith.conditionScript.interesting(args, temp_prefix)
+
+    def run(self, testcase, interesting, tempFilename):  # pylint: disable=invalid-name
+        # pylint: disable=missing-return-doc,missing-return-type-doc,too-complex,too-many-branches,too-many-locals
+        """Same as Minimize.run, except that up to self.jobs chunk removals are tested at once."""
+        for slot in range(self.jobs):
+            slot_dir = os.path.join(self.lith.tempDir, "slot-%d" % slot)
+            os.mkdir(slot_dir)
+            self.slot_files.append(os.path.join(slot_dir, os.path.basename(testcase.filename)))
+
+        chunk_size = min(self.minimizeMax, reducer.largestPowerOfTwoSmallerThan(len(testcase.parts)))
+        final_chunk_size = min(chunk_size, max(self.minimizeMin, 1))
+        chunk_start = self.minimizeChunkStart
+        any_chunks_removed = self.minimizeRepeatFirstRound
+
+        pool = ThreadPool(self.jobs)
+        try:
+            while True:
+                if self.stopAfterTime and time.time() > self.stopAfterTime:
+                    LITH_LOG.info("Lithium result: please perform another pass using the same arguments")
+                    break
+
+                if chunk_start >= len(testcase.parts):
+                    testcase.writeTestcase(tempFilename("did-round-%d" % chunk_size))
+                    last = chunk_size <= final_chunk_size
+                    empty = not testcase.parts
+                    LITH_LOG.info("")
+                    if not empty and any_chunks_removed and (self.minimizeRepeat == "always" or
+                                                             (self.minimizeRepeat == "last" and last)):
+                        LITH_LOG.info("Starting another round of chunk size %d", chunk_size)
+                    elif empty or last:
+                        LITH_LOG.info("Lithium result: succeeded, reduced to: %s",
+                                      reducer.quantity(len(testcase.parts), testcase.atom))
+                        break
+                    else:
+                        while chunk_size > 1:  # smallest valid chunk size is 1
+                            chunk_size >>= 1
+                            if chunk_size < len(testcase.parts):
+                                break
+                        LITH_LOG.info("Reducing chunk size to %d", chunk_size)
+                    chunk_start = 0
+                    any_chunks_removed = False
+                    continue
+
+                starts = list(range(chunk_start, len(testcase.parts), chunk_size))[:self.jobs]
+                candidates = []
+                for start in starts:
+                    candidate = testcase.copy()
+                    candidate.parts = candidate.parts[:start] + candidate.parts[start + chunk_size:]
+                    candidates.append(candidate)
+                # Numbered like the temporary files of the sequential strategy, see Lithium.interesting
+                prefixes = [os.path.join(self.lith.tempDir, "%d" % (self.lith.tempFileCount + i))
+                            for i in range(len(candidates))]
+                # pylint: disable=cell-var-from-loop
+                results = pool.map(lambda i: self._test_in_slot(i, candidates[i], prefixes[i]), range(len(candidates)))
+
+                kept = None
+                for i, (start, candidate, result) in enumerate(zip(starts, candidates, results)):
+                    self.lith.testCount += 1
+                    self.lith.testTotal += len(candidate.parts)
+                    candidate.writeTestcase(tempFilename("interesting" if result else "boring"))
+                    description = "Removing a chunk of size %d starting at %d of %d" % (
+                        chunk_size, start, len(testcase.parts))
+                    if kept is not None:
+                        LITH_LOG.info("%s was tested speculatively, the result is discarded.", description)
+                    elif result:
+                        kept = i
+                        LITH_LOG.info("%s was a successful reduction :)", description)
+                    else:
+                        LITH_LOG.info("%s made the file 'uninteresting'.", description)
+
+                if kept is None:
+                    chunk_start = starts[-1] + chunk_size
+                else:
+                    testcase = candidates[kept]
+                    testcase.writeTestcase()
+                    self.lith.testcase = testcase
+                    self.lith.lastInteresting = testcase
+                    any_chunks_removed = True
+                    chunk_start = starts[kept]  # the next chunk has moved to where the removed one was
+        finally:
+            pool.close()
+            pool.join()
+
+        return 0, (chunk_size == 1 and not any_chunks_removed and self.minimizeRepeat != "never"), testcase
+
+
 def readLithiumResult(lithlogfn):  # pylint: disable=invalid-name,missing-docstring,missing-return-doc
     # pylint: disable=missing-return-type-doc
     with io.open(str(lithlogfn), "r", encoding="utf-8", errors="replace") as f:
@@ -130,145 +306,254 @@ def readLithiumResult(lithlogfn):  # pylint: disable=invalid-name,missing-docstr
         return (LITH_BUSTED, None)
 
 
-def reduction_strat(logPrefix, infilename, lithArgs, targetTime, lev):  # pylint: disable=invalid-name
-    # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc,missing-type-doc,too-complex
-    # pylint: disable=too-many-branches,too-many-locals,too-many-statements
-    """Reduce jsfunfuzz output files using Lithium by using various strategies."""
-
-    # This is an array because Python does not like assigning to upvars.
-    reductionCount = [0]  # pylint: disable=invalid-name
-    backup_file = (logPrefix.parent / (logPrefix.stem + "-backup"))
+class ReductionState(object):  # pylint: disable=too-few-public-methods
+    """What the skip rules of reduction stages look at, updated as the stages run.
 
-    def lith_reduce(strategy):
-        """Lithium reduction commands accepting various strategies.
+    Args:
+        infilename (Path): Testcase being reduced
+        target_time (int): Nominal amount of time to run, in seconds, or None when run standalone
+        lev (int): js_interesting level of the testcase
+    """
+    def __init__(self, infilename, target_time, lev):
+        self.infilename = infilename
+        self.target_time = target_time
+        self.lev = lev
+        self.lith_result = None
+        self.lith_details = None
+        # Number of lines left after the first reduction
+        self.orig_num_lines = None
+        self._has_try_it_out = None
+
+    @property
+    def has_try_it_out(self):
+        """Whether the testcase came from jsfunfuzz or compare_jit, as found after the first reduction.
 
-        Args:
-            strategy (str): Intended strategy to use
+        Returns:
+            bool: True if a line has both count=X and tryItOut
+        """
+        if self._has_try_it_out is None:
+            self._has_try_it_out = False
+            has_try_it_out_regex = re.compile(r'count=[0-9]+; tryItOut\("')
+            with io.open(str(self.infilename), "r", encoding="utf-8", errors="replace") as f:
+                for line in file_manipulation.linesWith(f, '; tryItOut("'):
+                    # Do not use .match here, it only matches from the start of the line:
+                    # https://docs.python.org/2/library/re.html#search-vs-match
+                    if has_try_it_out_regex.search(line):
+                        self._has_try_it_out = True
+                        break
+        return self._has_try_it_out
+
+
+class StageStats(object):  # pylint: disable=too-few-public-methods
+    """What one reduction stage did.
+
+    Args:
+        name (str): Name of the stage
+    """
+    def __init__(self, name):
+        self.name = name
+        self.ran = False
+        self.seconds = 0.0
+        self.lines_before = None
+        self.lines_after = None
+        self.bytes_before = None
+        self.bytes_after = None
+        self.lith_result = None
+        # Interestingness tests whose result was reused from result_cache, and the ones which ran the js shell
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def to_dict(self):
+        """Return the stats in a form JSON can store.
 
         Returns:
-            (tuple): The finished Lithium run result and details
+            dict: The stats, by name
         """
-        reductionCount[0] += 1
-        # Remove empty elements
-        full_lith_args = [x for x in (strategy + lithArgs) if x]
-        print(" ".join(quote(str(x)) for x in [sys.executable, "-u", "-m", "lithium"] + full_lith_args))
+        return dict(vars(self), lith_result=LITH_RESULT_NAMES.get(self.lith_result))
+
+    def __str__(self):
+        if not self.ran:
+            return "%-16s skipped" % self.name
+        return "%-16s %7.1fs %6d -> %6d lines %8d -> %8d bytes  %5d cached %5d run  %s" % (
+            self.name, self.seconds, self.lines_before, self.lines_after, self.bytes_before, self.bytes_after,
+            self.cache_hits, self.cache_misses, LITH_RESULT_NAMES.get(self.lith_result))
+
+
+class ReductionStage(object):  # pylint: disable=too-few-public-methods
+    """One step of reduction_strat: an optional rewrite of the testcase, followed by a Lithium run.
+
+    Args:
+        name (str): Short name of the stage, used in the stats
+        description (str): Printed before the stage runs
+        strategy (list): Additional Lithium arguments, e.g. ["--chunksize=2"]
+        rewrite (function): Called with the testcase path to rewrite the testcase before running Lithium, if needed
+        run_if (function): Called with the ReductionState, the stage is skipped unless it returns True. Stages without
+                           one always run.
+    """
+    def __init__(self, name, description, strategy, rewrite=None, run_if=None):  # pylint: disable=too-many-arguments
+        self.name = name
+        self.description = description
+        self.strategy = strategy
+        self.rewrite = rewrite
+        self.run_if = run_if
 
-        desc = "-chars" if strategy == "--char" else "-lines"
-        (lith_result, lith_details) = run_lithium(
-            full_lith_args, (logPrefix.parent / ("%s-%s%s" % (logPrefix.stem, reductionCount[0], desc))), targetTime)
-        if lith_result == LITH_FINISHED:
-            shutil.copy2(str(infilename), str(backup_file))
 
-        return lith_result, lith_details
+def _file_size(infilename):
+    """Return the number of lines and bytes of a file."""
+    with io.open(str(infilename), "rb") as f:
+        contents = f.read()
+    return contents.count(b"\n"), len(contents)
 
-    print()
-    print("Running the first line reduction...")
-    print()
-    # Step 1: Run the first instance of line reduction.
-    lith_result, lith_details = lith_reduce([])
 
-    if lith_details is not None:  # lith_details can be None if testcase no longer becomes interesting
-        origNumOfLines = int(lith_details.split()[0])  # pylint: disable=invalid-name
+def _is_small_jsfunfuzz_testcase(state):
+    """Skip rule of the jsfunfuzz-specific stages: the previous stage succeeded on a memory safety testcase from
+    jsfunfuzz, which the first reduction got down to 50 lines or less."""
+    return (state.lith_result == LITH_FINISHED and state.orig_num_lines <= 50 and state.has_try_it_out and
+            state.lev >= JS_VG_AMISS)
 
-    hasTryItOut = False  # pylint: disable=invalid-name
-    hasTryItOutRegex = re.compile(r'count=[0-9]+; tryItOut\("')  # pylint: disable=invalid-name
 
-    with io.open(str(infilename), "r", encoding="utf-8", errors="replace") as f:
-        for line in file_manipulation.linesWith(f, '; tryItOut("'):
-            # Checks if testcase came from jsfunfuzz or compare_jit.
-            # Do not use .match here, it only matches from the start of the line:
-            # https://docs.python.org/2/library/re.html#search-vs-match
-            hasTryItOut = hasTryItOutRegex.search(line)  # pylint: disable=invalid-name
-            if hasTryItOut:  # Stop searching after finding the first tryItOut line.
-                break
-
-    # Step 2: Run 1 instance of 1-line reduction after moving tryItOut and count=X around.
-    if lith_result == LITH_FINISHED and origNumOfLines <= 50 and hasTryItOut and lev >= JS_VG_AMISS:
-
-        tryItOutAndCountRegex = re.compile(r'"\);\ncount=([0-9]+); tryItOut\("',  # pylint: disable=invalid-name
-                                           re.MULTILINE)
-        with io.open(str(infilename), "r", encoding="utf-8", errors="replace") as f:
-            infileContents = f.read()  # pylint: disable=invalid-name
-            infileContents = re.sub(tryItOutAndCountRegex,  # pylint: disable=invalid-name
-                                    ';\\\n"); count=\\1; tryItOut("\\\n',
-                                    infileContents)
-        with io.open(str(infilename), "w", encoding="utf-8", errors="replace") as f:
-            f.write(infileContents)
+def _wants_char_reduction(state):
+    """Skip rule of character reduction: only for standalone runs, and not for asm.js availability mismatches."""
+    return (state.lith_result == LITH_FINISHED and state.orig_num_lines <= 50 and state.target_time is None and
+            state.lev >= JS_OVERALL_MISMATCH and
+            not (state.lev == JS_OVERALL_MISMATCH and
+                 file_contains_str(str(state.infilename), "isAsmJSCompilationAvailable")))
 
-        print()
-        print("Running 1 instance of 1-line reduction after moving tryItOut and count=X...")
-        print()
-        # --chunksize=1: Reduce only individual lines, for only 1 round.
-        lith_result, lith_details = lith_reduce(["--chunksize=1"])
-
-    # Step 3: Run 1 instance of 2-line reduction after moving count=X to its own line and add a
-    # 1-line offset.
-    if lith_result == LITH_FINISHED and origNumOfLines <= 50 and hasTryItOut and lev >= JS_VG_AMISS:
-        intendedLines = []  # pylint: disable=invalid-name
-        with io.open(str(infilename), "r", encoding="utf-8", errors="replace") as f:
-            for line in f:  # The testcase is likely to already be partially reduced.
-                if "dumpln(cookie" not in line:  # jsfunfuzz-specific line ignore
-                    # This should be simpler than re.compile.
-                    intendedLines.append(line.replace("; count=", ";\ncount=")
-                                         .replace('; tryItOut("', ';\ntryItOut("')
-                                         # The 1-line offset is added here.
-                                         .replace("SPLICE DDBEGIN", "SPLICE DDBEGIN\n"))
-
-        with io.open(str(infilename), "w", encoding="utf-8", errors="replace") as f:
-            f.writelines(intendedLines)
-        print()
-        print("Running 1 instance of 2-line reduction after moving count=X to its own line...")
-        print()
-        lith_result, lith_details = lith_reduce(["--chunksize=2"])
 
-    # Step 4: Run 1 instance of 2-line reduction again, e.g. to remove pairs of STRICT_MODE lines.
-    if lith_result == LITH_FINISHED and origNumOfLines <= 50 and hasTryItOut and lev >= JS_VG_AMISS:
-        print()
-        print("Running 1 instance of 2-line reduction again...")
-        print()
-        lith_result, lith_details = lith_reduce(["--chunksize=2"])
+def _move_try_it_out_and_count(infilename):
+    """Move tryItOut and count=X around."""
+    try_it_out_and_count_regex = re.compile(r'"\);\ncount=([0-9]+); tryItOut\("', re.MULTILINE)
+    with io.open(str(infilename), "r", encoding="utf-8", errors="replace") as f:
+        infile_contents = re.sub(try_it_out_and_count_regex, ';\\\n"); count=\\1; tryItOut("\\\n', f.read())
+    with io.open(str(infilename), "w", encoding="utf-8", errors="replace") as f:
+        f.write(infile_contents)
 
-    isLevOverallMismatchAsmJsAvailable = (lev == JS_OVERALL_MISMATCH and  # pylint: disable=invalid-name
-                                          file_contains_str(str(infilename), "isAsmJSCompilationAvailable"))
-    # Step 5 (not always run): Run character reduction within interesting lines.
-    if lith_result == LITH_FINISHED and origNumOfLines <= 50 and targetTime is None and \
-            lev >= JS_OVERALL_MISMATCH and not isLevOverallMismatchAsmJsAvailable:
-        print()
-        print("Running character reduction...")
-        print()
-        lith_result, lith_details = lith_reduce(["--char"])
-
-    # Step 6: Run line reduction after activating SECOND DDBEGIN with a 1-line offset.
-    if lith_result == LITH_FINISHED and origNumOfLines <= 50 and hasTryItOut and lev >= JS_VG_AMISS:
-        infileContents = []  # pylint: disable=invalid-name
-        with io.open(str(infilename), "r", encoding="utf-8", errors="replace") as f:
-            for line in f:
-                if "NIGEBDD" in line:
-                    infileContents.append(line.replace("NIGEBDD", "DDBEGIN"))
-                    infileContents.append("\n")  # The 1-line offset is added here.
-                    continue
-                infileContents.append(line)
-        with io.open(str(infilename), "w", encoding="utf-8", errors="replace") as f:
-            f.writelines(infileContents)
 
-        print()
-        print("Running line reduction with a 1-line offset...")
-        print()
-        lith_result, lith_details = lith_reduce([])
+def _split_count_lines(infilename):
+    """Move count=X to its own line and add a 1-line offset."""
+    intended_lines = []
+    with io.open(str(infilename), "r", encoding="utf-8", errors="replace") as f:
+        for line in f:  # The testcase is likely to already be partially reduced.
+            if "dumpln(cookie" not in line:  # jsfunfuzz-specific line ignore
+                # This should be simpler than re.compile.
+                intended_lines.append(line.replace("; count=", ";\ncount=")
+                                      .replace('; tryItOut("', ';\ntryItOut("')
+                                      # The 1-line offset is added here.
+                                      .replace("SPLICE DDBEGIN", "SPLICE DDBEGIN\n"))
+    with io.open(str(infilename), "w", encoding="utf-8", errors="replace") as f:
+        f.writelines(intended_lines)
+
+
+def _activate_second_ddbegin(infilename):
+    """Activate the second DDBEGIN with a 1-line offset."""
+    infile_contents = []
+    with io.open(str(infilename), "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if "NIGEBDD" in line:
+                infile_contents.append(line.replace("NIGEBDD", "DDBEGIN"))
+                infile_contents.append("\n")  # The 1-line offset is added here.
+                continue
+            infile_contents.append(line)
+    with io.open(str(infilename), "w", encoding="utf-8", errors="replace") as f:
+        f.writelines(infile_contents)
+
+
+# The stages of reduction_strat, in order
+REDUCTION_STAGES = (
+    ReductionStage("lines", "Running the first line reduction...", []),
+    # --chunksize=1: Reduce only individual lines, for only 1 round.
+    ReductionStage("try-it-out-1", "Running 1 instance of 1-line reduction after moving tryItOut and count=X...",
+                   ["--chunksize=1"], rewrite=_move_try_it_out_and_count, run_if=_is_small_jsfunfuzz_testcase),
+    ReductionStage("count-lines-2", "Running 1 instance of 2-line reduction after moving count=X to its own line...",
+                   ["--chunksize=2"], rewrite=_split_count_lines, run_if=_is_small_jsfunfuzz_testcase),
+    # e.g. to remove pairs of STRICT_MODE lines
+    ReductionStage("lines-2", "Running 1 instance of 2-line reduction again...",
+                   ["--chunksize=2"], run_if=_is_small_jsfunfuzz_testcase),
+    # Reduce characters within interesting lines
+    ReductionStage("chars", "Running character reduction...", ["--char"], run_if=_wants_char_reduction),
+    ReductionStage("offset-lines", "Running line reduction with a 1-line offset...",
+                   [], rewrite=_activate_second_ddbegin, run_if=_is_small_jsfunfuzz_testcase),
+    ReductionStage("final-lines", "Running the final line reduction...", [], run_if=_is_small_jsfunfuzz_testcase),
+)
+
+
+def reduction_strat(logPrefix, infilename, lithArgs, targetTime, lev, lithium_jobs=1,  # pylint: disable=invalid-name
+                    stages=REDUCTION_STAGES):
+    # pylint: disable=missing-param-doc,missing-return-doc,missing-return-type-doc,missing-type-doc
+    # pylint: disable=too-many-arguments,too-many-locals
+    """Reduce jsfunfuzz output files using Lithium by running a sequence of ReductionStages.
+
+    What each stage did is printed and written to the -lith-stages.txt log, and returned as a list of StageStats
+    after the Lithium result and details.
+    """
+    backup_file = (logPrefix.parent / (logPrefix.stem + "-backup"))
+    state = ReductionState(infilename, targetTime, lev)
+    stage_stats = []
+    reduction_count = 0
+
+    for stage in stages:
+        stats = StageStats(stage.name)
+        stage_stats.append(stats)
+        if stage.run_if and not stage.run_if(state):
+            continue
+        stats.ran = True
+        start_time = time.time()
+        stats.lines_before, stats.bytes_before = _file_size(infilename)
+        if stage.rewrite:
+            stage.rewrite(infilename)
 
-    # Step 7: Run line reduction for a final time.
-    if lith_result == LITH_FINISHED and origNumOfLines <= 50 and hasTryItOut and lev >= JS_VG_AMISS:
         print()
-        print("Running the final line reduction...")
+        print(stage.description)
         print()
-        lith_result, lith_details = lith_reduce([])
+        reduction_count += 1
+        # Remove empty elements
+        full_lith_args = [x for x in (stage.strategy + lithArgs) if x]
+        print(" ".join(quote(str(x)) for x in [sys.executable, "-u", "-m", "lithium"] + full_lith_args))
+        desc = "-chars" if stage.strategy == ["--char"] else "-lines"
+        cache_stats = result_cache.stats()
+        state.lith_result, state.lith_details = run_lithium(
+            full_lith_args, (logPrefix.parent / ("%s-%s%s" % (logPrefix.stem, reduction_count, desc))), targetTime,
+            lithium_jobs)
+        if state.lith_result == LITH_FINISHED:
+            shutil.copy2(str(infilename), str(backup_file))
+        # lith_details can be None if testcase no longer becomes interesting
+        if state.orig_num_lines is None and state.lith_details is not None:
+            state.orig_num_lines = int(state.lith_details.split()[0])
+
+        stats.lith_result = state.lith_result
+        new_cache_stats = result_cache.stats()
+        stats.cache_hits = new_cache_stats["hits"] - cache_stats["hits"]
+        stats.cache_misses = new_cache_stats["misses"] - cache_stats["misses"]
+        stats.lines_after, stats.bytes_after = _file_size(infilename)
+        stats.seconds = time.time() - start_time
 
     # Restore from backup if testcase can no longer be reproduced halfway through reduction.
-    if lith_result != LITH_FINISHED:
+    if state.lith_result != LITH_FINISHED:
         # Probably can move instead of copy the backup, once this has stabilised.
         if backup_file.is_file():
             shutil.copy2(str(backup_file), str(infilename))
         else:
             print("DEBUG! backup_file is supposed to be: %s" % backup_file)
 
-    return lith_result, lith_details
+    stages_log = (logPrefix.parent / (logPrefix.stem + "-lith-stages")).with_suffix(".txt")
+    with io.open(str(stages_log), "w", encoding="utf-8", errors="replace") as f:
+        for stats in stage_stats:
+            f.write("%s\n" % stats)
+    print()
+    print("Reduction stages:")
+    for stats in stage_stats:
+        print("  %s" % stats)
+
+    return state.lith_result, state.lith_details, stage_stats
+
+
+def stage_metadata(stage_stats):
+    """Return the stats of the reduction stages as FuzzManager metadata.
+
+    Args:
+        stage_stats (list): StageStats of each stage
+
+    Returns:
+        dict: Metadata to submit along with the testcase
+    """
+    return {"reductionStages": json.dumps([stats.to_dict() for stats in stage_stats], sort_keys=True)}
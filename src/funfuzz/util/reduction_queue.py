@@ -0,0 +1,223 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""An on-disk queue of testcases waiting to be reduced, shared by fuzzing processes and reducer processes.
+
+Each job is a directory holding a job.json file along with the testcase and logs it needs. A job moves from the
+pending directory to the running directory when a reducer claims it, then to the done directory. Directory renames are
+atomic, so no job is claimed twice, and the job directory is named after the crash signature, so no signature is
+queued twice (see signature_index.signature_key).
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals  # isort:skip
+
+from builtins import object
+import errno
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+if sys.version_info.major == 2:
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+
+JOB_STATES = ("pending", "running", "done")
+# Done jobs are removed after this many seconds, after which their signature can be queued again
+DONE_MAX_AGE = 24 * 60 * 60
+
+
+def get_queue_dir(base_dir=None):
+    """Retrieve the default reduction queue directory, and create one if needed. The queue holds testcases for one
+    build only, so bots keep it in the temporary directory of their run.
+
+    Args:
+        base_dir (Path): Base directory to create the queue directory in, defaults to the home directory
+
+    Returns:
+        Path: Full path to the queue directory
+    """
+    queue_dir = (base_dir or Path.home()) / "reduction-queue"
+    queue_dir.mkdir(exist_ok=True)
+    return queue_dir
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        return ex.errno == errno.EPERM
+    return True
+
+
+class ReductionQueue(object):
+    """Directory-based job queue, safe to use from any number of processes at once.
+
+    Args:
+        queue_dir (Path): Directory holding the pending, running and done directories
+    """
+    def __init__(self, queue_dir):
+        self.queue_dir = Path(queue_dir)
+        for state in JOB_STATES:
+            (self.queue_dir / state).mkdir(parents=True, exist_ok=True)
+
+    def job_dir(self, state, key):
+        """Return the directory of a job.
+
+        Args:
+            state (str): One of JOB_STATES
+            key (str): Signature key of the job
+
+        Returns:
+            Path: Job directory
+        """
+        return self.queue_dir / state / key
+
+    def is_known(self, key):
+        """Return whether a signature has been queued already, whether or not it has been reduced yet.
+
+        Args:
+            key (str): Signature key
+
+        Returns:
+            bool: True if a job exists for the signature
+        """
+        return any(self.job_dir(state, key).is_dir() for state in JOB_STATES)
+
+    def enqueue(self, key, job, files):
+        """Queue a testcase for reduction, unless its signature has been queued before.
+
+        Args:
+            key (str): Signature key of the testcase, see signature_index.signature_key
+            job (dict): Anything JSON can store, needed by the reducer
+            files (dict): Files copied into the job directory, by their name there
+
+        Returns:
+            bool: True if the job was queued, False if its signature was queued before
+        """
+        if self.is_known(key):
+            return False
+        staging_dir = Path(tempfile.mkdtemp(prefix="staging-", dir=str(self.queue_dir)))
+        for name, path in files.items():
+            shutil.copy2(str(path), str(staging_dir / name))
+        with io.open(str(staging_dir / "job.json"), "w", encoding="utf-8", errors="replace") as f:
+            f.write(json.dumps(job, sort_keys=True))
+        try:
+            os.rename(str(staging_dir), str(self.job_dir("pending", key)))
+        except OSError:  # Another process queued the same signature in the meantime
+            shutil.rmtree(str(staging_dir))
+            return False
+        return True
+
+    def update_pending(self, key, files):
+        """Replace files of a job which is still pending, e.g. with a shorter testcase.
+
+        Args:
+            key (str): Signature key of the job
+            files (dict): Files copied into the job directory, by their name there
+
+        Returns:
+            bool: True if the files were replaced, False if the job is not pending anymore
+        """
+        staging_dir = Path(tempfile.mkdtemp(prefix="staging-", dir=str(self.queue_dir)))
+        staging_dir.rmdir()
+        try:
+            # Take the job out of the pending directory so no reducer claims it halfway through
+            os.rename(str(self.job_dir("pending", key)), str(staging_dir))
+        except OSError:
+            return False
+        for name, path in files.items():
+            shutil.copy2(str(path), str(staging_dir / name))
+        try:
+            os.rename(str(staging_dir), str(self.job_dir("pending", key)))
+        except OSError:  # Queued again by another process in the meantime, that job is as good as this one
+            shutil.rmtree(str(staging_dir))
+        return True
+
+    def claim(self):
+        """Take the oldest pending job, if any.
+
+        Returns:
+            tuple: Signature key, job directory and job contents, or None if nothing is pending
+        """
+        pending = sorted(self.queue_dir.glob("pending/*"), key=lambda x: x.stat().st_mtime)
+        for pending_dir in pending:
+            running_dir = self.job_dir("running", pending_dir.name)
+            try:
+                os.rename(str(pending_dir), str(running_dir))
+            except OSError:  # Claimed by another reducer first
+                continue
+            (running_dir / "reducer.pid").write_text(str(os.getpid()))
+            with io.open(str(running_dir / "job.json"), "r", encoding="utf-8", errors="replace") as f:
+                return pending_dir.name, running_dir, json.load(f)
+        return None
+
+    def finish(self, key, result):
+        """Mark a claimed job as done.
+
+        Args:
+            key (str): Signature key of the job
+            result (dict): Outcome of the reduction, anything JSON can store
+        """
+        running_dir = self.job_dir("running", key)
+        with io.open(str(running_dir / "result.json"), "w", encoding="utf-8", errors="replace") as f:
+            f.write(json.dumps(result, sort_keys=True))
+        os.rename(str(running_dir), str(self.job_dir("done", key)))
+
+    def requeue_stale(self):
+        """Put jobs back in the pending directory if the reducer which claimed them is gone.
+
+        Returns:
+            list: Signature keys of the jobs put back
+        """
+        requeued = []
+        for running_dir in self.queue_dir.glob("running/*"):
+            pid_file = running_dir / "reducer.pid"
+            try:
+                pid = int(pid_file.read_text())
+            except (IOError, OSError, ValueError):  # Just claimed, the reducer has not written its pid yet
+                continue
+            if _pid_alive(pid):
+                continue
+            pid_file.unlink()
+            try:
+                os.rename(str(running_dir), str(self.job_dir("pending", running_dir.name)))
+                requeued.append(running_dir.name)
+            except OSError:  # Requeued by another process first
+                pass
+        return requeued
+
+    def prune_done(self, max_age=DONE_MAX_AGE):
+        """Remove jobs which were done more than some time ago, so their signature can be queued again.
+
+        Args:
+            max_age (float): Number of seconds done jobs are kept for
+
+        Returns:
+            list: Signature keys of the jobs removed
+        """
+        pruned = []
+        for done_dir in self.queue_dir.glob("done/*"):
+            try:
+                if time.time() - done_dir.stat().st_mtime <= max_age:
+                    continue
+                shutil.rmtree(str(done_dir))
+            except OSError:  # Removed by another process first
+                continue
+            pruned.append(done_dir.name)
+        return pruned
+
+    def counts(self):
+        """Return the number of jobs in each state.
+
+        Returns:
+            dict: Number of jobs, by state
+        """
+        return {state: len(list(self.queue_dir.glob(state + "/*"))) for state in JOB_STATES}
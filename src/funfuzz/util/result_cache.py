@@ -0,0 +1,78 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Remember interestingness results by testcase contents, so Lithium does not run the js shell again on a testcase it
+has already tried, e.g. in a later step of lithium_helpers.reduction_strat.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals  # isort:skip
+
+import hashlib
+import io
+import threading
+
+# Results are forgotten all at once past this many, a single reduction is far from reaching it
+MAX_RESULTS = 100000
+
+# Interestingness results, keyed on the scope and the hash of the testcase contents
+RESULTS = {}
+# Number of cache hits and misses, reported per stage by lithium_helpers.reduction_strat
+STATS = {"hits": 0, "misses": 0}
+STATS_LOCK = threading.Lock()
+
+
+def content_hash(testcase):
+    """Return the SHA-1 hash of the contents of a testcase.
+
+    Args:
+        testcase (Path): Testcase file
+
+    Returns:
+        str: Hexadecimal hash of the testcase contents
+    """
+    with io.open(str(testcase), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def stats():
+    """Return the number of cache hits and misses so far.
+
+    Returns:
+        dict: Number of hits and misses, by name
+    """
+    with STATS_LOCK:
+        return dict(STATS)
+
+
+def cached_result(scope, testcase, test):
+    """Return whether a testcase is interesting, only running the test if a testcase with the same contents was not
+    tested before within the same scope.
+
+    Args:
+        scope (tuple): Everything else the result depends on, e.g. the hash of the js shell binary, the flags and the
+                       minimum interesting level
+        testcase (Path): Testcase file
+        test (function): Runs the test, returning whether the testcase is interesting and whether that result can be
+                         remembered, e.g. not when the js shell timed out, as it may not the next time
+
+    Returns:
+        bool: True if the testcase is interesting
+    """
+    key = (scope, content_hash(testcase))
+    if key in RESULTS:
+        with STATS_LOCK:
+            STATS["hits"] += 1
+        print("Reusing the result of an earlier test of the same testcase: %s" % (
+            "interesting" if RESULTS[key] else "not interesting"))
+        return RESULTS[key]
+    with STATS_LOCK:
+        STATS["misses"] += 1
+    interesting, cacheable = test()
+    if cacheable:
+        if len(RESULTS) >= MAX_RESULTS:
+            RESULTS.clear()
+        RESULTS[key] = interesting
+    return interesting
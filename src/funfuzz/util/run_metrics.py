@@ -0,0 +1,205 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Throughput metrics of a fuzzing loop: one JSON line per shell run, queued testcase and reduction, with a summary
+every now and then, and optionally the latest summary served over HTTP on the local host.
+"""
+
+from __future__ import absolute_import, division, unicode_literals  # isort:skip
+
+from builtins import object
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+if sys.version_info.major == 2:
+    from BaseHTTPServer import BaseHTTPRequestHandler  # pylint: disable=import-error
+    from BaseHTTPServer import HTTPServer  # pylint: disable=import-error
+else:
+    from http.server import BaseHTTPRequestHandler  # pylint: disable=import-error
+    from http.server import HTTPServer  # pylint: disable=import-error
+
+# Percentiles of the shell run time are computed over this many of the latest runs
+ELAPSED_WINDOW = 1000
+# Number of seconds between summary lines
+SUMMARY_INTERVAL = 60
+# Number of most frequent flag sets in a summary
+TOP_FLAG_SETS = 20
+
+
+def _percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of sorted values, or None if there are none."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def _rate(count, total):
+    """Return count / total, or None if total is 0."""
+    return count / total if total else None
+
+
+class RunMetrics(object):
+    """Collect metrics of the shell runs and reductions of one loop process.
+
+    Args:
+        metrics_file (Path): File to append JSON lines to, if any. Lines are appended atomically, so several
+                             processes can share the file.
+        summary_interval (float): Number of seconds between summary lines
+    """
+    def __init__(self, metrics_file=None, summary_interval=SUMMARY_INTERVAL):
+        self.metrics_file = metrics_file
+        self.summary_interval = summary_interval
+        self.start_time = time.time()
+        self.last_summary_time = self.start_time
+        self.runs = 0
+        self.timeouts = 0
+        self.ooms = 0
+        self.crashes = 0
+        self.interesting = 0
+        self.elapsed_total = 0.0
+        self.elapsed = collections.deque(maxlen=ELAPSED_WINDOW)
+        self.queued = 0
+        self.reductions = 0
+        self.reduction_seconds = 0.0
+        self.queue_depth = None
+        self.flag_sets = collections.Counter()
+        # Runs, seconds, timeouts and interesting results by flag
+        self.flags = collections.defaultdict(collections.Counter)
+        self._lock = threading.Lock()  # The HTTP server thread takes snapshots
+
+    def _write(self, event, values):
+        if not self.metrics_file:
+            return
+        line = json.dumps(dict(values, event=event, time=time.time(), pid=os.getpid()), sort_keys=True)
+        fd = os.open(str(self.metrics_file), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (line + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def record_run(self, elapsed, lev, timed_out, oom, crashed, flags):  # pylint: disable=too-many-arguments
+        """Record the outcome of one shell run.
+
+        Args:
+            elapsed (float): Number of seconds the run took
+            lev (int): js_interesting level of the result
+            timed_out (bool): Whether the shell was killed for running too long
+            oom (bool): Whether the shell ran out of memory
+            crashed (bool): Whether the shell crashed
+            flags (list): Flags the shell was run with
+        """
+        flags = [str(x) for x in flags]
+        with self._lock:
+            self.runs += 1
+            self.timeouts += timed_out
+            self.ooms += oom
+            self.crashes += crashed
+            self.interesting += lev > 0
+            self.elapsed_total += elapsed
+            self.elapsed.append(elapsed)
+            self.flag_sets[" ".join(flags)] += 1
+            for flag in flags:
+                self.flags[flag].update({"runs": 1, "seconds": elapsed, "timeouts": int(timed_out),
+                                         "interesting": int(lev > 0)})
+        self._write("run", {"elapsed": elapsed, "lev": lev, "timed_out": bool(timed_out), "oom": bool(oom),
+                            "crashed": bool(crashed), "flags": flags})
+
+    def record_queued(self, queue_depth):
+        """Record a testcase being queued for reduction by another process.
+
+        Args:
+            queue_depth (int): Number of testcases waiting in the reduction queue, including this one
+        """
+        with self._lock:
+            self.queued += 1
+            self.queue_depth = queue_depth
+        self._write("queued", {"queue_depth": queue_depth})
+
+    def record_reduction(self, seconds, queue_depth=None):
+        """Record a reduction.
+
+        Args:
+            seconds (float): Number of seconds the reduction took
+            queue_depth (int): Number of testcases still waiting in the reduction queue, if the testcase came from it
+        """
+        with self._lock:
+            self.reductions += 1
+            self.reduction_seconds += seconds
+            if queue_depth is not None:
+                self.queue_depth = queue_depth
+        self._write("reduction", {"seconds": seconds, "queue_depth": queue_depth})
+
+    def snapshot(self):
+        """Return the metrics so far.
+
+        Returns:
+            dict: Metrics, by name
+        """
+        with self._lock:
+            uptime = time.time() - self.start_time
+            elapsed = sorted(self.elapsed)
+            return {
+                "uptime": uptime,
+                "runs": self.runs,
+                "runs_per_second": _rate(self.runs, uptime),
+                "elapsed_mean": _rate(self.elapsed_total, self.runs),
+                "elapsed_p50": _percentile(elapsed, 0.5),
+                "elapsed_p90": _percentile(elapsed, 0.9),
+                "elapsed_p99": _percentile(elapsed, 0.99),
+                "timeout_rate": _rate(self.timeouts, self.runs),
+                "oom_rate": _rate(self.ooms, self.runs),
+                "crash_rate": _rate(self.crashes, self.runs),
+                "interesting_rate": _rate(self.interesting, self.runs),
+                "queued": self.queued,
+                "reductions": self.reductions,
+                "reduction_seconds": self.reduction_seconds,
+                "reduction_queue_depth": self.queue_depth,
+                "flag_sets": dict(self.flag_sets.most_common(TOP_FLAG_SETS)),
+                "flags": {flag: dict(counts) for flag, counts in self.flags.items()},
+            }
+
+    def maybe_write_summary(self, force=False):
+        """Append a summary line, if the summary interval has passed since the previous one.
+
+        Args:
+            force (bool): Write the summary line anyway, e.g. when the loop is done
+        """
+        if force or time.time() - self.last_summary_time >= self.summary_interval:
+            self.last_summary_time = time.time()
+            self._write("summary", self.snapshot())
+
+    def serve(self, port):
+        """Serve the latest metrics as JSON over HTTP on the local host, from a daemon thread.
+
+        Args:
+            port (int): TCP port to listen on
+
+        Returns:
+            HTTPServer: The server, which can be stopped with shutdown()
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):  # pylint: disable=missing-docstring
+            def do_GET(self):  # pylint: disable=invalid-name,missing-docstring
+                body = json.dumps(metrics.snapshot(), sort_keys=True).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        server = HTTPServer((str("127.0.0.1"), port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, name="Metrics server")
+        thread.daemon = True
+        thread.start()
+        return server
@@ -63,6 +63,17 @@ class S3Cache(object):  # pylint: disable=missing-docstring
             return True
         return False
 
+    def list_names(self, prefix):
+        """List the files in the S3 bucket whose name starts with a prefix.
+
+        Args:
+            prefix (str): Start of the file names
+
+        Returns:
+            list: File names
+        """
+        return [key.name for key in self.bucket.list(prefix=prefix)]
+
     def compressAndUploadDirTarball(self, directory, tarball_path):  # pylint: disable=invalid-name,missing-param-doc
         # pylint: disable=missing-type-doc
         """Compress a directory into a bz2 tarball and upload it to S3."""
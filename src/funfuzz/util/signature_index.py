@@ -0,0 +1,108 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Keep track of the crash signatures found by all fuzzing processes of a session, so each one is only reduced once.
+
+Each signature has its own file, to which every occurrence is appended as one JSON line. Appends of a single short
+line are atomic, so any number of processes can record occurrences at the same time without locking.
+"""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+from builtins import object
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+
+if sys.version_info.major == 2:
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+
+
+def signature_key(crash_info, issues):
+    """Return a short name identifying the crash signature of a result.
+
+    Args:
+        crash_info (CrashInfo): FuzzManager CrashInfo of the result
+        issues (list): Issues found by js_interesting, used when FuzzManager cannot create a signature
+
+    Returns:
+        str: Hexadecimal hash of the signature
+    """
+    try:
+        raw_signature = crash_info.createCrashSignature().rawSignature
+    except (AttributeError, RuntimeError):  # Not enough data for a signature, e.g. "jsfunfuzz didn't finish"
+        raw_signature = "\n".join(issues)
+    return hashlib.sha1(raw_signature.encode("utf-8")).hexdigest()
+
+
+class SignatureEntry(object):  # pylint: disable=too-few-public-methods
+    """What is known about one signature.
+
+    Args:
+        occurrences (list): Dicts with the time, testcase and size of each occurrence, in the order they were recorded
+    """
+    def __init__(self, occurrences):
+        self.count = len(occurrences)
+        self.first_seen = occurrences[0]["time"]
+        self.first_testcase = occurrences[0]["testcase"]
+        shortest = min(occurrences, key=lambda x: x["size"])
+        self.shortest_testcase = shortest["testcase"]
+        self.shortest_size = shortest["size"]
+
+
+class SignatureIndex(object):
+    """Signatures found so far, shared through a directory.
+
+    Args:
+        index_dir (Path): Directory holding one file per signature
+    """
+    def __init__(self, index_dir):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+
+    def lookup(self, key):
+        """Return what is known about a signature.
+
+        Args:
+            key (str): Signature key, see signature_key
+
+        Returns:
+            SignatureEntry: Occurrences of the signature so far, or None if it has not been seen yet
+        """
+        occurrences = []
+        try:
+            with io.open(str(self.index_dir / (key + ".jsonl")), "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    try:
+                        occurrences.append(json.loads(line))
+                    except ValueError:  # A line still being written
+                        pass
+        except (IOError, OSError):
+            return None
+        return SignatureEntry(occurrences) if occurrences else None
+
+    def record(self, key, testcase):
+        """Record an occurrence of a signature.
+
+        Args:
+            key (str): Signature key, see signature_key
+            testcase (Path): Testcase which has the signature
+
+        Returns:
+            SignatureEntry: Occurrences of the signature so far, including this one
+        """
+        line = json.dumps({"time": time.time(), "testcase": str(testcase), "size": Path(testcase).stat().st_size})
+        fd = os.open(str(self.index_dir / (key + ".jsonl")), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (line + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+        return self.lookup(key)
@@ -0,0 +1,145 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Run a process with a timeout like Lithium's timed_run does, but capture its output in memory instead of log files.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals  # isort:skip
+
+import io
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+import lithium.interestingness.timed_run as lithium_timed_run
+
+if sys.version_info.major == 2 and os.name == "posix":
+    import subprocess32 as subprocess  # pylint: disable=import-error
+else:
+    import subprocess
+
+# Output beyond this many bytes per stream spills over into an anonymous temporary file
+CAPTURE_MEMORY_LIMIT = 4 * 2**20
+
+
+def run_status(return_code, killed):
+    """Classify the way a process ended, the same way Lithium's timed_run does.
+
+    Args:
+        return_code (int): Return code of the process
+        killed (bool): Whether the process was killed by us after a timeout
+
+    Returns:
+        tuple: Lithium status constant and its accompanying message
+    """
+    if killed and (os.name != "posix" or return_code == -signal.SIGKILL):  # pylint: disable=no-member
+        return lithium_timed_run.TIMED_OUT, "TIMED OUT"
+    elif return_code == 0:
+        return lithium_timed_run.NORMAL, "NORMAL"
+    elif return_code == lithium_timed_run.ASAN_EXIT_CODE:
+        return lithium_timed_run.CRASHED, "CRASHED (Address Sanitizer fault)"
+    elif 0 < return_code < 0x80000000:
+        return lithium_timed_run.ABNORMAL, "ABNORMAL exit code " + str(return_code)
+    signum = -return_code
+    return lithium_timed_run.CRASHED, "CRASHED signal %d (%s)" % (
+        signum, lithium_timed_run.get_signal_name(signum, "Unknown signal"))
+
+
+def new_spool():
+    """Return a buffer for captured output.
+
+    Returns:
+        SpooledTemporaryFile: Binary buffer kept in memory up to CAPTURE_MEMORY_LIMIT bytes
+    """
+    return tempfile.SpooledTemporaryFile(max_size=CAPTURE_MEMORY_LIMIT)
+
+
+def spool_lines(spool):
+    """Iterate over the lines of captured output.
+
+    Args:
+        spool (SpooledTemporaryFile): Captured output
+
+    Yields:
+        str: Each line, decoded as utf-8
+    """
+    spool.seek(0)
+    for line in spool:
+        yield line.decode("utf-8", errors="replace")
+
+
+def save_spool(spool, path):
+    """Write captured output to a log file.
+
+    Args:
+        spool (SpooledTemporaryFile): Captured output
+        path (Path): Log file to be created
+    """
+    spool.seek(0)
+    with io.open(str(path), "wb") as f:
+        shutil.copyfileobj(spool, f)
+
+
+def _drain(stream, spool):
+    """Copy everything from a pipe into a spool, until the pipe is closed."""
+    for chunk in iter(lambda: stream.read(65536), b""):
+        spool.write(chunk)
+    stream.close()
+
+
+def timed_run(command, timeout, _log_prefix, env=None, preexec_fn=None, cancel=None):
+    # pylint: disable=too-many-arguments
+    """Drop-in replacement for Lithium's timed_run, with the output kept in spools instead of written to log files.
+
+    Args:
+        command (list): Command with arguments
+        timeout (int): Number of seconds after which the process gets killed
+        _log_prefix (str): Unused, for compatibility with Lithium's timed_run
+        env (dict): Environment of the process
+        preexec_fn (function): Function run in the process before the command itself
+        cancel (threading.Event): If given, the process also gets killed as soon as this is set
+
+    Returns:
+        rundata: Lithium run information, with the out and err attributes being spools rather than log file names
+    """
+    start_time = time.time()
+    child = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        close_fds=(os.name == "posix"),
+        env=env,
+        preexec_fn=preexec_fn
+    )
+    out = new_spool()
+    err = new_spool()
+    drains = [threading.Thread(target=_drain, args=(child.stdout, out)),
+              threading.Thread(target=_drain, args=(child.stderr, err))]
+    for drain in drains:
+        drain.start()
+
+    killed = False
+    while True:
+        remaining = max(start_time + timeout - time.time(), 0)
+        try:
+            return_code = child.wait(timeout=(remaining if cancel is None else min(remaining, 0.1)))
+            break
+        except subprocess.TimeoutExpired:
+            if not remaining or (cancel is not None and cancel.is_set()):
+                child.kill()
+                killed = True
+                return_code = child.wait()
+                break
+    for drain in drains:
+        drain.join()
+    elapsed_time = time.time() - start_time
+
+    sta, msg = run_status(return_code, killed)
+    return lithium_timed_run.rundata(sta, return_code, msg, elapsed_time, killed, child.pid, out, err)
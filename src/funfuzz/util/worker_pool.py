@@ -0,0 +1,290 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Supervise a pool of worker processes: restart the ones that crash and size the pool to the memory available.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals  # isort:skip
+
+from builtins import object
+import io
+import multiprocessing
+import os
+import platform
+import signal
+import sys
+import threading
+import time
+
+if sys.version_info.major == 2:
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+
+# Workers crashing this many times in a row are not restarted anymore
+MAX_CONSECUTIVE_CRASHES = 5
+# Crashes of a worker which ran at least this many seconds do not count as in a row with the crashes before
+STABLE_RUN_TIME = 10 * 60
+# A worker gets stopped when less than this fraction of the memory needed by one worker is left
+LOW_MEMORY_RATIO = 0.25
+# Measured peaks are scaled up by this much, as the next testcase may well need more memory than the previous ones
+PEAK_RSS_HEADROOM = 1.25
+
+
+def available_memory():
+    """Return the amount of memory that can be used without swapping.
+
+    Returns:
+        int: Number of bytes, or None if it cannot be determined on this platform
+    """
+    try:
+        with io.open("/proc/meminfo", "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    try:
+        return os.sysconf(str("SC_AVPHYS_PAGES")) * os.sysconf(str("SC_PAGE_SIZE"))  # pylint: disable=no-member
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def peak_rss():
+    """Return the peak resident set size of this process, and of the largest of its finished child processes.
+
+    Returns:
+        tuple: Number of bytes for this process and for the child process, or None if it cannot be determined on this
+               platform
+    """
+    try:
+        import resource  # pylint: disable=import-error
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    unit = 1 if platform.system() == "Darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,  # pylint: disable=no-member
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)  # pylint: disable=no-member
+
+
+def _sample_peak_rss(peaks, interval):
+    """Keep the highest peak_rss values of a worker in a shared array, for the pool to size itself with."""
+    while True:
+        sample = peak_rss()
+        if sample is None:
+            return
+        with peaks.get_lock():
+            peaks[0] = max(peaks[0], sample[0])
+            peaks[1] = max(peaks[1], sample[1])
+        time.sleep(interval)
+
+
+def log_name(log_dir, i, log_type):
+    """Returns the path of a worker log file.
+
+    Args:
+        log_dir (Path): Directory of the log file
+        i (int): Worker number
+        log_type (str): Log type, "out" or "err"
+
+    Returns:
+        Path: The worker log file path
+    """
+    return Path(log_dir) / ("worker-%s-%s.txt" % (i, log_type))
+
+
+def _run_worker(log_dir, i, target, args, peaks, interval):  # pylint: disable=too-many-arguments
+    """Call target in a worker process, with its output appended to the worker log files, while sampling its memory
+    usage.
+
+    Functions used by WorkerPool are top-level so they can be "pickled" (required on Windows). The worker leads its
+    own process group, so stopping it also stops the js shells and reductions it runs.
+    """
+    if hasattr(os, "setsid"):
+        os.setsid()  # pylint: disable=no-member
+    sys.stdout = io.open(str(log_name(log_dir, i, "out")), "a", encoding="utf-8", errors="replace", buffering=1)
+    sys.stderr = io.open(str(log_name(log_dir, i, "err")), "a", encoding="utf-8", errors="replace", buffering=1)
+    sampler = threading.Thread(target=_sample_peak_rss, args=(peaks, interval))
+    sampler.daemon = True
+    sampler.start()
+    target(*(args + (i,)))
+
+
+class WorkerStats(object):  # pylint: disable=too-few-public-methods
+    """Bookkeeping of one worker slot of the pool."""
+    def __init__(self):
+        self.starts = 0
+        self.crashes = 0
+        self.consecutive_crashes = 0
+        self.finished = False
+        self.stopped = 0
+        self.run_time = 0.0
+
+
+class WorkerPool(object):
+    """Run target(*args, i) in up to max_workers processes until the deadline.
+
+    A worker that crashes, i.e. exits with a non-zero exit code, is restarted, unless it keeps crashing. A worker that
+    exits normally is done. The number of workers is kept below what the available memory can hold: new workers are
+    only started when there is room, and the newest worker is stopped when memory runs low, to be started again later
+    once there is room again.
+
+    How much memory a worker needs is measured from the peak resident set size of the worker itself plus that of the
+    largest process it ran, e.g. a js shell. Until the first measurement comes in, memory_per_worker is assumed.
+
+    Args:
+        log_dir (Path): Directory for the worker log files
+        target (function): Top-level function run by each worker, with the worker number appended to args
+        args (tuple): Arguments for target
+        max_workers (int): Maximum number of concurrent workers
+        memory_per_worker (int): Number of bytes of memory each worker is expected to need, until measured
+        poll_interval (float): Number of seconds between checks of the workers
+        child_memory_limit (int): Number of bytes a child process of a worker can use at most, e.g. due to its
+                                  RLIMIT_AS, if any
+    """
+    def __init__(self, log_dir, target, args, max_workers, memory_per_worker, poll_interval=5,
+                 child_memory_limit=None):
+        # pylint: disable=too-many-arguments
+        self.log_dir = Path(log_dir)
+        self.target = target
+        self.args = tuple(args)
+        self.max_workers = max_workers
+        self.memory_per_worker = memory_per_worker
+        self.poll_interval = poll_interval
+        self.child_memory_limit = child_memory_limit
+        self.stats = [WorkerStats() for _ in range(max_workers)]
+        # Highest peak resident set size of each worker slot and of the largest process it ran, in bytes
+        self._peaks = [multiprocessing.Array(str("d"), 2) for _ in range(max_workers)]
+        self._processes = {}
+        self._start_times = {}
+
+    def worker_memory(self):
+        """Return how much memory a worker is expected to need.
+
+        Returns:
+            int: Number of bytes
+        """
+        measured = [(peaks[0], peaks[1]) for peaks in self._peaks if peaks[0]]
+        if not measured:
+            return self.memory_per_worker
+        worker_rss = max(x[0] for x in measured)
+        child_rss = max(x[1] for x in measured)
+        if self.child_memory_limit:
+            child_rss = min(child_rss, self.child_memory_limit)
+        return int((worker_rss + child_rss) * PEAK_RSS_HEADROOM)
+
+    def wanted_workers(self):
+        """Return how many workers should be running, given the memory available right now.
+
+        Returns:
+            int: Number of workers, at least 1
+        """
+        free_memory = available_memory()
+        if free_memory is None:
+            return self.max_workers
+        worker_memory = self.worker_memory()
+        running = len(self._processes)
+        if free_memory < worker_memory * LOW_MEMORY_RATIO:
+            return max(running - 1, 1)
+        return max(min(self.max_workers, running + int(free_memory // worker_memory)), 1)
+
+    def _start(self, i):
+        process = multiprocessing.Process(
+            target=_run_worker, args=[self.log_dir, i, self.target, self.args, self._peaks[i], self.poll_interval],
+            name="Worker process " + str(i))
+        process.start()
+        self._processes[i] = process
+        self._start_times[i] = time.time()
+        self.stats[i].starts += 1
+        print("=== Started worker #%d (%d) ===" % (i, process.pid))
+
+    def _terminate(self, i):
+        process = self._processes[i]
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(process.pid, signal.SIGTERM)  # pylint: disable=no-member
+                return
+            except OSError:  # The worker has not made its own process group yet
+                pass
+        process.terminate()
+
+    def _reap(self, i):
+        process = self._processes.pop(i)
+        process.join()
+        run_time = time.time() - self._start_times.pop(i)
+        self.stats[i].run_time += run_time
+        return process.exitcode, run_time
+
+    def _check_workers(self):
+        for i in list(self._processes):
+            if self._processes[i].is_alive():
+                continue
+            exit_code, run_time = self._reap(i)
+            stats = self.stats[i]
+            if exit_code == 0:
+                stats.finished = True
+                stats.consecutive_crashes = 0
+                print("=== Worker #%d is done ===" % i)
+            else:
+                stats.crashes += 1
+                stats.consecutive_crashes = 1 if run_time >= STABLE_RUN_TIME else stats.consecutive_crashes + 1
+                print("=== Worker #%d crashed with exit code %s, see %s ===" % (
+                    i, exit_code, log_name(self.log_dir, i, "err")))
+
+    def _idle_slots(self):
+        return [i for i, stats in enumerate(self.stats) if i not in self._processes and not stats.finished and
+                stats.consecutive_crashes < MAX_CONSECUTIVE_CRASHES]
+
+    def _rebalance(self, start_workers):
+        wanted = self.wanted_workers()
+        while len(self._processes) > wanted:
+            newest = max(self._processes, key=lambda x: self._start_times[x])
+            print("=== Stopping worker #%d, memory is running low ===" % newest)
+            self._terminate(newest)
+            self._reap(newest)
+            self.stats[newest].stopped += 1
+        if start_workers:
+            for i in self._idle_slots()[:max(wanted - len(self._processes), 0)]:
+                self._start(i)
+
+    def run(self, deadline):
+        """Keep the workers going until all of them are done. Past the deadline, workers that crashed or were stopped
+        do not get started anymore, while running workers are left to finish by themselves.
+
+        Args:
+            deadline (float): Time after which no worker gets started anymore
+
+        Returns:
+            list: WorkerStats of each worker slot
+        """
+        try:
+            while True:
+                self._check_workers()
+                start_workers = time.time() < deadline
+                if not self._processes and not (start_workers and self._idle_slots()):
+                    break
+                self._rebalance(start_workers)
+                time.sleep(self.poll_interval)
+        finally:
+            for i in list(self._processes):
+                self._terminate(i)
+                self._reap(i)
+        return self.stats
+
+    def summary(self):
+        """Describe what each worker did.
+
+        Returns:
+            str: One line per worker slot, followed by the totals
+        """
+        lines = ["Worker #%d: started %d times, crashed %d times, stopped %d times for memory, ran %.0f seconds, "
+                 "peak RSS %d MB (largest child %d MB)" % (
+                     i, stats.starts, stats.crashes, stats.stopped, stats.run_time,
+                     self._peaks[i][0] // 2**20, self._peaks[i][1] // 2**20) for i, stats in enumerate(self.stats)]
+        lines.append("Total: %d crashes, %.0f seconds of worker time, %d MB of memory needed per worker" % (
+            sum(stats.crashes for stats in self.stats), sum(stats.run_time for stats in self.stats),
+            self.worker_memory() // 2**20))
+        return "\n".join(lines)
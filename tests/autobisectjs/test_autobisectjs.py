@@ -0,0 +1,155 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the autobisectjs.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import argparse
+import logging
+import sys
+import time
+import unittest
+
+from _pytest.monkeypatch import MonkeyPatch
+
+from funfuzz.autobisectjs import autobisectjs
+from funfuzz.autobisectjs import known_broken_earliest_working as kbew
+from funfuzz.autobisectjs import label_cache
+from funfuzz.autobisectjs import revision_graph
+from funfuzz.js import build_options
+from funfuzz.js import compile_shell
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class AutobisectjsTests(unittest.TestCase):
+    """"TestCase class for functions in autobisectjs.py"""
+    monkeypatch = MonkeyPatch()
+
+    def test_bisection_midpoints(self):
+        """Test that the revisions compiled ahead of time are the ones bisection needs next, soonest first."""
+        untested = ["r%d" % i for i in range(15)]
+        self.assertEqual(autobisectjs.bisection_midpoints(untested, "r7", 2), ["r3", "r11"])
+        self.assertEqual(autobisectjs.bisection_midpoints(untested, "r7", 6), ["r3", "r11", "r1", "r5", "r9", "r13"])
+        self.assertEqual(autobisectjs.bisection_midpoints(untested, "r1", 3), ["r0", "r8", "r5"])
+        self.assertEqual(autobisectjs.bisection_midpoints(["r0", "r1"], "r1", 4), ["r0"])
+        self.assertEqual(autobisectjs.bisection_midpoints(untested, "r14", 0), [])
+
+    def test_prefer_cached_rev(self):
+        """Test that cached revisions are only preferred if testing them tells almost as much."""
+        untested = ["r%d" % i for i in range(15)]
+        self.assertAlmostEqual(autobisectjs.split_info(7, 15), 1)
+        self.assertLess(autobisectjs.split_info(2, 15), autobisectjs.split_info(5, 15))
+        self.assertEqual(autobisectjs.prefer_cached_rev(untested, "r7", {"r5", "r12"}, 0.2), "r5")
+        self.assertEqual(autobisectjs.prefer_cached_rev(untested, "r7", {"r12"}, 0.2), "r7")
+        self.assertEqual(autobisectjs.prefer_cached_rev(untested, "r7", {"r12"}, 0.5), "r12")
+        self.assertEqual(autobisectjs.prefer_cached_rev(untested, "r7", {"r6", "r7"}, 0.2), "r7")
+
+    def test_find_busted_range(self):
+        """Test that both ends of compilation bustage are bisected to, then remembered and skipped."""
+        with tempfile.TemporaryDirectory(suffix="find_busted_range_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            AutobisectjsTests.monkeypatch.setattr(kbew, "get_known_broken_dir", lambda base_dir=None: tmp_dir)
+            graph = revision_graph.RevisionGraph(
+                ["%d %012x %d -1" % (rev, rev, rev - 1) for rev in range(100)])
+            AutobisectjsTests.monkeypatch.setattr(compile_shell, "is_busted",
+                                                  lambda _build_opts, rev: 40 <= graph.rev(rev) < 60)
+            options = argparse.Namespace(graph=graph, skipRevs=set(),
+                                         build_options=build_options.addParserOptions()[0].parse_args([]))
+            bisection = revision_graph.Bisection(graph)
+            labels = {"%012x" % 0: ("good", "assumed start rev is good")}
+            tested = []
+
+            def test_rev(rev):
+                tested.append(rev)
+                if 40 <= graph.rev(rev) < 60:
+                    return ("skip", "compilation failed")
+                return ("bad", "interesting") if graph.rev(rev) >= 70 else ("good", "not interesting")
+
+            autobisectjs.findBustedRange(options, bisection, labels, test_rev, "%012x" % 50, "%012x" % 0,
+                                         "%012x" % 99)
+
+            self.assertEqual(kbew.local_known_broken_pairs(options.build_options), [("%012x" % 40, "%012x" % 60)])
+            self.assertEqual(options.skipRevs, set(range(40, 60)))
+            self.assertTrue(options.skipRevs <= bisection.skip)
+            self.assertLessEqual(len(tested), 16)
+            # Both bounds were only assumed to compile, so they got compiled and tested, without overriding the label
+            self.assertIn("%012x" % 0, tested)
+            self.assertIn("%012x" % 99, tested)
+            self.assertEqual(labels["%012x" % 0], ("good", "assumed start rev is good"))
+            self.assertTrue(bisection.bad)
+
+            # A failure without a .busted entry, e.g. a full disk, is not recorded
+            options.skipRevs = set()
+            autobisectjs.findBustedRange(options, revision_graph.Bisection(graph), {}, test_rev, "%012x" % 65,
+                                         "%012x" % 0, "%012x" % 99)
+            self.assertEqual(options.skipRevs, set())
+        AutobisectjsTests.monkeypatch.undo()
+
+    def test_local_known_broken_expiry(self):
+        """Test that locally recorded known broken ranges expire, and can be ignored."""
+        with tempfile.TemporaryDirectory(suffix="local_known_broken_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            opts = build_options.addParserOptions()[0].parse_args([])
+            kbew.record_known_broken_pair(opts, "aaaaaaaaaaaa", "bbbbbbbbbbbb", base_dir=tmp_dir)
+            self.assertEqual(kbew.local_known_broken_pairs(opts, base_dir=tmp_dir), [("aaaaaaaaaaaa", "bbbbbbbbbbbb")])
+
+            AutobisectjsTests.monkeypatch.setattr(kbew, "get_known_broken_dir",
+                                                  lambda base_dir=None: tmp_dir / "known-broken-ranges")
+            self.assertIn(("aaaaaaaaaaaa", "bbbbbbbbbbbb"), kbew.known_broken_pairs(opts))
+            self.assertNotIn(("aaaaaaaaaaaa", "bbbbbbbbbbbb"), kbew.known_broken_pairs(opts, ignore_local=True))
+
+            now = time.time()
+            AutobisectjsTests.monkeypatch.setattr(time, "time", lambda: now + kbew.LOCAL_KNOWN_BROKEN_MAX_AGE + 1)
+            self.assertEqual(kbew.local_known_broken_pairs(opts, base_dir=tmp_dir), [])
+        AutobisectjsTests.monkeypatch.undo()
+
+    def test_caching_test_rev(self):
+        """Test that revisions are only tested once per testcase contents, and that compilation failures are not
+        remembered."""
+        with tempfile.TemporaryDirectory(suffix="caching_test_rev_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            AutobisectjsTests.monkeypatch.setattr(label_cache, "get_cache_dir", lambda base_dir=None: tmp_dir)
+            tested = []
+
+            def test_rev(rev):
+                tested.append(rev)
+                return ("skip", "compilation failed") if rev == "bbbbbbbbbbbb" else ("bad", "interesting")
+
+            def make_options(testcase):
+                options = argparse.Namespace(parameters="--fuzzing-safe " + str(testcase),
+                                             runtime_params=["--fuzzing-safe", str(testcase)],
+                                             build_options=build_options.addParserOptions()[0].parse_args([]),
+                                             output="", watchExitCode=None, useInterestingnessTests=False,
+                                             ignoreCachedLabels=False)
+                options.labelCacheScope = autobisectjs.labelCacheScope(options, [])
+                return options
+
+            (tmp_dir / "a.js").write_text("crash();\n")
+            (tmp_dir / "b.js").write_text("crash();\n")
+            for testcase in ("a.js", "b.js"):
+                test_rev_cached = autobisectjs.cachingTestRev(make_options(tmp_dir / testcase), test_rev)
+                self.assertEqual(test_rev_cached("aaaaaaaaaaaa"), ("bad", "interesting"))
+                self.assertEqual(test_rev_cached("bbbbbbbbbbbb"), ("skip", "compilation failed"))
+            self.assertEqual(tested, ["aaaaaaaaaaaa", "bbbbbbbbbbbb", "bbbbbbbbbbbb"])
+
+            options = make_options(tmp_dir / "a.js")
+            options.ignoreCachedLabels = True
+            autobisectjs.cachingTestRev(options, test_rev)("aaaaaaaaaaaa")
+            (tmp_dir / "b.js").write_text("crash(2);\n")
+            autobisectjs.cachingTestRev(make_options(tmp_dir / "b.js"), test_rev)("aaaaaaaaaaaa")
+            self.assertEqual(len(tested), 5)
+        AutobisectjsTests.monkeypatch.undo()
@@ -0,0 +1,46 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the label_cache.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import logging
+import sys
+import unittest
+
+from funfuzz.autobisectjs import label_cache
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class LabelCacheTests(unittest.TestCase):
+    """"TestCase class for functions in label_cache.py"""
+    def test_record(self):
+        """Test that labels are remembered per scope, and that damaged files are ignored."""
+        with tempfile.TemporaryDirectory(suffix="label_cache_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            scope = ["js-dbg-64-linux", "", None, [], ["--fuzzing-safe", "0123abcd"]]
+            self.assertEqual(label_cache.load(scope, tmp_dir), {})
+
+            label_cache.record(scope, "abcdef123456", ("bad", "interesting"), tmp_dir)
+            label_cache.record(scope, "123456abcdef", ("good", "not interesting"), tmp_dir)
+            self.assertEqual(label_cache.load(scope, tmp_dir), {"abcdef123456": ("bad", "interesting"),
+                                                                "123456abcdef": ("good", "not interesting")})
+            self.assertEqual(label_cache.load(scope[:-1] + [["--fuzzing-safe", "4567cdef"]], tmp_dir), {})
+
+            for label_file in label_cache.get_cache_dir(tmp_dir).iterdir():
+                label_file.write_text("{")
+            self.assertEqual(label_cache.load(scope, tmp_dir), {})
@@ -0,0 +1,105 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the revision_graph.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import logging
+import unittest
+
+from funfuzz.autobisectjs import revision_graph
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+def node(rev):
+    """Return a made up short hash for a revision number."""
+    return "%012x" % (0xabc000 + rev)
+
+
+def make_graph(parents):
+    """Return a graph from the parents of each revision, in the LOG_TEMPLATE format."""
+    return revision_graph.RevisionGraph(
+        ["%d %s %d %d" % ((rev, node(rev)) + tuple(parents_of_rev + (-1, -1))[:2])
+         for rev, parents_of_rev in enumerate(parents)])
+
+
+def bisect(graph, good, bad, is_bad, skip=None):
+    """Bisect the way autobisectjs does, returning the result and the revisions that were tested."""
+    bisection = revision_graph.Bisection(graph, skip)
+    bisection.label(node(good), "good")
+    bisection.label(node(bad), "bad")
+    tested = []
+    while True:
+        nodes, remaining, _ = bisection.next_revs()
+        if not remaining:
+            return [graph.rev(x) for x in nodes], tested
+        rev = graph.rev(nodes[0])
+        tested.append(rev)
+        bisection.label(nodes[0], "bad" if is_bad(rev) else "good")
+
+
+# 0 - 1 - 2 - 3 - 4 ------ 7 - 8
+#          \              /
+#           5 ----- 6 ---
+MERGE_PARENTS = [(), (0,), (1,), (2,), (3,), (2,), (5,), (4, 6), (7,)]
+
+
+class RevisionGraphTests(unittest.TestCase):
+    """"TestCase class for functions in revision_graph.py"""
+    def test_graph_queries(self):
+        """Test that graph queries match their revset counterparts."""
+        graph = make_graph(MERGE_PARENTS)
+        self.assertEqual(graph.rev(node(5) + "0123456789"), 5)
+        self.assertIsNone(graph.rev("123456789abc"))
+        self.assertEqual(graph.ancestors([6]), {0, 1, 2, 5, 6})
+        self.assertEqual(graph.descendants([3]), {3, 4, 7, 8})
+        self.assertEqual(graph.dag_range(2, 7), {2, 3, 4, 5, 6, 7})
+        self.assertTrue(graph.is_ancestor(5, 8))
+        self.assertFalse(graph.is_ancestor(3, 6))
+        self.assertEqual(graph.common_ancestor(4, 6), 2)
+        self.assertEqual(graph.known_broken([(node(3), node(7)), ("123456789abc", node(1))]), {3, 4})
+        self.assertEqual(graph.known_broken([(node(5), "123456789abc")]), {5, 6, 7, 8})
+        self.assertEqual(graph.first_common_descendant([node(4), node(6)], set()), 7)
+        self.assertEqual(graph.first_common_descendant([node(4), node(6)], {7}), 8)
+        self.assertIsNone(graph.first_common_descendant([node(4), "123456789abc"], set()))
+
+    def test_bisection(self):
+        """Test that bisection finds the first bad revision in about log2(n) steps, in either direction."""
+        graph = make_graph([()] + [(rev,) for rev in range(99)])
+        self.assertEqual(bisect(graph, 0, 99, lambda rev: rev >= 37)[0], [37])
+        self.assertLessEqual(len(bisect(graph, 0, 99, lambda rev: rev >= 37)[1]), 7)
+        # Looking for the fix instead
+        result, _ = bisect(graph, 99, 0, lambda rev: rev < 63)
+        self.assertEqual(result, [63])
+
+        bisection = revision_graph.Bisection(graph)
+        self.assertIsNone(bisection.next_revs())
+        bisection.label(node(0), "good")
+        bisection.label(node(99), "bad")
+        self.assertEqual(bisection.next_revs(), ([node(49)], 99, False))
+        bisection.label(node(0), "bad")
+        with self.assertRaises(ValueError):
+            bisection.next_revs()
+
+    def test_bisection_skip(self):
+        """Test that skipped revisions are never tested, and end up in the result if they might be the first bad one."""
+        graph = make_graph([()] + [(rev,) for rev in range(99)])
+        skip = graph.known_broken([(node(30), node(45))])
+        result, tested = bisect(graph, 0, 99, lambda rev: rev >= 37, skip)
+        self.assertEqual(result, list(range(30, 46)))
+        self.assertFalse(set(tested) & skip)
+        self.assertEqual(bisect(graph, 0, 99, lambda rev: rev >= 70, skip)[0], [70])
+
+    def test_bisection_merge(self):
+        """Test that bisection finds a first bad revision on either side of a merge, or the merge itself."""
+        graph = make_graph(MERGE_PARENTS)
+        for first_bad in (3, 4, 5, 6, 7):
+            bad_revs = graph.descendants([first_bad])
+            self.assertEqual(bisect(graph, 0, 8, bad_revs.__contains__)[0], [first_bad])
@@ -0,0 +1,203 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Benchmark the overhead of the fuzzing and reduction harness, using a fake js shell instead of a SpiderMonkey build.
+
+Run with: python -m pytest tests/benchmarks --benchmark-only
+Add --benchmark-autosave to keep the results, and --benchmark-compare to compare with the latest saved ones.
+"""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+from builtins import object
+import io
+import logging
+import stat
+import sys
+
+from Collector.Collector import Collector
+import lithium.interestingness.timed_run as timed_run
+import pytest
+
+from funfuzz.js import compare_jit
+from funfuzz.js import js_interesting
+from funfuzz.js import link_fuzzer
+from funfuzz.js import loop
+from funfuzz.util import capability_db
+from funfuzz.util import create_collector
+from funfuzz.util import file_manipulation
+from funfuzz.util import spooled_run
+
+if sys.version_info.major == 2:
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+
+pytest.importorskip("pytest_benchmark")
+pytestmark = pytest.mark.slow  # pylint: disable=invalid-name
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+# Dumps a build configuration like a js shell would. Otherwise, a "// fake-js: <mode> <lines>" line in the testcase
+# picks what the run looks like: "fine" prints that many lines of jsfunfuzz-like output, "crash" prints an assertion
+# failure and aborts, "hang" sleeps past any timeout and "oom" reports running out of memory. Defaults to "fine 1000".
+FAKE_SHELL = """#!%s
+import io
+import os
+import resource
+import sys
+import time
+if any("getBuildConfiguration" in arg for arg in sys.argv):
+    print('{"more-deterministic":false}')
+    sys.exit(0)
+mode, lines = "fine", 1000
+with io.open(sys.argv[-1], encoding="utf-8", errors="replace") as f:
+    for line in f:
+        if line.startswith("// fake-js: "):
+            mode, lines = line.split()[2], int(line.split()[3])
+            break
+for i in range(lines):
+    sys.stdout.write("/*FRC-*/ var x%%d = %%d;\\n/*FCM*/ print(x%%d);\\n" %% (i, i, i))
+if mode == "crash":
+    sys.stderr.write("Assertion failure: false (fake), at fake.cpp:1\\n")
+    sys.stderr.flush()
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    os.abort()
+elif mode == "hang":
+    time.sleep(600)
+elif mode == "oom":
+    sys.stderr.write("ReportOutOfMemory called\\n")
+    sys.exit(3)
+print("It's looking good!")
+""" % sys.executable
+
+FUZZMANAGERCONF = """[Main]
+platform = x86-64
+product = mozilla-central
+os = linux
+"""
+
+
+class FakeCollector(object):  # pylint: disable=too-few-public-methods
+    """Collector which does not know about any signature."""
+    @staticmethod
+    def search(_crash_info):  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
+        return (None, None)
+
+
+class StepClock(object):  # pylint: disable=too-few-public-methods
+    """Stands in for the time module in loop.py, going one second forward each time it is read, so many_timed_runs
+    runs out of time after exactly one iteration when given a target time of 1.5 seconds."""
+    def __init__(self):
+        self.now = 0
+
+    def time(self):  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture
+def fake_shell(tmpdir, monkeypatch):  # pylint: disable=redefined-outer-name
+    """Create the fake js shell, keeping its capability database and signature cache out of the home directory.
+
+    Args:
+        tmpdir (py.path.local): Temporary directory of the benchmark
+        monkeypatch (MonkeyPatch): Undoes the patches once the benchmark is done
+
+    Returns:
+        Path: Full path to the fake js shell
+    """
+    tmp_dir = Path(str(tmpdir))
+    monkeypatch.setattr(capability_db, "get_db_dir", lambda base_dir=None: tmp_dir)
+    (tmp_dir / "sigcache").mkdir()
+    monkeypatch.setattr(create_collector, "make_collector", lambda: Collector(sigCacheDir=str(tmp_dir / "sigcache")))
+    shell_path = tmp_dir / "js"
+    shell_path.write_text(FAKE_SHELL)
+    shell_path.chmod(shell_path.stat().st_mode | stat.S_IEXEC)
+    shell_path.with_suffix(".fuzzmanagerconf").write_text(FUZZMANAGERCONF)
+    return shell_path
+
+
+@pytest.mark.parametrize("mode, lines, timeout, expected_sta", [
+    ("fine", 10, 30, timed_run.NORMAL),
+    ("fine", 100000, 30, timed_run.NORMAL),
+    ("crash", 1000, 30, timed_run.CRASHED),
+    ("hang", 1000, 1, timed_run.TIMED_OUT),
+    ("oom", 1000, 30, timed_run.ABNORMAL),
+])
+def test_shell_result(benchmark, fake_shell, mode, lines, timeout, expected_sta):
+    # pylint: disable=redefined-outer-name,too-many-arguments
+    """Benchmark running the fake js shell and scanning its output, as loop does."""
+    testcase = fake_shell.parent / "testcase.js"
+    testcase.write_text("// fake-js: %s %d\n" % (mode, lines))
+    options = js_interesting.parseOptions(["--timeout=%d" % timeout, "known", str(fake_shell), str(testcase)])
+    options.collector = FakeCollector()
+
+    res = benchmark.pedantic(js_interesting.ShellResult, rounds=5,
+                             args=(options, options.jsengineWithArgs, fake_shell.parent / "w1", False),
+                             kwargs={"runner": spooled_run.timed_run})
+
+    assert res.runinfo.sta == expected_sta
+    assert res.oom == (mode == "oom")
+
+
+def test_link_fuzzer(benchmark, tmpdir):
+    """Benchmark concatenating the jsfunfuzz files."""
+    jsfunfuzz = Path(str(tmpdir)) / "jsfunfuzz.js"
+    benchmark(link_fuzzer.link_fuzzer, jsfunfuzz)
+    assert jsfunfuzz.is_file()
+
+
+def test_fuzz_splice(benchmark, tmpdir):
+    """Benchmark splitting jsfunfuzz around its SPLICE lines, as done for each interesting testcase."""
+    jsfunfuzz = Path(str(tmpdir)) / "jsfunfuzz.js"
+    link_fuzzer.link_fuzzer(jsfunfuzz)
+    before, after = benchmark(file_manipulation.fuzzSplice, jsfunfuzz)
+    assert before and after
+
+
+def test_jit_compare_lines(benchmark, tmpdir):
+    """Benchmark extracting the lines to compare from a large jsfunfuzz log."""
+    out_log = Path(str(tmpdir)) / "w1-out.txt"
+    with io.open(str(out_log), "w", encoding="utf-8") as f:
+        for i in range(100000):
+            f.write("/*FRC-*/ var x%d = %d;\n/*FCM*/ print(x%d);\n" % (i, i, i))
+    lines = benchmark(loop.jitCompareLines, out_log, "/*FCM*/")
+    assert len(lines) > 100000
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_compare_level(benchmark, fake_shell, jobs):  # pylint: disable=redefined-outer-name
+    """Benchmark comparing the output of the fake js shell across flag combinations."""
+    testcase = fake_shell.parent / "testcase.js"
+    testcase.write_text("// fake-js: fine 1000\n")
+    options = compare_jit.parseOptions([str(fake_shell.parent), str(fake_shell), str(testcase)])
+    options.collector = FakeCollector()
+
+    result = benchmark.pedantic(compare_jit.compareLevel, rounds=3,
+                                args=(fake_shell, [], testcase, fake_shell.parent / "cj", options, False, False, jobs))
+
+    assert result[0] == js_interesting.JS_FINE
+
+
+def test_many_timed_runs_iteration(benchmark, fake_shell, monkeypatch):  # pylint: disable=redefined-outer-name
+    """Benchmark one iteration of the fuzzing loop: linking jsfunfuzz, running the fake js shell and cleaning up."""
+    monkeypatch.setattr(loop, "time", StepClock())
+    wtmp_dirs = []
+
+    def setup():
+        wtmp_dir = fake_shell.parent / ("wtmp%d" % len(wtmp_dirs))
+        wtmp_dir.mkdir()
+        wtmp_dirs.append(wtmp_dir)
+        args = ["--repo=" + str(fake_shell.parent / "no-repo"), "30", "mozilla-central", str(fake_shell)]
+        return (1.5, wtmp_dir, args, FakeCollector(), False), {}
+
+    benchmark.pedantic(loop.many_timed_runs, setup=setup, rounds=5)
+
+    # Fine runs leave nothing behind
+    assert not any(wtmp_dir.exists() for wtmp_dir in wtmp_dirs)
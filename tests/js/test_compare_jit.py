@@ -0,0 +1,88 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the compare_jit.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+from builtins import object
+import logging
+import os
+import stat
+import sys
+import unittest
+
+from funfuzz.js import compare_jit
+from funfuzz.js import js_interesting
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+# Accepts every flag, and prints something else when Ion is disabled if the testcase asks for it
+FAKE_SHELL = """#!%s
+import sys
+if "-e" in sys.argv:
+    sys.exit(0)
+testcase = open(sys.argv[-1]).read()
+print("43" if "mismatch" in testcase and "--no-ion" in sys.argv else "42")
+""" % sys.executable
+
+FUZZMANAGERCONF = """[Main]
+platform = x86-64
+product = mozilla-central
+os = linux
+"""
+
+
+class FakeCollector(object):  # pylint: disable=too-few-public-methods
+    """Collector which does not know about any signature."""
+    @staticmethod
+    def search(_crash_info):  # pylint: disable=missing-docstring,missing-return-doc,missing-return-type-doc
+        return (None, None)
+
+
+class CompareJitTests(unittest.TestCase):
+    """"TestCase class for functions in compare_jit.py"""
+    def test_compare_level(self):
+        """Test that mismatches are found with flag combinations run one at a time or in parallel."""
+        with tempfile.TemporaryDirectory(suffix="compare_level_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            shell_path = tmp_dir / "js"
+            shell_path.write_text(FAKE_SHELL)
+            shell_path.chmod(shell_path.stat().st_mode | stat.S_IEXEC)
+            shell_path.with_suffix(".fuzzmanagerconf").write_text(FUZZMANAGERCONF)
+            options = compare_jit.parseOptions([str(tmp_dir), str(shell_path), os.devnull])
+            options.collector = FakeCollector()
+
+            testcase = tmp_dir / "testcase.js"
+            for jobs in (1, 4):
+                testcase.write_text("print(42);\n")
+                self.assertEqual(compare_jit.compareLevel(shell_path, [], testcase, tmp_dir / ("fine%s" % jobs),
+                                                          options, False, False, jobs)[0],
+                                 js_interesting.JS_FINE)
+                testcase.write_text("// mismatch\n")
+                self.assertEqual(compare_jit.compareLevel(shell_path, [], testcase, tmp_dir / ("bad%s" % jobs),
+                                                          options, False, False, jobs)[0],
+                                 js_interesting.JS_OVERALL_MISMATCH)
+                self.assertIn("-42\n+43\n", (tmp_dir / ("bad%s-summary.txt" % jobs)).read_text())
+            self.assertFalse(list(tmp_dir.glob("fine*")))
+
+    def test_stream_digest(self):
+        """Test that digests only match for identical streams."""
+        digests = [compare_jit.StreamDigest() for _ in range(3)]
+        for digest, lines in zip(digests, [["a\n", "b\n"], ["a\n", "b\n"], ["a\nb\n"]]):
+            for line in lines:
+                digest.update(line)
+        self.assertEqual(digests[0], digests[1])
+        self.assertNotEqual(digests[0], digests[2])
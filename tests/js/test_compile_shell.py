@@ -12,8 +12,10 @@ import logging
 import os
 import platform
 import sys
+import threading
 import unittest
 
+from _pytest.monkeypatch import MonkeyPatch
 import pytest
 
 from funfuzz import js
@@ -36,6 +38,7 @@ class CompileShellTests(unittest.TestCase):
     # Paths
     mc_hg_repo = Path.home() / "trees" / "mozilla-central"
     shell_cache = Path.home() / "shell-cache"
+    monkeypatch = MonkeyPatch()
 
     @pytest.mark.slow
     @lru_cache(maxsize=None)
@@ -73,3 +76,31 @@ class CompileShellTests(unittest.TestCase):
         self.assertTrue(js_bin_path.is_file())
 
         return js_bin_path
+
+    def test_prebuilder_wait(self):
+        """Test that waiting for a revision whose compilation ahead of time has not started does not block, and that
+        it is not compiled in the background anymore."""
+        started = threading.Event()
+        release = threading.Event()
+        compiled = []
+
+        def obtain_shell(shell, updateToRev=None):  # pylint: disable=invalid-name
+            compiled.append((updateToRev, shell.get_compilation_jobs()))
+            started.set()
+            release.wait(10)
+        CompileShellTests.monkeypatch.setattr(js.compile_shell, "obtainShell", obtain_shell)
+
+        build_opts = js.build_options.addParserOptions()[0].parse_args([])
+        prebuilder = js.compile_shell.ShellPrebuilder(build_opts, 1)
+        try:
+            (prebuilder.work_dir / "src-0").mkdir()  # Instead of sharing the repository
+            prebuilder.prebuild(["aaaaaaaaaaaa", "bbbbbbbbbbbb"])
+            self.assertTrue(started.wait(10))
+            self.assertTrue(prebuilder.wait("bbbbbbbbbbbb"))
+            release.set()
+            self.assertTrue(prebuilder.wait("aaaaaaaaaaaa"))
+        finally:
+            release.set()
+            prebuilder.close()
+            CompileShellTests.monkeypatch.undo()
+        self.assertEqual(compiled, [("aaaaaaaaaaaa", max(js.compile_shell.COMPILATION_JOBS // 2, 1))])
@@ -0,0 +1,63 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the inspect_shell.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import logging
+import stat
+import sys
+import unittest
+
+from _pytest.monkeypatch import MonkeyPatch
+
+from funfuzz.js import inspect_shell
+from funfuzz.util import capability_db
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+# Counts its own runs, and dumps a build configuration like a js shell would
+FAKE_SHELL = """#!%s
+import io
+import sys
+with io.open(sys.argv[0] + ".runs", "a") as f:
+    f.write(u"run\\n")
+print('{"arm-simulator":false,"asan":true,"debug":true,"more-deterministic":false,"pointer-byte-size":8}')
+""" % sys.executable
+
+
+class InspectShellTests(unittest.TestCase):
+    """"TestCase class for functions in inspect_shell.py"""
+    monkeypatch = MonkeyPatch()
+
+    def test_get_build_configuration(self):
+        """Test that the build configuration is dumped by one run of the shell, and then shared."""
+        with tempfile.TemporaryDirectory(suffix="get_build_configuration_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            InspectShellTests.monkeypatch.setattr(capability_db, "get_db_dir", lambda base_dir=None: tmp_dir)
+            shell_path = tmp_dir / "js"
+            shell_path.write_text(FAKE_SHELL)
+            shell_path.chmod(shell_path.stat().st_mode | stat.S_IEXEC)
+
+            build_config = inspect_shell.get_build_configuration(shell_path)
+            self.assertTrue(build_config.asan)
+            self.assertTrue(build_config.debug)
+            self.assertFalse(build_config.arm_simulator)
+            self.assertFalse(build_config.coverage)
+            self.assertEqual(inspect_shell.queryBuildConfiguration(shell_path, "pointer-byte-size"), 8)
+            self.assertIs(inspect_shell.get_build_configuration(shell_path), build_config)
+            self.assertEqual(Path(str(shell_path) + ".runs").read_text(), "run\n")
+        InspectShellTests.monkeypatch.undo()
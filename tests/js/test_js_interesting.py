@@ -0,0 +1,150 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the js_interesting.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import logging
+import os
+import platform
+import stat
+import sys
+import time
+import unittest
+
+from _pytest.monkeypatch import MonkeyPatch
+from Collector.Collector import Collector
+import lithium.interestingness.timed_run as timed_run
+
+from funfuzz.js import js_interesting
+from funfuzz.util import capability_db
+from funfuzz.util import create_collector
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+    if os.name == "posix":
+        import subprocess32 as subprocess  # pylint: disable=import-error
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import subprocess
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+FUZZMANAGERCONF = """[Main]
+platform = x86-64
+product = mozilla-central
+product_version = 12345abcdef0
+os = linux
+
+[Metadata]
+buildFlags = --enable-debug
+"""
+
+# Dumps a build configuration like a js shell would, hangs on testcases containing "hang" and reports a malloc error
+# on the others
+FAKE_SHELL = """#!%s
+import io
+import sys
+import time
+if sys.argv[1] == "-e":
+    print('{"more-deterministic":false}')
+    sys.exit(0)
+with io.open(sys.argv[-1]) as f:
+    if "hang" in f.read():
+        time.sleep(60)
+sys.stderr.write("*** error: malloc_error_break\\n")
+""" % sys.executable
+
+
+class JsInterestingTests(unittest.TestCase):
+    """"TestCase class for functions in js_interesting.py"""
+    monkeypatch = MonkeyPatch()
+
+    @unittest.skipIf("env" not in timed_run.timed_run.__code__.co_varnames,
+                     "Requires a Lithium version whose timed_run takes env")
+    def test_interesting_timeout_multiplier(self):
+        """Test that candidates get a timeout adapted to the runtime of earlier interesting runs of the testcase."""
+        with tempfile.TemporaryDirectory(suffix="interesting_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            JsInterestingTests.monkeypatch.setattr(capability_db, "get_db_dir", lambda base_dir=None: tmp_dir)
+            (tmp_dir / "sigcache").mkdir()
+            JsInterestingTests.monkeypatch.setattr(
+                create_collector, "make_collector", lambda: Collector(sigCacheDir=str(tmp_dir / "sigcache")))
+            JsInterestingTests.monkeypatch.setattr(js_interesting, "MIN_ADAPTIVE_TIMEOUT", 1)
+            shell_path = tmp_dir / "js"
+            shell_path.write_text(FAKE_SHELL)
+            shell_path.chmod(shell_path.stat().st_mode | stat.S_IEXEC)
+            shell_path.with_suffix(".fuzzmanagerconf").write_text(FUZZMANAGERCONF)
+            testcase = tmp_dir / "w1-reduced.js"
+            testcase.write_text("print(1);\n")
+            args = ["--timeout=30", "--timeout-multiplier=4", "known", str(shell_path), str(testcase)]
+
+            js_interesting.init(args)
+            self.assertTrue(js_interesting.interesting(args, str(tmp_dir / "1")))
+            testcase.write_text("hang();\n")
+            start_time = time.time()
+            self.assertFalse(js_interesting.interesting(args, str(tmp_dir / "2")))
+            self.assertLess(time.time() - start_time, 10)
+        JsInterestingTests.monkeypatch.undo()
+
+    def test_program_configuration(self):
+        """Test that the cached ProgramConfiguration hands out independent copies and notices changed files."""
+        with tempfile.TemporaryDirectory(suffix="program_configuration_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            shell_path = tmp_dir / "js"
+            shell_path.with_suffix(".fuzzmanagerconf").write_text(FUZZMANAGERCONF)
+
+            first = js_interesting.program_configuration(shell_path)
+            first.addProgramArguments(["--fuzzing-safe"])
+            second = js_interesting.program_configuration(shell_path)
+            self.assertEqual(second.product, "mozilla-central")
+            self.assertEqual(second.version, "12345abcdef0")
+            self.assertEqual(second.metadata, {"buildFlags": "--enable-debug"})
+            self.assertEqual(second.args, [])
+
+            shell_path.with_suffix(".fuzzmanagerconf").write_text(FUZZMANAGERCONF.replace("12345abcdef0", "6789"))
+            self.assertEqual(js_interesting.program_configuration(shell_path).version, "6789")
+
+    @unittest.skipIf(platform.system() == "Windows", "Requires /bin/sh")
+    def test_ulimit_command(self):
+        """Test that the command shells are run with on Linux gets the same limits as set_ulimit gives, and keeps the
+        process ID."""
+        result = subprocess.run(js_interesting.ulimit_command(["/bin/sh", "-c", "ulimit -v; ulimit -c; echo $$"]),
+                                stdout=subprocess.PIPE)
+        limits = result.stdout.decode("utf-8").split()
+        self.assertEqual(limits[:2], [str(js_interesting.SHELL_ADDRESS_SPACE_LIMIT // 1024),
+                                      str(js_interesting.SHELL_CORE_FILE_LIMIT // 1024)])
+
+        child = subprocess.Popen(js_interesting.ulimit_command(["/bin/sh", "-c", "echo $$"]), stdout=subprocess.PIPE)
+        self.assertEqual(child.communicate()[0].decode("utf-8").strip(), str(child.pid))
+
+    def test_log_scan(self):
+        """Test that a single pass over the logs finds what understoodJsfunfuzzExit, oomed and amiss look for."""
+        out = ["fuzzSeed: 42\n", "Found a bug: NestTest\n", "It's looking good!\n"]
+        err = ["ReportOutOfMemory called\n", "\x07*** error: malloc_error_break\n", "==123== Invalid read\n"]
+        scan = js_interesting.LogScan(valgrind_prefix="==123==")
+        scan.scan_out(out)
+        scan.scan_err(err)
+
+        self.assertEqual(scan.out.lines(), out)
+        self.assertEqual(scan.err.lines(), err)
+        self.assertEqual(scan.found_bugs, ["Found a bug: NestTest\n"])
+        self.assertEqual(scan.understood_exit, js_interesting.understoodJsfunfuzzExit(out, err))
+        self.assertEqual(scan.oomed, js_interesting.oomed(err))
+        self.assertEqual(scan.malloc_error, "*** error: malloc_error_break")
+        self.assertEqual(scan.valgrind_errors, ["==123== Invalid read"])
+
+    def test_log_lines(self):
+        """Test that only the start and end of long logs are kept."""
+        log = js_interesting.LogLines(max_head=2, max_tail=3)
+        for i in range(10):
+            log.append("%d\n" % i)
+        self.assertEqual(log.lines(), ["0\n", "1\n", "[5 lines dropped by funfuzz]\n", "7\n", "8\n", "9\n"])
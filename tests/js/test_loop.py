@@ -0,0 +1,68 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the loop.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import io
+import logging
+import sys
+import unittest
+
+from _pytest.monkeypatch import MonkeyPatch
+
+from funfuzz.js import loop
+from funfuzz.util import reduction_queue
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class FakeCollector(object):  # pylint: disable=too-few-public-methods
+    """Collector which remembers what was submitted instead of talking to FuzzManager."""
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, crash_info, testcase, quality, metaData=None):  # pylint: disable=invalid-name,unused-argument
+        """Remember a submission."""
+        with io.open(testcase, "r", encoding="utf-8", errors="replace") as f:
+            self.submitted.append((crash_info, f.read(), quality))
+
+
+class LoopTests(unittest.TestCase):
+    """"TestCase class for functions in loop.py"""
+    monkeypatch = MonkeyPatch()
+
+    def test_submit_unreduced(self):
+        """Test that testcases left in the reduction queue are submitted unreduced, including the ones claimed by a
+        reducer which is gone."""
+        with tempfile.TemporaryDirectory(suffix="submit_unreduced_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            LoopTests.monkeypatch.setattr(loop, "job_crash_info", lambda job_dir, job: (None, job["lev"]))
+            queue = reduction_queue.ReductionQueue(tmp_dir / "queue")
+            for i, key in enumerate(["a" * 40, "b" * 40, "c" * 40]):
+                testcase = tmp_dir / ("w%d-reduced.js" % i)
+                testcase.write_text("crash(%d);\n" % i)
+                queue.enqueue(key, {"lev": i}, {"w-reduced.js": testcase})
+            _, job_dir, _ = queue.claim()
+            (job_dir / "reducer.pid").write_text("999999999")  # No such process
+            _, job_dir, _ = queue.claim()
+            queue.finish("b" * 40, {"quality": 0})
+            collector = FakeCollector()
+
+            self.assertEqual(sorted(loop.submit_unreduced(tmp_dir / "queue", collector)), ["a" * 40, "c" * 40])
+            self.assertEqual(sorted(collector.submitted), [(0, "crash(0);\n", 10), (2, "crash(2);\n", 10)])
+            self.assertEqual(queue.counts(), {"pending": 0, "running": 0, "done": 3})
+        LoopTests.monkeypatch.undo()
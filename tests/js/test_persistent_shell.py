@@ -0,0 +1,125 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the persistent_shell.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import io
+import logging
+import platform
+import sys
+import unittest
+
+import lithium.interestingness.timed_run as timed_run
+
+from funfuzz.js import js_interesting
+from funfuzz.js import link_fuzzer
+from funfuzz.js import persistent_shell
+from funfuzz.util import spooled_run
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+# Stands in for a js shell running the persistent jsfunfuzz file: each line on stdin is one seed
+FAKE_SHELL = """
+import sys
+import time
+for seed in iter(sys.stdin.readline, ""):
+    action = open(sys.argv[1]).read().strip()
+    if action == "crash":
+        sys.exit(3)
+    if action == "hang":
+        time.sleep(60)
+    print("fuzzSeed: " + action)
+    print("It's looking good!")
+    print("%s")
+    sys.stdout.flush()
+    sys.stderr.write("%s\\n")
+    sys.stderr.flush()
+""" % (persistent_shell.PERSISTENT_MARKER, persistent_shell.PERSISTENT_MARKER)
+
+
+class PersistentShellTests(unittest.TestCase):
+    """"TestCase class for functions in persistent_shell.py"""
+    def test_make_persistent_fuzzer(self):
+        """Test that the persistent jsfunfuzz file runs seeds in a loop instead of just once."""
+        with tempfile.TemporaryDirectory(suffix="make_persistent_fuzzer_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            fuzzjs = tmp_dir / "jsfunfuzz.js"
+            persistent_fuzzjs = tmp_dir / "jsfunfuzz-persistent.js"
+            link_fuzzer.link_fuzzer(fuzzjs)
+
+            persistent_shell.make_persistent_fuzzer(fuzzjs, persistent_fuzzjs)
+
+            with io.open(str(persistent_fuzzjs), "r", encoding="utf-8", errors="replace") as f:
+                lines = f.readlines()
+            self.assertNotIn("start(this);\n", lines)
+            self.assertEqual(lines[lines.index("// SPLICE DDBEGIN\n") + 1], "persistentLoop(this);\n")
+            self.assertIn("function persistentLoop(glob)\n", lines)
+
+    def test_persistent_shell(self):
+        """Test that seeds reuse one process until it crashes or hangs."""
+        with tempfile.TemporaryDirectory(suffix="persistent_shell_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            fake_shell = tmp_dir / "fake_shell.py"
+            fake_shell.write_text(FAKE_SHELL)
+            action = tmp_dir / "action.txt"
+            command = [sys.executable, str(fake_shell), str(action)]
+            shell = persistent_shell.PersistentShell(tmp_dir / "session-out.txt", max_seeds=3)
+
+            action.write_text("1")
+            first = shell.timed_run(command, 10, str(tmp_dir / "w1"))
+            action.write_text("2")
+            second = shell.timed_run(command, 10, str(tmp_dir / "w2"))
+            self.assertEqual(first.sta, timed_run.NORMAL)
+            self.assertEqual(second.sta, timed_run.NORMAL)
+            self.assertEqual(first.pid, second.pid)
+            self.assertEqual(list(spooled_run.spool_lines(second.out)), ["fuzzSeed: 2\n", "It's looking good!\n"])
+            self.assertEqual(list(spooled_run.spool_lines(second.err)), [])
+            self.assertEqual(shell.session_log.read_text().count("fuzzSeed: "), 2)
+
+            action.write_text("crash")
+            crashed = shell.timed_run(command, 10, str(tmp_dir / "w3"))
+            self.assertEqual(crashed.sta, timed_run.ABNORMAL)
+            self.assertEqual(crashed.return_code, 3)
+            self.assertFalse(shell.is_alive())
+
+            action.write_text("hang")
+            hung = shell.timed_run(command, 1, str(tmp_dir / "w4"))
+            self.assertEqual(hung.sta, timed_run.TIMED_OUT)
+            self.assertNotEqual(hung.pid, first.pid)
+
+            action.write_text("5")
+            self.assertEqual(shell.timed_run(command, 10, str(tmp_dir / "w5")).sta, timed_run.NORMAL)
+            shell.close()
+
+    @unittest.skipIf(platform.system() != "Linux", "Shells only get run through ulimit_command on Linux")
+    def test_persistent_shell_ulimit(self):
+        """Test that seeds keep reusing one process when run through ulimit_command, as ShellResult does on Linux."""
+        with tempfile.TemporaryDirectory(suffix="persistent_shell_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            fake_shell = tmp_dir / "fake_shell.py"
+            fake_shell.write_text(FAKE_SHELL)
+            action = tmp_dir / "action.txt"
+            action.write_text("1")
+            command = js_interesting.ulimit_command([sys.executable, str(fake_shell), str(action)])
+            shell = persistent_shell.PersistentShell(tmp_dir / "session-out.txt", max_seeds=3)
+
+            first = shell.timed_run(list(command), 10, str(tmp_dir / "w1"))
+            second = shell.timed_run(list(command), 10, str(tmp_dir / "w2"))
+            self.assertEqual(second.sta, timed_run.NORMAL)
+            self.assertEqual(first.pid, second.pid)
+            self.assertEqual(shell.session_log.read_text().count("fuzzSeed: "), 2)
+            shell.close()
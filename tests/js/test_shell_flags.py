@@ -9,18 +9,47 @@
 from __future__ import absolute_import, unicode_literals  # isort:skip
 
 import logging
+import stat
+import sys
 
 from _pytest.monkeypatch import MonkeyPatch
 import pytest
 
 from funfuzz import js
+from funfuzz.util import capability_db
 
 from .test_compile_shell import CompileShellTests
 
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
 FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
 logging.basicConfig(level=logging.DEBUG)
 logging.getLogger("flake8").setLevel(logging.WARNING)
 
+# Logs its arguments, lists a few options in --help, and rejects unknown options and the "testbed" register allocator
+FAKE_SHELL = """#!%s
+import io
+import sys
+with io.open(sys.argv[0] + ".runs", "a") as f:
+    f.write(u" ".join(sys.argv[1:]) + u"\\n")
+if sys.argv[1:] == ["--help"]:
+    print("Options:")
+    print("  -f --file=PATH             File path to run")
+    print("  --fuzzing-safe             Don't expose functions that aren't safe for fuzzers")
+    print("  --ion-regalloc=[mode]      Specify Ion register allocation:")
+    print("                               backtracking: Priority based (default)")
+    print("  --nursery-strings=on/off   Allocate strings in the nursery")
+    sys.exit(0)
+for arg in sys.argv[1:-2]:
+    if arg.split("=")[0] not in ("--fuzzing-safe", "--ion-regalloc", "--nursery-strings") or "testbed" in arg:
+        sys.exit(2)
+""" % sys.executable
+
 
 def mock_chance(i):
     """Overwrite the chance function to return True or False depending on a specific condition.
@@ -46,11 +75,9 @@ class ShellFlagsTests(CompileShellTests):
         all_flags = js.shell_flags.add_random_arch_flags(self.test_shell_compile(), [])
         self.assertTrue("--enable-avx" in all_flags)
         self.assertTrue("--no-sse3" in all_flags)
-        if js.inspect_shell.queryBuildConfiguration(self.test_shell_compile(), "arm-simulator"):
+        if js.inspect_shell.get_build_configuration(self.test_shell_compile()).arm_simulator:
             self.assertTrue("--arm-sim-icache-checks" in all_flags)
-        if js.inspect_shell.queryBuildConfiguration(self.test_shell_compile(), "arm-simulator"):
             self.assertTrue("--arm-asm-nop-fill=1" in all_flags)
-        if js.inspect_shell.queryBuildConfiguration(self.test_shell_compile(), "arm-simulator"):
             self.assertTrue("--arm-hwcap=vfp" in all_flags)
 
     @pytest.mark.slow
@@ -107,6 +134,27 @@ class ShellFlagsTests(CompileShellTests):
         self.assertFalse(js.shell_flags.chance(0))
         self.assertFalse(js.shell_flags.chance(-0.2))
 
+    def test_supported_flags(self):
+        """Test that candidate flags are probed with one --help run plus one run of the flags taking a value."""
+        with tempfile.TemporaryDirectory(suffix="supported_flags_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            ShellFlagsTests.monkeypatch.setattr(capability_db, "get_db_dir", lambda base_dir=None: tmp_dir)
+            shell_path = tmp_dir / "js"
+            shell_path.write_text(FAKE_SHELL)
+            shell_path.chmod(shell_path.stat().st_mode | stat.S_IEXEC)
+
+            self.assertEqual(js.shell_flags.supported_flags(shell_path),
+                             frozenset(["--fuzzing-safe", "--nursery-strings=on"]))
+            self.assertTrue(js.shell_flags.shell_supports_flag(shell_path, "--fuzzing-safe"))
+            self.assertFalse(js.shell_flags.shell_supports_flag(shell_path, "--ion-regalloc=testbed"))
+            self.assertEqual(Path(str(shell_path) + ".runs").read_text().splitlines(), [
+                "--help",
+                "--ion-regalloc=testbed --nursery-strings=on -e 42",
+                "--ion-regalloc=testbed -e 42",
+                "--nursery-strings=on -e 42",
+            ])
+        ShellFlagsTests.monkeypatch.undo()
+
     @pytest.mark.slow
     def test_random_flag_set(self):
         """Test runtime flags related to SpiderMonkey."""
@@ -0,0 +1,50 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the capability_db.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import logging
+import sys
+import unittest
+
+from funfuzz.util import capability_db
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class CapabilityDbTests(unittest.TestCase):
+    """"TestCase class for functions in capability_db.py"""
+    def test_record(self):
+        """Test that capabilities are kept per binary contents, and merged within a section."""
+        with tempfile.TemporaryDirectory(suffix="capability_db_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            shell_path = tmp_dir / "js"
+            shell_path.write_bytes(b"first build")
+            same_build = tmp_dir / "js-copy"
+            same_build.write_bytes(b"first build")
+
+            self.assertEqual(capability_db.load(shell_path, base_dir=tmp_dir), {})
+            capability_db.record(shell_path, "flags", {"--ion": True}, base_dir=tmp_dir)
+            capability_db.record(shell_path, "flags", {"--no-sse3": False}, base_dir=tmp_dir)
+            capability_db.record(shell_path, "build_configuration", {"debug": True}, base_dir=tmp_dir)
+            self.assertEqual(capability_db.load(same_build, base_dir=tmp_dir),
+                             {"flags": {"--ion": True, "--no-sse3": False}, "build_configuration": {"debug": True}})
+            self.assertEqual([x.name for x in capability_db.get_db_dir(tmp_dir).iterdir()],
+                             [capability_db.binary_hash(shell_path) + ".json"])
+
+            shell_path.write_bytes(b"second build, with a different size")
+            self.assertEqual(capability_db.load(shell_path, base_dir=tmp_dir), {})
@@ -0,0 +1,105 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the lithium_helpers.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import gzip
+import json
+import logging
+import sys
+import unittest
+
+from funfuzz.util import lithium_helpers
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class LithiumHelpersTests(unittest.TestCase):
+    """"TestCase class for functions in lithium_helpers.py"""
+    def test_run_lithium(self):
+        """Test that Lithium runs in-process and its result is read back from its log."""
+        with tempfile.TemporaryDirectory(suffix="lithium_helpers_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            testcase = tmp_dir / "testcase.py"
+            testcase.write_text("print('a')\nprint('b')\nprint('hello')\nprint('c')\n")
+
+            lith_result, lith_details = lithium_helpers.run_lithium(
+                ["outputs", "hello", sys.executable, str(testcase)], tmp_dir / "w1", 0)
+
+            self.assertEqual(lith_result, lithium_helpers.LITH_FINISHED)
+            self.assertEqual(lith_details, "1 line")
+            self.assertEqual(testcase.read_text(), "print('hello')\n")
+            with gzip.open(str(tmp_dir / "w1-lith-out.txt.gz"), "rb") as f:
+                self.assertIn(b"Lithium result: succeeded", f.read())
+
+    def test_run_lithium_busted(self):
+        """Test that an exception within Lithium ends up in its log and gives LITH_BUSTED, as it does not exit."""
+        with tempfile.TemporaryDirectory(suffix="lithium_helpers_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            old_stderr = sys.stderr
+
+            lith_result, lith_details = lithium_helpers.run_lithium(
+                ["outputs", "hello", sys.executable, str(tmp_dir / "missing.py")], tmp_dir / "w1", 0)
+
+            self.assertEqual(lith_result, lithium_helpers.LITH_BUSTED)
+            self.assertIsNone(lith_details)
+            self.assertIs(sys.stderr, old_stderr)
+            with gzip.open(str(tmp_dir / "w1-lith-out.txt.gz"), "rb") as f:
+                self.assertIn(b"Traceback", f.read())
+
+    def test_run_lithium_parallel(self):
+        """Test that testing chunk removals in parallel reduces to the same testcase as testing them one by one."""
+        with tempfile.TemporaryDirectory(suffix="lithium_helpers_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            lines = ["x%d = %d\n" % (i, i) for i in range(30)]
+            lines[7] = "a = 'hel'\n"
+            lines[22] = "print(a + 'lo')\n"
+            reduced = {}
+            for jobs in (1, 4):
+                testcase = tmp_dir / ("testcase%d.py" % jobs)
+                testcase.write_text("".join(lines))
+
+                lith_result, lith_details = lithium_helpers.run_lithium(
+                    ["outputs", "hello", sys.executable, str(testcase)], tmp_dir / ("w%d" % jobs), 0, jobs)
+
+                self.assertEqual(lith_result, lithium_helpers.LITH_FINISHED)
+                self.assertEqual(lith_details, "2 lines")
+                reduced[jobs] = testcase.read_text()
+            self.assertEqual(reduced[1], "a = 'hel'\nprint(a + 'lo')\n")
+            self.assertEqual(reduced[4], reduced[1])
+            self.assertTrue((tmp_dir / "w4-lith-tmp" / "slot-3").is_dir())
+
+    def test_reduction_strat(self):
+        """Test that reduction stages are skipped by their rules and report what they did."""
+        with tempfile.TemporaryDirectory(suffix="lithium_helpers_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            testcase = tmp_dir / "testcase.py"
+            testcase.write_text("print('a')\nprint('b')\nprint('hello')\nprint('c')\n")
+
+            lith_result, lith_details, stage_stats = lithium_helpers.reduction_strat(
+                tmp_dir / "w1", testcase, ["outputs", "hello", sys.executable, str(testcase)], 0,
+                lithium_helpers.JS_VG_AMISS)
+
+            self.assertEqual((lith_result, lith_details), (lithium_helpers.LITH_FINISHED, "1 line"))
+            self.assertEqual([stats.name for stats in stage_stats],
+                             [stage.name for stage in lithium_helpers.REDUCTION_STAGES])
+            self.assertEqual([stats.name for stats in stage_stats if stats.ran], ["lines"])
+            self.assertEqual((stage_stats[0].lines_before, stage_stats[0].lines_after), (4, 1))
+            self.assertIn("skipped", (tmp_dir / "w1-lith-stages.txt").read_text())
+            metadata = json.loads(lithium_helpers.stage_metadata(stage_stats)["reductionStages"])
+            self.assertEqual(metadata[0]["lith_result"], "finished")
+            self.assertEqual((metadata[0]["cache_hits"], metadata[0]["cache_misses"]), (0, 0))
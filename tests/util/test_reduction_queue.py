@@ -0,0 +1,88 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the reduction_queue.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import logging
+import os
+import sys
+import unittest
+
+from funfuzz.util import reduction_queue
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+    if os.name == "posix":
+        import subprocess32 as subprocess  # pylint: disable=import-error
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import subprocess
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class ReductionQueueTests(unittest.TestCase):
+    """"TestCase class for functions in reduction_queue.py"""
+    def test_reduction_queue(self):
+        """Test that jobs go from pending to running to done, and that each signature is only queued once."""
+        with tempfile.TemporaryDirectory(suffix="reduction_queue_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            testcase = tmp_dir / "w1-reduced.js"
+            testcase.write_text("crash();\n")
+            queue = reduction_queue.ReductionQueue(tmp_dir / "queue")
+            key = "da39a3ee5e6b4b0d3255bfef95601890afd80709"
+
+            self.assertTrue(queue.enqueue(key, {"lev": 5}, {"w-reduced.js": testcase}))
+            self.assertFalse(queue.enqueue(key, {"lev": 6}, {"w-reduced.js": testcase}))
+            self.assertEqual(queue.counts(), {"pending": 1, "running": 0, "done": 0})
+            testcase.write_text("x();\n")
+            self.assertTrue(queue.update_pending(key, {"w-reduced.js": testcase}))
+
+            claimed_key, job_dir, job = queue.claim()
+            self.assertEqual((claimed_key, job), (key, {"lev": 5}))
+            self.assertEqual((job_dir / "w-reduced.js").read_text(), "x();\n")
+            self.assertIsNone(queue.claim())
+            self.assertFalse(queue.update_pending(key, {"w-reduced.js": testcase}))
+            self.assertEqual(queue.requeue_stale(), [])
+            self.assertFalse(queue.enqueue(key, {"lev": 5}, {"w-reduced.js": testcase}))
+
+            queue.finish(key, {"quality": 0})
+            self.assertEqual(queue.counts(), {"pending": 0, "running": 0, "done": 1})
+            self.assertFalse(queue.enqueue(key, {"lev": 5}, {"w-reduced.js": testcase}))
+
+    def test_requeue_stale(self):
+        """Test that jobs claimed by a reducer which is gone get claimed again."""
+        with tempfile.TemporaryDirectory(suffix="requeue_stale_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            queue = reduction_queue.ReductionQueue(tmp_dir / "queue")
+            queue.enqueue("abc", {}, {})
+            _, job_dir, _ = queue.claim()
+            gone = subprocess.Popen([sys.executable, "-c", "pass"])
+            gone.wait()
+            (job_dir / "reducer.pid").write_text(str(gone.pid))
+
+            self.assertEqual(queue.requeue_stale(), ["abc"])
+            self.assertEqual(queue.claim()[0], "abc")
+
+    def test_prune_done(self):
+        """Test that signatures can be queued again once their done job is old enough to be removed."""
+        with tempfile.TemporaryDirectory(suffix="prune_done_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            queue = reduction_queue.ReductionQueue(tmp_dir / "queue")
+            queue.enqueue("abc", {}, {})
+            queue.claim()
+            queue.finish("abc", {"error": "Traceback"})
+
+            self.assertEqual(queue.prune_done(), [])
+            self.assertFalse(queue.enqueue("abc", {}, {}))
+            self.assertEqual(queue.prune_done(max_age=-1), ["abc"])
+            self.assertTrue(queue.enqueue("abc", {}, {}))
@@ -0,0 +1,56 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the result_cache.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import logging
+import sys
+import unittest
+
+from funfuzz.util import result_cache
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class ResultCacheTests(unittest.TestCase):
+    """"TestCase class for functions in result_cache.py"""
+    def test_cached_result(self):
+        """Test that testcases are only tested once per contents and scope, unless the result cannot be remembered."""
+        with tempfile.TemporaryDirectory(suffix="result_cache_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            runs = []
+            old_stats = result_cache.stats()
+
+            def test(cacheable=True):
+                runs.append(1)
+                return True, cacheable
+
+            (tmp_dir / "a.js").write_text("print(1);\n")
+            (tmp_dir / "b.js").write_text("print(1);\n")
+            self.assertTrue(result_cache.cached_result(("shell", 1), tmp_dir / "a.js", test))
+            self.assertTrue(result_cache.cached_result(("shell", 1), tmp_dir / "b.js", test))
+            self.assertEqual(len(runs), 1)
+
+            self.assertTrue(result_cache.cached_result(("shell", 2), tmp_dir / "a.js", test))
+            self.assertEqual(len(runs), 2)
+
+            (tmp_dir / "a.js").write_text("print(2);\n")
+            for _ in range(2):
+                result_cache.cached_result(("shell", 1), tmp_dir / "a.js", lambda: test(cacheable=False))
+            self.assertEqual(len(runs), 4)
+            self.assertEqual(result_cache.stats(), {"hits": old_stats["hits"] + 1,
+                                                    "misses": old_stats["misses"] + 4})
@@ -0,0 +1,68 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the run_metrics.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import json
+import logging
+import sys
+import unittest
+
+from funfuzz.util import run_metrics
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+    from urllib2 import urlopen  # pylint: disable=import-error
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+    from urllib.request import urlopen  # pylint: disable=import-error,no-name-in-module
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class RunMetricsTests(unittest.TestCase):
+    """"TestCase class for functions in run_metrics.py"""
+    def test_run_metrics(self):
+        """Test that runs are summarized, written as JSON lines and served over HTTP."""
+        with tempfile.TemporaryDirectory(suffix="run_metrics_test") as tmp_dir:
+            metrics_file = Path(tmp_dir) / "metrics.jsonl"
+            metrics = run_metrics.RunMetrics(metrics_file)
+            for i in range(10):
+                metrics.record_run(float(i), 5 if i == 9 else 0, i == 8, False, i == 9, ["--fuzzing-safe"])
+            metrics.record_queued(2)
+            metrics.record_reduction(30.0, 1)
+            metrics.maybe_write_summary(force=True)
+
+            snapshot = metrics.snapshot()
+            self.assertEqual(snapshot["runs"], 10)
+            self.assertEqual(snapshot["elapsed_mean"], 4.5)
+            self.assertEqual(snapshot["elapsed_p50"], 5.0)
+            self.assertEqual(snapshot["elapsed_p99"], 9.0)
+            self.assertEqual(snapshot["timeout_rate"], 0.1)
+            self.assertEqual(snapshot["crash_rate"], 0.1)
+            self.assertEqual(snapshot["queued"], 1)
+            self.assertEqual(snapshot["reductions"], 1)
+            self.assertEqual(snapshot["reduction_seconds"], 30.0)
+            self.assertEqual(snapshot["reduction_queue_depth"], 1)
+            self.assertEqual(snapshot["flags"]["--fuzzing-safe"]["runs"], 10)
+
+            with metrics_file.open("r") as f:
+                events = [json.loads(line)["event"] for line in f]
+            self.assertEqual(events, ["run"] * 10 + ["queued", "reduction", "summary"])
+
+            server = metrics.serve(0)
+            try:
+                response = urlopen("http://127.0.0.1:%d/" % server.server_address[1], timeout=10)
+                self.assertEqual(json.loads(response.read().decode("utf-8"))["runs"], 10)
+            finally:
+                server.shutdown()
+                server.server_close()
@@ -0,0 +1,84 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the signature_index.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+from builtins import object
+import logging
+import multiprocessing
+import sys
+import unittest
+
+from funfuzz.util import signature_index
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class NoSignatureCrashInfo(object):  # pylint: disable=too-few-public-methods
+    """Stands in for a CrashInfo with too little data for a crash signature."""
+    def createCrashSignature(self):  # pylint: disable=invalid-name,no-self-use
+        """Fail like FuzzManager does."""
+        raise RuntimeError("Insufficient data to generate crash signature")
+
+
+def record_many(index_dir, testcase):
+    """Record 25 occurrences of the same signature."""
+    index = signature_index.SignatureIndex(index_dir)
+    for _ in range(25):
+        index.record("abc", testcase)
+
+
+class SignatureIndexTests(unittest.TestCase):
+    """"TestCase class for functions in signature_index.py"""
+    def test_signature_key(self):
+        """Test that results without a crash signature are told apart by their issues."""
+        key = signature_index.signature_key(NoSignatureCrashInfo(), ["jsfunfuzz didn't finish"])
+        self.assertEqual(key, signature_index.signature_key(NoSignatureCrashInfo(), ["jsfunfuzz didn't finish"]))
+        self.assertNotEqual(key, signature_index.signature_key(NoSignatureCrashInfo(), ["Found a bug"]))
+
+    def test_record(self):
+        """Test that occurrences are counted, and that the first and the shortest testcases are known."""
+        with tempfile.TemporaryDirectory(suffix="signature_index_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            index = signature_index.SignatureIndex(tmp_dir / "index")
+            testcases = [tmp_dir / ("w%d-reduced.js" % i) for i in range(3)]
+            for testcase, contents in zip(testcases, ["x();\n" * 3, "x();\n", "x();\n" * 2]):
+                testcase.write_text(contents)
+
+            self.assertIsNone(index.lookup("abc"))
+            first = index.record("abc", testcases[0])
+            self.assertEqual((first.count, first.first_testcase), (1, str(testcases[0])))
+            index.record("abc", testcases[1])
+            last = index.record("abc", testcases[2])
+            self.assertEqual(last.count, 3)
+            self.assertEqual(last.first_testcase, str(testcases[0]))
+            self.assertEqual((last.shortest_testcase, last.shortest_size), (str(testcases[1]), 5))
+            self.assertIsNone(index.lookup("def"))
+
+    def test_concurrent_record(self):
+        """Test that no occurrence gets lost when several processes record at the same time."""
+        with tempfile.TemporaryDirectory(suffix="concurrent_record_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            testcase = tmp_dir / "w1-reduced.js"
+            testcase.write_text("x();\n")
+            processes = [multiprocessing.Process(target=record_many, args=(tmp_dir / "index", testcase))
+                         for _ in range(4)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            self.assertEqual(signature_index.SignatureIndex(tmp_dir / "index").lookup("abc").count, 100)
@@ -0,0 +1,53 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the spooled_run.py file."""
+
+from __future__ import absolute_import, unicode_literals  # isort:skip
+
+import logging
+import sys
+import unittest
+
+import lithium.interestingness.timed_run as timed_run
+
+from funfuzz.util import spooled_run
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+class SpooledRunTests(unittest.TestCase):
+    """"TestCase class for functions in spooled_run.py"""
+    def test_timed_run(self):
+        """Test that output is captured in memory and only written out on request."""
+        with tempfile.TemporaryDirectory(suffix="spooled_run_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            command = [sys.executable, "-c",
+                       "import sys; print('out\\n' * 100000); sys.stderr.write('err\\n'); sys.exit(3)"]
+
+            runinfo = spooled_run.timed_run(command, 60, str(tmp_dir / "w1"))
+
+            self.assertEqual(runinfo.sta, timed_run.ABNORMAL)
+            self.assertEqual(runinfo.return_code, 3)
+            self.assertEqual(list(spooled_run.spool_lines(runinfo.err)), ["err\n"])
+            self.assertFalse(list(tmp_dir.iterdir()))
+            spooled_run.save_spool(runinfo.out, tmp_dir / "w1-out.txt")
+            self.assertEqual((tmp_dir / "w1-out.txt").read_text().count("out\n"), 100000)
+
+    def test_timed_run_timeout(self):
+        """Test that processes running for too long are killed."""
+        runinfo = spooled_run.timed_run([sys.executable, "-c", "import time; time.sleep(60)"], 1, "w1")
+        self.assertEqual(runinfo.sta, timed_run.TIMED_OUT)
+        self.assertTrue(runinfo.killed)
@@ -0,0 +1,155 @@
+# coding=utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Test the worker_pool.py file."""
+
+from __future__ import absolute_import, print_function, unicode_literals  # isort:skip
+
+import logging
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+from _pytest.monkeypatch import MonkeyPatch
+
+from funfuzz.util import worker_pool
+
+if sys.version_info.major == 2:
+    import backports.tempfile as tempfile  # pylint: disable=import-error,no-name-in-module
+    from pathlib2 import Path
+else:
+    from pathlib import Path  # pylint: disable=import-error
+    import tempfile
+
+FUNFUZZ_TEST_LOG = logging.getLogger("funfuzz_test")
+logging.basicConfig(level=logging.DEBUG)
+logging.getLogger("flake8").setLevel(logging.WARNING)
+
+
+def crash_once(tmp_dir, i):
+    """Crash on the first run of each worker, and leave a file behind on the second one."""
+    first_run = Path(tmp_dir) / ("first-run-%d" % i)
+    if not first_run.exists():
+        first_run.touch()
+        raise RuntimeError("Worker %d crashed" % i)
+    print("Worker %d is fine" % i)
+    (Path(tmp_dir) / ("done-%d" % i)).touch()
+
+
+def sleep_a_while(tmp_dir, i):
+    """Outlive a few polls of the pool, and write down when this worker ran."""
+    start_time = time.time()
+    time.sleep(0.5)
+    (Path(tmp_dir) / ("ran-%d" % i)).write_text("%r %r" % (start_time, time.time()))
+
+
+def crash_later(_tmp_dir, i):
+    """Crash after outliving a few polls of the pool."""
+    time.sleep(0.3)
+    raise RuntimeError("Worker %d crashed" % i)
+
+
+def run_sleeping_child(tmp_dir, _i):
+    """Run a long child process, writing down its pid, and wait for it."""
+    child = subprocess.Popen(["sleep", "60"])
+    (Path(tmp_dir) / "child.pid").write_text(str(child.pid))
+    child.wait()
+
+
+def run_big_child(_tmp_dir, _i):
+    """Run a child process which touches 200 MB of memory, then let the pool take a sample."""
+    subprocess.check_call([sys.executable, "-c", "x = bytearray(200 * 2**20)"])
+    time.sleep(0.5)
+
+
+class WorkerPoolTests(unittest.TestCase):
+    """"TestCase class for functions in worker_pool.py"""
+    monkeypatch = MonkeyPatch()
+
+    def test_restart_crashed_workers(self):
+        """Test that crashed workers are restarted, and that workers exiting normally are not."""
+        with tempfile.TemporaryDirectory(suffix="restart_crashed_workers_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            WorkerPoolTests.monkeypatch.setattr(worker_pool, "available_memory", lambda: None)
+            pool = worker_pool.WorkerPool(tmp_dir, crash_once, (str(tmp_dir),), 3, 2**30, poll_interval=0.1)
+            stats = pool.run(time.time() + 60)
+
+            self.assertEqual([(x.starts, x.crashes, x.finished) for x in stats], [(2, 1, True)] * 3)
+            self.assertTrue(all((tmp_dir / ("done-%d" % i)).is_file() for i in range(3)))
+            self.assertIn("RuntimeError: Worker 1 crashed", worker_pool.log_name(tmp_dir, 1, "err").read_text())
+            self.assertEqual(worker_pool.log_name(tmp_dir, 1, "out").read_text(), "Worker 1 is fine\n")
+            self.assertIn("Total: 3 crashes", pool.summary())
+        WorkerPoolTests.monkeypatch.undo()
+
+    def test_memory_limited_workers(self):
+        """Test that no more workers run at once than the available memory can hold."""
+        with tempfile.TemporaryDirectory(suffix="memory_limited_workers_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            pool = worker_pool.WorkerPool(tmp_dir, sleep_a_while, (str(tmp_dir),), 4, 2**29, poll_interval=0.1)
+            # 1.25 GB of memory, of which each running worker takes 512 MB
+            WorkerPoolTests.monkeypatch.setattr(pool, "worker_memory", lambda: 2**29)
+            running = lambda: len(pool._processes)  # noqa pylint: disable=protected-access
+            WorkerPoolTests.monkeypatch.setattr(worker_pool, "available_memory", lambda: 5 * 2**28 - running() * 2**29)
+            self.assertEqual(pool.wanted_workers(), 2)
+            stats = pool.run(time.time() + 60)
+
+            self.assertTrue(all(x.finished and x.starts == 1 for x in stats))
+            runs = [[float(x) for x in (tmp_dir / ("ran-%d" % i)).read_text().split()] for i in range(4)]
+            for start_time, _ in runs:
+                self.assertLessEqual(len([run for run in runs if run[0] <= start_time < run[1]]), 2)
+        WorkerPoolTests.monkeypatch.undo()
+
+    def test_crashing_workers_stop(self):
+        """Test that workers crashing in a row are given up on, even when they outlive a few polls each time."""
+        with tempfile.TemporaryDirectory(suffix="crashing_workers_stop_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            WorkerPoolTests.monkeypatch.setattr(worker_pool, "available_memory", lambda: None)
+            pool = worker_pool.WorkerPool(tmp_dir, crash_later, (str(tmp_dir),), 1, 2**30, poll_interval=0.1)
+            stats = pool.run(time.time() + 60)
+
+            self.assertEqual((stats[0].starts, stats[0].crashes), (worker_pool.MAX_CONSECUTIVE_CRASHES,) * 2)
+        WorkerPoolTests.monkeypatch.undo()
+
+    @unittest.skipIf(not Path("/proc").is_dir(), "Requires process groups and /proc")
+    def test_stop_worker_children(self):
+        """Test that stopping a worker also stops the processes it runs."""
+        with tempfile.TemporaryDirectory(suffix="stop_worker_children_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            pool = worker_pool.WorkerPool(tmp_dir, run_sleeping_child, (str(tmp_dir),), 1, 2**30, poll_interval=0.1)
+            pool._start(0)  # pylint: disable=protected-access
+            for _ in range(100):
+                if (tmp_dir / "child.pid").is_file() and (tmp_dir / "child.pid").read_text():
+                    break
+                time.sleep(0.1)
+            child_pid = int((tmp_dir / "child.pid").read_text())
+            pool._terminate(0)  # pylint: disable=protected-access
+            pool._reap(0)  # pylint: disable=protected-access
+
+            for _ in range(50):
+                status_file = Path("/proc/%d/status" % child_pid)
+                if not status_file.is_file() or "\nState:\tZ" in status_file.read_text():
+                    break
+                time.sleep(0.1)
+            else:
+                self.fail("The child process of the stopped worker is still running")
+
+    @unittest.skipIf(os.name != "posix", "Requires the resource module")
+    def test_worker_memory(self):
+        """Test that the memory needed per worker is measured, and capped by the limit on child processes."""
+        with tempfile.TemporaryDirectory(suffix="worker_memory_test") as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            WorkerPoolTests.monkeypatch.setattr(worker_pool, "available_memory", lambda: None)
+            pool = worker_pool.WorkerPool(tmp_dir, run_big_child, (str(tmp_dir),), 1, 2**40, poll_interval=0.1)
+            self.assertEqual(pool.worker_memory(), 2**40)
+            pool.run(time.time() + 60)
+
+            self.assertGreater(pool.worker_memory(), 200 * 2**20 * worker_pool.PEAK_RSS_HEADROOM)
+            self.assertLess(pool.worker_memory(), 2**40)
+            pool.child_memory_limit = 2**20
+            self.assertLess(pool.worker_memory(), 200 * 2**20)
+        WorkerPoolTests.monkeypatch.undo()